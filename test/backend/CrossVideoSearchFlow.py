@@ -0,0 +1,131 @@
+from typing import Optional, Any, Dict, List
+from .base_flow import BaseFlow, FlowError, validate_file_exists
+from .event_schemas import (
+    CrossSearchStartEvent, CrossSearchVideoEvent, CrossSearchQueryEvent, CrossSearchEndEvent,
+)
+from .IndexFlow import IndexFlow
+from .VectorSearchFlow import VectorSearchFlow, QUERY_CACHE_DIR
+
+
+class CrossVideoSearchFlow(BaseFlow):
+    """
+    Searches a batch of screenshots against every indexed video in a single
+    run (see cross_video_search), for screenshots whose video is unknown.
+    Results are a global top-k per screenshot, each hit tagged with its video.
+    """
+    completion_event = "cross_search_end"
+    event_handlers = {
+        "cross_search_start": "_on_search_start",
+        "cross_search_video": "_on_video_searched",
+        "cross_search_query": "_on_query_results",
+        "cross_search_end": "_on_search_end",
+    }
+    resource_profile = {"cpu_fraction": 0.5, "nice": 5}
+
+    def __init__(self):
+        super().__init__("CrossVideoSearchFlow", timeout=900.0)
+
+        # Cross-video search specific state
+        self.img_srcs: Optional[List[str]] = None
+        self.videos: Dict[str, Dict[str, Any]] = {}
+        self.results: List[Dict[str, Any]] = []
+        self.metadata: Optional[Dict[str, Any]] = None
+
+    def start_search(self, img_srcs: List[str], videos: Optional[List[str]] = None, k: Optional[int] = None):
+        """Search the images against the given videos, or every indexed video."""
+        self.img_srcs = img_srcs
+        self.start(img_srcs, videos, k)
+
+    def _restore_inputs(self, img_srcs: List[str], videos: Optional[List[str]] = None, k: Optional[int] = None) -> None:
+        self.img_srcs = img_srcs
+
+    def _reset_state(self) -> None:
+        super()._reset_state()
+        self.videos = {}
+        self.results = []
+        self.metadata = None
+
+    def _select_indexes(self, videos: Optional[List[str]]) -> Dict[str, str]:
+        indexed = IndexFlow.indexed_videos()
+        if videos is not None:
+            missing = [video for video in videos if video not in indexed]
+            if missing:
+                raise FlowError(f"No embedding index for: {', '.join(missing)}")
+            indexed = {video: indexed[video] for video in videos}
+        return {video: str(index_dir) for video, index_dir in indexed.items()}
+
+    def _validate_inputs(self, img_srcs: List[str], videos: Optional[List[str]] = None, k: Optional[int] = None) -> None:
+        """Validate cross-video search inputs."""
+        if not img_srcs or not isinstance(img_srcs, list):
+            raise FlowError("Image sources list is required")
+        for img_src in img_srcs:
+            validate_file_exists(img_src, "Image file")
+        if k is not None and k < 1:
+            raise FlowError("k must be positive")
+        if not self._select_indexes(videos):
+            raise FlowError("No indexed videos to search")
+
+    def _build_command(self, img_srcs: List[str], videos: Optional[List[str]] = None, k: Optional[int] = None) -> List[str]:
+        """Build the cross-video search command."""
+        index_args = []
+        for video, index_dir in self._select_indexes(videos).items():
+            index_args += ["--index", f"{video}={index_dir}"]
+        k_args = ["--k", str(k)] if k else []
+        return [
+            "python", "-m", "demo.backend.cross_video_search",
+            "--images", *img_srcs,
+        ] + index_args + k_args + [
+            "--query-cache", str(QUERY_CACHE_DIR),
+            "--",
+        ] + VectorSearchFlow.query_command()
+
+    def _on_search_start(self, event: CrossSearchStartEvent) -> None:
+        with self._lock:
+            self.start_time = event.get("start_time")
+            self.videos = {video: {} for video in event.get("videos", [])}
+
+    def _on_video_searched(self, event: CrossSearchVideoEvent) -> None:
+        with self._lock:
+            self.videos[event["video_id"]] = {key: value for key, value in event.items() if key not in ("type", "video_id")}
+
+    def _on_query_results(self, event: CrossSearchQueryEvent) -> None:
+        with self._lock:
+            self.results.append({key: value for key, value in event.items() if key != "type"})
+
+    def _on_search_end(self, event: CrossSearchEndEvent) -> None:
+        with self._lock:
+            self.end_time = event.get("end_time")
+            self.metadata = {key: value for key, value in event.items() if key != "type"}
+
+    def get_results(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.results)
+
+    def _build_result_payload(self) -> Optional[Dict[str, Any]]:
+        if not self.results:
+            return None
+        return {
+            "result": "ok",
+            "finished": True,
+            "error": None,
+            "videos": dict(self.videos),
+            "data": self.get_results(),
+            "metadata": self._with_resources(self.metadata),
+        }
+
+    def _get_status_fields(self) -> Dict[str, Any]:
+        return {
+            "videos": dict(self.videos),
+            "results": self.get_results(),
+            "metadata": self.metadata,
+        }
+
+    def reset(self) -> None:
+        """Reset cross-video search specific state and call parent reset."""
+        with self._lock:
+            self.img_srcs = None
+            self.videos = {}
+            self.results = []
+            self.metadata = None
+
+        super().reset()
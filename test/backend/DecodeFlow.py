@@ -1,11 +1,52 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
 from typing import Optional, Any, Dict, List
 from .base_flow import BaseFlow, FlowError, validate_file_exists
+from .event_schemas import DecodeStartEvent, DecodeEvent, DecodeEndEvent
+from .decoded_quality import DecodedQualityMonitor
+from .process_tree import process_start_time, is_same_process
 from demo.backend import MAPPINGS
 
 
+MANIFEST_NAME = "decode_manifest.json"
+LOG_NAME = "decode.log"
+PLAYLISTS = {"TreeA": "TreeA_output.m3u8", "TreeB": "TreeB_output.m3u8"}
+
+DECODE_TIMEOUT_S = 600.0
+# A streaming decode lasts as long as the encode it follows
+STREAMING_DECODE_TIMEOUT_S = 2400.0
+
+
+def _file_fingerprint(path: str) -> List[Any]:
+    """Identify a file by path, size and modification time."""
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+
+def _playlist_complete(path: Path) -> bool:
+    """Check that an HLS playlist exists and ends with #EXT-X-ENDLIST."""
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return False
+    return bool(lines) and lines[-1].strip() == "#EXT-X-ENDLIST"
+
+
 class DecodeFlow(BaseFlow):
+    completion_event = "decode_end"
+    event_handlers = {
+        "decode_start": "_on_decode_start",
+        "decode": "_on_decode",
+        "decode_end": "_on_decode_end",
+    }
+    # Playback waits on the decoder, so it keeps the default priority
+    resource_profile = {"cpu_fraction": 0.5}
+
     def __init__(self):
-        super().__init__("DecodeFlow", timeout=600.0)  # 10 minute timeout for decode
+        super().__init__("DecodeFlow", timeout=DECODE_TIMEOUT_S)  # 10 minute timeout for decode
         
         # Decode-specific state
         self.metadata: Optional[Dict[str, Any]] = None
@@ -13,12 +54,187 @@ class DecodeFlow(BaseFlow):
         self.total_batches: Optional[int] = None
         self._progress_log: List[Dict[str, float]] = []
         self.uploaded_filename: Optional[str] = None
+        self._manifest: Optional[Dict[str, Any]] = None
+        # Quality of the decoded segments against the source, measured while decoding
+        self.decoded_quality: Optional[Dict[str, Any]] = None
+        self._quality_monitor: Optional[DecodedQualityMonitor] = None
         
-    def start_decode(self, filename: str = ""):
-        """Start the decode process for the given filename."""
+    def start_decode(self, filename: str = "", stream_from: Optional[str] = None):
+        """
+        Start the decode process for the given filename, unless a matching
+        decode already finished on disk or is still running from an earlier
+        server process. With stream_from the decoder follows a handoff file
+        and decodes batches while the encoder is still producing them.
+        """
         self.uploaded_filename = filename
-        self.start(filename)
-    def _validate_inputs(self, filename: str) -> None:
+        if self.try_reattach(filename):
+            return
+        self.timeout = STREAMING_DECODE_TIMEOUT_S if stream_from else DECODE_TIMEOUT_S
+        self.start(filename, stream_from)
+
+    def try_reattach(self, filename: str) -> bool:
+        """
+        Reuse decode artifacts described by a matching manifest. A complete
+        decode finishes the flow immediately with its cached decode_end
+        metadata; a decoder still running is adopted through its PID and log.
+        Returns False if a new decode is needed.
+        """
+        with self._lock:
+            if self._started and not self._finished:
+                return False
+
+        manifest = self._load_manifest(filename)
+        if not manifest:
+            return False
+
+        if manifest["status"] == "complete":
+            decoded_dir = self._get_output_dir(filename) / "decoded"
+            if not all(_playlist_complete(decoded_dir / name) for name in PLAYLISTS.values()):
+                return False
+            self._finish_from_manifest(manifest)
+            return True
+
+        # A PID alone may have been reused by an unrelated process since
+        if manifest["status"] == "running" and is_same_process(manifest.get("pid"), manifest.get("process_started_at")):
+            self.uploaded_filename = filename
+            self._manifest = manifest
+            self.adopt(
+                manifest["pid"], Path(manifest["log_path"]), manifest.get("started_at"), manifest["process_started_at"]
+            )
+            return True
+
+        return False
+
+    def adopt(self, pid: int, log_path: Path, started_at: Optional[float] = None,
+              process_started_at: Optional[float] = None) -> None:
+        super().adopt(pid, log_path, started_at, process_started_at)
+        self._start_quality_monitor(self.uploaded_filename)
+
+    def _reset_state(self) -> None:
+        super()._reset_state()
+        self.decoded_quality = None
+
+    def _get_output_dir(self, filename: str) -> Path:
+        return Path(f"./demo/backend/data/{filename}")
+
+    def _get_output_log_path(self, filename: str, stream_from: Optional[str] = None) -> Optional[Path]:
+        return self._get_output_dir(filename) / LOG_NAME
+
+    def _get_fingerprint(self, filename: str) -> Optional[str]:
+        """Fingerprint of everything that determines the decode output."""
+        mapping = MAPPINGS.get_video_model_paths(filename)
+        if not mapping:
+            return None
+        try:
+            parts = {
+                "command": self._build_command(filename),
+                "checkpoint": _file_fingerprint(mapping["model_path"]),
+                "source": _file_fingerprint(mapping["raw_path"]),
+            }
+        except OSError:
+            return None
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def _load_manifest(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Load the decode manifest if it matches the current checkpoint and source."""
+        path = self._get_output_dir(filename) / MANIFEST_NAME
+        try:
+            manifest = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        fingerprint = self._get_fingerprint(filename)
+        if not fingerprint or manifest.get("fingerprint") != fingerprint:
+            return None
+        return manifest
+
+    def _write_manifest(self, **fields) -> None:
+        """Update and atomically rewrite the manifest of the current decode."""
+        if not self._manifest:
+            return
+        self._manifest.update(fields)
+        path = self._get_output_dir(self._manifest["filename"]) / MANIFEST_NAME
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(self._manifest))
+            tmp_path.replace(path)
+        except OSError as e:
+            self.logger.warning(f"Could not write decode manifest {path}: {e}")
+
+    def _on_process_started(self, pid: int, log_path: Optional[Path]) -> None:
+        """Record the running decoder so a later server process can adopt it."""
+        filename = self.uploaded_filename
+        self._manifest = {
+            "filename": filename,
+            "fingerprint": self._get_fingerprint(filename),
+            "status": "running",
+            "pid": pid,
+            "process_started_at": process_start_time(pid),
+            "log_path": str(log_path),
+            "started_at": time.time(),
+        }
+        self._write_manifest()
+        self._start_quality_monitor(filename)
+
+    def _start_quality_monitor(self, filename: str) -> None:
+        """Measure decoded segments against the source while the decoder writes them."""
+        mapping = MAPPINGS.get_video_model_paths(filename) if filename else None
+        if not mapping:
+            return
+        self._stop_quality_monitor()
+        monitor = DecodedQualityMonitor(
+            self._get_output_dir(filename) / "decoded",
+            mapping["raw_path"],
+            PLAYLISTS,
+            on_update=lambda summary: self._on_quality_update(monitor, summary),
+            is_active=self.is_running,
+        )
+        with self._lock:
+            self._quality_monitor = monitor
+        monitor.start()
+
+    def _stop_quality_monitor(self) -> None:
+        with self._lock:
+            monitor, self._quality_monitor = self._quality_monitor, None
+        if monitor:
+            monitor.stop()
+
+    def _on_quality_update(self, monitor: DecodedQualityMonitor, summary: Dict[str, Any]) -> None:
+        with self._lock:
+            if monitor is not self._quality_monitor:
+                return
+            self.decoded_quality = summary
+            final = summary["complete"] and self.metadata is not None
+            if final:
+                self.metadata = {**self.metadata, "decoded_quality": summary}
+            finished = self._finished and not self._error
+        if final:
+            self._write_manifest(metadata=self.metadata)
+            # The last segments can be measured after the process exits
+            if finished:
+                self._freeze_result()
+        self._mark_changed()
+
+    def _finish_from_manifest(self, manifest: Dict[str, Any]) -> None:
+        """Mark the flow finished from a complete decode on disk."""
+        with self._lock:
+            self._reset_state()
+            self._started = True
+            self._finished = True
+            self.metadata = manifest.get("metadata")
+            self.start_time = manifest.get("start_time")
+            self.end_time = (self.metadata or {}).get("end_time")
+            self.total_batches = manifest.get("total_batches")
+            self.decoded_quality = (self.metadata or {}).get("decoded_quality")
+            if self.total_batches:
+                self.tree_batch_index = {"TreeA": self.total_batches, "TreeB": self.total_batches}
+        self.logger.info(f"{self.name} reused complete decode of {manifest.get('filename')}")
+        self._freeze_result()
+        self._mark_changed()
+
+    def _restore_inputs(self, filename: str, stream_from: Optional[str] = None) -> None:
+        self.uploaded_filename = filename
+
+    def _validate_inputs(self, filename: str, stream_from: Optional[str] = None) -> None:
         """Validate decode inputs."""
         if not filename:
             raise FlowError("Filename is required for decode")
@@ -31,10 +247,11 @@ class DecodeFlow(BaseFlow):
         validate_file_exists(mapping["model_path"], "Checkpoint file")
         validate_file_exists(mapping["raw_path"], "Raw video file")
 
-    def _build_command(self, filename: str) -> List[str]:
+    def _build_command(self, filename: str, stream_from: Optional[str] = None) -> List[str]:
         """Build the decode command."""
         mapping = MAPPINGS.get_video_model_paths(filename)
-        output_dir = f"./demo/backend/data/{filename}"
+        output_dir = str(self._get_output_dir(filename))
+        stream_args = ["--stream-from", stream_from] if stream_from else []
 
         return [
             "python",
@@ -47,35 +264,43 @@ class DecodeFlow(BaseFlow):
             "--batch-size", "4",
             "--video-quality", "high",
             "--flow", "decode",
-        ]
+        ] + stream_args
 
-    def _process_log_line(self, log_obj: Dict[str, Any]) -> None:
-        """Process decode-specific log lines."""
-        log_type = log_obj.get("type")
-        
-        if log_type == "decode_start":
-            with self._lock:
-                self.start_time = log_obj.get("start_time")
-
-        elif log_type == "decode":
-            tree = log_obj.get("tree_name")
-            batch_index = int(log_obj.get("batch_index", 0))
-            total_batches = int(log_obj.get("total_batches", 0))
-            timestamp = float(log_obj.get("time"))
-
-            with self._lock:
-                if tree in self.tree_batch_index:
-                    self.tree_batch_index[tree] = batch_index
-                self.total_batches = total_batches
-                self._progress_log.append({
-                    "time": timestamp,
-                    "batch_sum": self.tree_batch_index["TreeA"] + self.tree_batch_index["TreeB"],
-                })
-
-        elif log_type == "decode_end":
-            with self._lock:
-                self.end_time = log_obj.get("end_time")
-                self.metadata = log_obj.copy()
+    def _on_decode_start(self, event: DecodeStartEvent) -> None:
+        with self._lock:
+            self.start_time = event.get("start_time")
+
+    def _on_decode(self, event: DecodeEvent) -> None:
+        tree = event.get("tree_name")
+        batch_index = int(event.get("batch_index", 0))
+        total_batches = int(event.get("total_batches", 0))
+        timestamp = float(event.get("time"))
+
+        with self._lock:
+            if tree in self.tree_batch_index:
+                self.tree_batch_index[tree] = batch_index
+            self.total_batches = total_batches
+            self._progress_log.append({
+                "time": timestamp,
+                "batch_sum": self.tree_batch_index["TreeA"] + self.tree_batch_index["TreeB"],
+            })
+
+    def _on_decode_end(self, event: DecodeEndEvent) -> None:
+        with self._lock:
+            self.end_time = event.get("end_time")
+            self.metadata = dict(event)
+            if self.decoded_quality and self.decoded_quality["complete"]:
+                self.metadata["decoded_quality"] = self.decoded_quality
+            monitor = self._quality_monitor
+        if monitor:
+            monitor.notify()
+        self._write_manifest(
+            status="complete",
+            pid=None,
+            metadata=self.metadata,
+            start_time=self.start_time,
+            total_batches=self.total_batches,
+        )
 
     # Backward compatibility methods
     def is_decode_started(self) -> bool:
@@ -124,10 +349,26 @@ class DecodeFlow(BaseFlow):
             eta_seconds = remaining_batches * avg_time_per_batch
             return round(eta_seconds, 1)
 
+    def get_decoded_batches(self) -> int:
+        """Number of batches decoded by both trees."""
+        with self._lock:
+            return min(self.tree_batch_index.values())
+
     def get_metadata(self) -> Optional[Dict[str, Any]]:
         with self._lock:
             return self.metadata
 
+    def _build_result_payload(self) -> Optional[Dict[str, Any]]:
+        return {"result": self._with_resources(self.metadata)}
+
+    def _get_status_fields(self) -> Dict[str, Any]:
+        return {
+            "progress": self.get_decode_progress(),
+            "eta": self.get_decode_eta_seconds(),
+            "metadata": self.metadata,
+            "decoded_quality": self.decoded_quality,
+        }
+
     def reset(self) -> None:
         """Reset decode-specific state and call parent reset."""
         with self._lock:
@@ -136,5 +377,8 @@ class DecodeFlow(BaseFlow):
             self.total_batches = None
             self._progress_log.clear()
             self.uploaded_filename = None
+            self._manifest = None
+            self.decoded_quality = None
+        self._stop_quality_monitor()
         
         super().reset()
\ No newline at end of file
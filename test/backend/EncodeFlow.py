@@ -1,9 +1,18 @@
 from typing import Optional, Any, Dict, List
 from .base_flow import BaseFlow, FlowError, validate_file_exists
+from .event_schemas import EncodeStartEvent, EncodeBatchEvent, EncodeEndEvent
 from demo.backend import MAPPINGS
 
 
 class EncodeFlow(BaseFlow):
+    completion_event = "encode_end"
+    event_handlers = {
+        "encode_start": "_on_encode_start",
+        "encode_batch": "_on_encode_batch",
+        "encode_end": "_on_encode_end",
+    }
+    resource_profile = {"cpu_fraction": 0.5}
+
     def __init__(self):
         super().__init__("EncodeFlow", timeout=1800.0)  # 30 minute timeout for encode
         
@@ -11,12 +20,22 @@ class EncodeFlow(BaseFlow):
         self.metadata: Optional[Dict[str, Any]] = None
         self.uploaded_filename: Optional[str] = None
         self.analysis_result: Optional[Dict[str, Any]] = None
+        # Finished batches and streaming handoff state (see stream_handoff)
+        self.encoded_batches: List[Dict[str, Any]] = []
+        self.handoff: Optional[Dict[str, Any]] = None
 
     def start_encode(self, filename: str = ""):
         """Start the encode process for the given filename."""
         self.uploaded_filename = filename
         self.start(filename)
 
+    def _restore_inputs(self, filename: str) -> None:
+        self.uploaded_filename = filename
+
+    def _reset_state(self) -> None:
+        super()._reset_state()
+        self.encoded_batches = []
+
     def _validate_inputs(self, filename: str) -> None:
         """Validate encode inputs."""
         if not filename:
@@ -47,18 +66,19 @@ class EncodeFlow(BaseFlow):
             "--flow", "encode",
         ]
 
-    def _process_log_line(self, log_obj: Dict[str, Any]) -> None:
-        """Process encode-specific log lines."""
-        log_type = log_obj.get("type")
+    def _on_encode_start(self, event: EncodeStartEvent) -> None:
+        with self._lock:
+            self.start_time = event.get("start_time")
 
-        if log_type == "encode_start":
-            with self._lock:
-                self.start_time = log_obj.get("start_time")
+    def _on_encode_batch(self, event: EncodeBatchEvent) -> None:
+        batch = {key: value for key, value in event.items() if key != "type"}
+        with self._lock:
+            self.encoded_batches.append(batch)
 
-        elif log_type == "encode_end":
-            with self._lock:
-                self.end_time = log_obj.get("end_time")
-                self.metadata = self._build_metadata()
+    def _on_encode_end(self, event: EncodeEndEvent) -> None:
+        with self._lock:
+            self.end_time = event.get("end_time")
+            self.metadata = self._build_metadata()
 
     # Backward compatibility methods
     def is_encode_started(self) -> bool:
@@ -86,12 +106,33 @@ class EncodeFlow(BaseFlow):
         with self._lock:
             return self.metadata
 
+    def get_encoded_batches(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.encoded_batches)
+
+    def set_handoff_status(self, handoff: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.handoff = handoff
+        self._mark_changed()
+
+    def _build_result_payload(self) -> Optional[Dict[str, Any]]:
+        return {"result": self._with_resources(self.metadata)}
+
+    def _get_status_fields(self) -> Dict[str, Any]:
+        return {
+            "metadata": self.metadata,
+            "encoded_batches": len(self.encoded_batches),
+            "handoff": self.handoff,
+        }
+
     def reset(self) -> None:
         """Reset encode-specific state and call parent reset."""
         with self._lock:
             self.metadata = None
             self.uploaded_filename = None
             self.analysis_result = None
+            self.encoded_batches = []
+            self.handoff = None
         
         super().reset()
 
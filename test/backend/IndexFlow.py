@@ -0,0 +1,157 @@
+from pathlib import Path
+from typing import Optional, Any, Dict, List
+from .base_flow import BaseFlow, FlowError, validate_file_exists
+from .embedding_index import META_NAME
+from .event_schemas import IndexStartEvent, IndexSegmentEvent, IndexEndEvent
+from .quantized_index import QUANTIZATION_METHODS
+from .VectorSearchFlow import VectorSearchFlow
+from demo.backend import MAPPINGS
+
+
+# The indexer follows a decode, so it may run as long as a streaming decode
+INDEX_TIMEOUT_S = 2400.0
+# Sharded preprocessing spreads over every core it is given, at low priority
+SHARDED_RESOURCE_PROFILE = {"cpu_fraction": 1.0, "nice": 10}
+
+
+class IndexFlow(BaseFlow):
+    """
+    Builds a video's frame-embedding index ahead of a vector search, so the
+    search can start without a preprocessing pass. Either the indexer follows
+    a feed of decoded segments while the decode runs (see segment_index), or
+    the source is split into time ranges embedded in parallel (see
+    sharded_index).
+    """
+    completion_event = "index_end"
+    event_handlers = {
+        "index_start": "_on_index_start",
+        "index_segment": "_on_index_segment",
+        "index_end": "_on_index_end",
+    }
+    # Decoding comes first; indexing takes what is left
+    resource_profile = {"cpu_fraction": 0.25, "nice": 10}
+
+    def __init__(self):
+        super().__init__("IndexFlow", timeout=INDEX_TIMEOUT_S)
+
+        # Index-specific state
+        self.uploaded_filename: Optional[str] = None
+        self.indexed_segments = 0
+        self.processed_frames = 0
+        self.metadata: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def index_dir(filename: str) -> Path:
+        """Where the embedding index of a video is stored."""
+        return Path(f"./demo/backend/data/{filename}/embedding_index")
+
+    @classmethod
+    def indexed_videos(cls) -> Dict[str, Path]:
+        """Index directories of every video with a complete index, by filename."""
+        pattern = cls.index_dir("*") / META_NAME
+        return {meta_path.parent.parent.name: meta_path.parent for meta_path in sorted(Path().glob(str(pattern)))}
+
+    def start_index(self, filename: str, follow: str):
+        """Start indexing the segments listed in the feed file follow."""
+        self.uploaded_filename = filename
+        self.resource_profile = type(self).resource_profile
+        self.start(filename, follow)
+
+    def start_sharded(self, filename: str, shards: Optional[int] = None, adaptive: bool = False,
+                      quantize: Optional[str] = None):
+        """
+        Start indexing the source in parallel time-range shards. With adaptive
+        the frames are picked by content instead of at a fixed stride; with
+        quantize ("sq8" or "pq") the index also gets compact codes.
+        """
+        self.uploaded_filename = filename
+        self.resource_profile = SHARDED_RESOURCE_PROFILE
+        self.start(filename, None, shards, adaptive, quantize)
+
+    def _restore_inputs(self, filename: str, follow: Optional[str] = None, shards: Optional[int] = None,
+                        adaptive: bool = False, quantize: Optional[str] = None) -> None:
+        self.uploaded_filename = filename
+
+    def _reset_state(self) -> None:
+        super()._reset_state()
+        self.indexed_segments = 0
+        self.processed_frames = 0
+        self.metadata = None
+
+    def _validate_inputs(self, filename: str, follow: Optional[str] = None, shards: Optional[int] = None,
+                         adaptive: bool = False, quantize: Optional[str] = None) -> None:
+        """Validate index inputs."""
+        if not filename:
+            raise FlowError("Filename is required for indexing")
+
+        mapping = MAPPINGS.get_video_model_paths(filename)
+        if not mapping:
+            raise FlowError(f"No mapping found for filename: {filename}")
+
+        validate_file_exists(mapping["raw_path"], "Raw video file")
+        if follow:
+            validate_file_exists(follow, "Segment feed")
+        if shards is not None and shards < 1:
+            raise FlowError("Shard count must be positive")
+        if quantize and quantize not in QUANTIZATION_METHODS:
+            raise FlowError(f"Unknown quantization: {quantize}")
+
+    def _build_command(self, filename: str, follow: Optional[str] = None, shards: Optional[int] = None,
+                       adaptive: bool = False, quantize: Optional[str] = None) -> List[str]:
+        """Build the index command."""
+        mapping = MAPPINGS.get_video_model_paths(filename)
+        index_dir = str(self.index_dir(filename))
+        embed = VectorSearchFlow.index_command(mapping["raw_path"])
+        if follow:
+            return embed + ["--index", index_dir, "--follow", follow]
+        return self.sharded_command(mapping["raw_path"], index_dir, shards, adaptive, quantize)
+
+    @staticmethod
+    def sharded_command(raw_path: str, index_dir: str, shards: Optional[int] = None, adaptive: bool = False,
+                        quantize: Optional[str] = None) -> List[str]:
+        """Command that builds the index of a source in parallel time-range shards."""
+        shard_args = ["--shards", str(shards)] if shards else []
+        if adaptive:
+            shard_args.append("--adaptive")
+        if quantize:
+            shard_args += ["--quantize", quantize]
+        return [
+            "python", "-m", "demo.backend.sharded_index",
+            "--video", raw_path,
+            "--index", index_dir,
+        ] + shard_args + ["--"] + VectorSearchFlow.index_command(raw_path)
+
+    def _on_index_start(self, event: IndexStartEvent) -> None:
+        with self._lock:
+            self.start_time = event.get("start_time")
+
+    def _on_index_segment(self, event: IndexSegmentEvent) -> None:
+        with self._lock:
+            self.indexed_segments += 1
+            self.processed_frames += int(event.get("frames") or 0)
+
+    def _on_index_end(self, event: IndexEndEvent) -> None:
+        with self._lock:
+            self.end_time = event.get("end_time")
+            self.metadata = {key: value for key, value in event.items() if key != "type"}
+
+    def _build_result_payload(self) -> Optional[Dict[str, Any]]:
+        return {"result": self._with_resources(self.metadata)}
+
+    def _get_status_fields(self) -> Dict[str, Any]:
+        return {
+            "filename": self.uploaded_filename,
+            "indexed_segments": self.indexed_segments,
+            "processed_frames": self.processed_frames,
+            "metadata": self.metadata,
+        }
+
+    def reset(self) -> None:
+        """Reset index-specific state and call parent reset."""
+        with self._lock:
+            self.uploaded_filename = None
+            self.indexed_segments = 0
+            self.processed_frames = 0
+            self.metadata = None
+
+        super().reset()
@@ -4,14 +4,19 @@ Enhanced PSNR Calculator with robust error handling and input validation.
 Provides multi-codec video encoding and PSNR calculation with comprehensive error handling.
 """
 
+import bisect
 import subprocess
 import sys
 import shutil
 import re
+import json
 import logging
+import os
+import signal
+import threading
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -32,8 +37,91 @@ class EncoderNotFoundError(PSNRError):
 # INTERNAL HELPER FUNCTIONS
 # ==============================================================================
 
-def _run_ffmpeg_command(command: list, description: str) -> subprocess.CompletedProcess:
-    """A helper to run ffmpeg commands and handle errors."""
+class _CommandGroup:
+    """The ffmpeg processes of one process_video call, so it can stop them all."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.terminated = False
+
+    def add(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.add(process)
+            if not self.terminated:
+                return
+        # Started after terminate(); stop it as well
+        self._kill(process)
+
+    def discard(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    def terminate(self) -> None:
+        with self._lock:
+            self.terminated = True
+            processes = list(self._processes)
+        for process in processes:
+            self._kill(process)
+
+    @staticmethod
+    def _kill(process: subprocess.Popen) -> None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class _CallbackError(Exception):
+    """Carries an exception of process_video's progress callback past its error wrapping."""
+
+    def __init__(self, error: BaseException):
+        super().__init__(str(error))
+        self.error = error
+
+
+# The group of the process_video call the current worker thread encodes for
+_command_group = threading.local()
+
+
+def _run_in_group(group: _CommandGroup, fn: Callable, *args):
+    _command_group.current = group
+    try:
+        return fn(*args)
+    finally:
+        _command_group.current = None
+
+
+def _run_grouped(command: list, group: _CommandGroup, text: bool, timeout: float) -> subprocess.CompletedProcess:
+    """subprocess.run(check=True, capture_output=True) whose process terminate() can kill."""
+    if group.terminated:
+        raise PSNRError("Encoding was cancelled")
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=text,
+        encoding='utf-8' if text else None,
+        start_new_session=True,
+    )
+    group.add(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        group._kill(process)
+        process.communicate()
+        raise
+    finally:
+        group.discard(process)
+    if group.terminated:
+        raise PSNRError("Encoding was cancelled")
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _run_ffmpeg_command(command: list, description: str, text: bool = True) -> subprocess.CompletedProcess:
+    """A helper to run ffmpeg commands and handle errors. With text=False stdout is bytes."""
     logger.info(f"Starting: {description}")
     
     try:
@@ -45,18 +133,25 @@ def _run_ffmpeg_command(command: list, description: str) -> subprocess.Completed
         command_str = ' '.join(f'"{arg}"' if ' ' in arg else arg for arg in command)
         logger.debug(f"Executing: {command_str}")
         
-        process = subprocess.run(
-            command,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            timeout=300  # 5 minute timeout
-        )
+        group = getattr(_command_group, "current", None)
+        if group is not None:
+            process = _run_grouped(command, group, text, timeout=300)
+        else:
+            process = subprocess.run(
+                command,
+                check=True,
+                capture_output=True,
+                text=text,
+                encoding='utf-8' if text else None,
+                timeout=300  # 5 minute timeout
+            )
         
         logger.info(f"Completed: {description}")
         return process
         
+    except PSNRError:
+        raise
+
     except subprocess.TimeoutExpired as e:
         logger.error(f"Timeout during: {description}")
         raise PSNRError(f"Command timed out: {description}")
@@ -331,7 +426,12 @@ def _process_one_codec_adaptive(codec: str, input_path: Path, output_base_path:
 # PUBLIC API FUNCTION
 # ==============================================================================
 
-def process_video(video_path: str, output_base_path: Path, force_reencode: bool = False) -> Dict[str, Any]:
+def process_video(
+    video_path: str,
+    output_base_path: Path,
+    force_reencode: bool = False,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
     """
     Takes a video, encodes it to H.264, H.265, and AV1, calculates PSNR for each,
     and returns a dictionary with file paths and results.
@@ -344,6 +444,8 @@ def process_video(video_path: str, output_base_path: Path, force_reencode: bool
         force_reencode (bool): If True, forces re-encoding even if output files
                               already exist. If False (default), skips encoding
                               for existing valid files and only recalculates PSNR.
+        progress_callback (callable): Optional; called with
+                              {"completed", "total", "codec"} as each codec finishes.
 
     Returns:
         A dictionary containing the paths and PSNR values.
@@ -426,46 +528,68 @@ def process_video(video_path: str, output_base_path: Path, force_reencode: bool
                 }
             }
 
-    # If force_reencode is True, remove existing files first
-    if force_reencode:
-        print("🔄 Force re-encode mode: removing existing files...")
-        for codec in codecs_to_process:
-            output_file = _get_expected_output_path(codec, input_path, base_path)
-            if output_file.exists():
-                output_file.unlink()
-                print(f"🗑️  Removed: {output_file.name}")
-
-    results = {}
-
-    with ThreadPoolExecutor(max_workers=len(codecs_to_process)) as executor:
-        future_to_codec = {
-            executor.submit(_process_one_codec_adaptive, codec, input_path, base_path, available_encoders): codec
-            for codec in codecs_to_process
-        }
-        for future in future_to_codec:
-            codec = future_to_codec[future]
-            try:
-                results[codec] = future.result()
-            except Exception as exc:
-                print(f"❌ {codec} processing generated an exception: {exc}", file=sys.stderr)
-                results[codec] = {"path": "ERROR", "psnr": 0.0}
-
-    final_output = {
-        "base_file_path": str(input_path),
-        "output_base_path": str(base_path),
-        "codecs": {
-            "base": {
-                "path": str(input_path),
-                "psnr": -1  # Input file compared to itself = perfect match
-            },
-            "h264": results.get('h264', {"path": "SKIPPED", "psnr": 0.0}),
-            "h265": results.get('h265', {"path": "SKIPPED", "psnr": 0.0}),
-            "av1": results.get('av1', {"path": "SKIPPED", "psnr": 0.0}),
+        # If force_reencode is True, remove existing files first
+        if force_reencode:
+            print("🔄 Force re-encode mode: removing existing files...")
+            for codec in codecs_to_process:
+                output_file = _get_expected_output_path(codec, input_path, base_path)
+                if output_file.exists():
+                    output_file.unlink()
+                    print(f"🗑️  Removed: {output_file.name}")
+
+        results = {}
+
+        group = _CommandGroup()
+        executor = ThreadPoolExecutor(max_workers=len(codecs_to_process))
+        try:
+            future_to_codec = {
+                executor.submit(
+                    _run_in_group, group, _process_one_codec_adaptive, codec, input_path, base_path, available_encoders
+                ): codec
+                for codec in codecs_to_process
+            }
+            for future in as_completed(future_to_codec):
+                codec = future_to_codec[future]
+                try:
+                    results[codec] = future.result()
+                except Exception as exc:
+                    print(f"❌ {codec} processing generated an exception: {exc}", file=sys.stderr)
+                    results[codec] = {"path": "ERROR", "psnr": 0.0}
+                
+                if progress_callback:
+                    try:
+                        progress_callback({
+                            "completed": len(results),
+                            "total": len(codecs_to_process),
+                            "codec": codec,
+                        })
+                    except BaseException as exc:
+                        # The caller gave up on this run (e.g. a cancelled
+                        # speculative job): stop the encodes still running
+                        # and hand its exception back unchanged
+                        group.terminate()
+                        raise _CallbackError(exc)
+        finally:
+            executor.shutdown(wait=not group.terminated, cancel_futures=True)
+
+        final_output = {
+            "base_file_path": str(input_path),
+            "output_base_path": str(base_path),
+            "codecs": {
+                "base": {
+                    "path": str(input_path),
+                    "psnr": -1  # Input file compared to itself = perfect match
+                },
+                "h264": results.get('h264', {"path": "SKIPPED", "psnr": 0.0}),
+                "h265": results.get('h265', {"path": "SKIPPED", "psnr": 0.0}),
+                "av1": results.get('av1', {"path": "SKIPPED", "psnr": 0.0}),
+            }
         }
-    }
     
         return final_output
     
+    except _CallbackError as e:
+        raise e.error from None
     except PSNRError:
         # Re-raise PSNRError as-is
         raise
@@ -474,6 +598,305 @@ def process_video(video_path: str, output_base_path: Path, force_reencode: bool
         logger.error(f"Unexpected error in process_video: {e}")
         raise PSNRError(f"Unexpected error during video processing: {e}")
 
+def probe_video(video_path: str) -> Dict[str, Any]:
+    """
+    Read the basic stream properties of a video with ffprobe.
+
+    Returns:
+        A dictionary with codec, width, height, fps, duration_s, frames,
+        bitrate_kbps, size_bytes and start_s, the presentation time of the
+        first frame; fields ffprobe can't determine are None.
+
+    Raises:
+        PSNRError: If the file is missing or isn't a readable video.
+    """
+    input_path = Path(video_path).resolve()
+    if not input_path.is_file():
+        raise PSNRError(f"Input video not found: {input_path}")
+
+    command = [
+        "/usr/bin/ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height,avg_frame_rate,nb_frames,start_time:format=duration,bit_rate,start_time",
+        "-of", "json",
+        str(input_path)
+    ]
+    try:
+        process = subprocess.run(
+            command,
+            check=True,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            timeout=60
+        )
+        info = json.loads(process.stdout)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError, ValueError) as e:
+        raise PSNRError(f"Could not probe video {input_path}: {e}")
+
+    streams = info.get("streams") or []
+    if not streams:
+        raise PSNRError(f"Input file is not a valid video: {input_path}")
+    stream = streams[0]
+    fmt = info.get("format", {})
+
+    def number(value, cast=float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    fps = None
+    num, _, den = str(stream.get("avg_frame_rate", "")).partition("/")
+    if number(num) and number(den):
+        fps = round(number(num) / number(den), 3)
+    bit_rate = number(fmt.get("bit_rate"))
+
+    return {
+        "codec": stream.get("codec_name"),
+        "width": number(stream.get("width"), int),
+        "height": number(stream.get("height"), int),
+        "fps": fps,
+        "duration_s": number(fmt.get("duration")),
+        "frames": number(stream.get("nb_frames"), int),
+        "bitrate_kbps": round(bit_rate / 1000, 1) if bit_rate else None,
+        "size_bytes": input_path.stat().st_size,
+        "start_s": number(stream.get("start_time", fmt.get("start_time"))),
+    }
+
+def scan_keyframes(video_path: str) -> List[Dict[str, Any]]:
+    """
+    List the keyframes of a video from a scan of its container packets,
+    without decoding.
+
+    Returns:
+        A list of {"timestamp", "pos", "frame"} in presentation order, with
+        timestamps in seconds, the keyframe's byte offset in the file and its
+        frame number. Keyframes the container doesn't give an offset for are left out.
+
+    Raises:
+        PSNRError: If the file is missing or ffprobe fails.
+    """
+    input_path = Path(video_path).resolve()
+    if not input_path.is_file():
+        raise PSNRError(f"Input video not found: {input_path}")
+
+    command = [
+        "/usr/bin/ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,dts_time,pos,flags",
+        "-of", "compact=p=0",
+        str(input_path)
+    ]
+    process = _run_ffmpeg_command(command, f"Scanning keyframes of {input_path.name}")
+    return _parse_keyframe_packets(process.stdout)
+
+def _parse_keyframe_packets(output: str) -> List[Dict[str, Any]]:
+    """Parse ffprobe's compact packet listing into the keyframes of scan_keyframes."""
+    times, keyframes = [], []
+    for line in output.splitlines():
+        fields = dict(field.partition("=")[::2] for field in line.strip().split("|") if "=" in field)
+        try:
+            timestamp = float(fields["pts_time"] if fields.get("pts_time", "N/A") != "N/A" else fields["dts_time"])
+        except (KeyError, ValueError):
+            continue
+        times.append(timestamp)
+        if "K" in fields.get("flags", "") and fields.get("pos", "N/A").isdigit():
+            keyframes.append((timestamp, int(fields["pos"])))
+
+    # Packets come in decode order; a frame's number is how many frames are shown before it
+    times.sort()
+    keyframes.sort()
+    return [
+        {"timestamp": timestamp, "pos": pos, "frame": bisect.bisect_left(times, timestamp)}
+        for timestamp, pos in keyframes
+    ]
+
+def calculate_segment_quality(
+    segment_path: str,
+    source_path: str,
+    start_s: float,
+    duration_s: float,
+    size: Optional[tuple] = None,
+) -> Dict[str, Any]:
+    """
+    Compare a decoded segment with the same time range of the source video.
+
+    Args:
+        segment_path (str): A decoded segment, e.g. an HLS .ts file.
+        source_path (str): The source video.
+        start_s (float): Where the segment starts in the source.
+        duration_s (float): Length of the segment.
+        size (tuple): Optional (width, height) of the source; the segment is
+                      scaled to it before comparing.
+
+    Returns:
+        A dictionary with the average "psnr" (None if the frames are
+        identical) and "ssim" of the segment.
+
+    Raises:
+        PSNRError: If ffmpeg fails or its output can't be parsed.
+    """
+    scale = f"scale={size[0]}:{size[1]}," if size else ""
+    command = [
+        "/usr/bin/ffmpeg",
+        "-i", str(segment_path),
+        "-ss", f"{start_s:.3f}",
+        "-t", f"{duration_s:.3f}",
+        "-i", str(source_path),
+        "-lavfi",
+        f"[0:v]{scale}setpts=PTS-STARTPTS,split[d1][d2];"
+        "[1:v]setpts=PTS-STARTPTS,split[r1][r2];"
+        "[d1][r1]psnr;[d2][r2]ssim",
+        "-f", "null",
+        "-"
+    ]
+    process = _run_ffmpeg_command(command, f"Measuring quality of {Path(segment_path).name}")
+
+    psnr = re.search(r"PSNR .*average:(inf|\d+\.?\d*)", process.stderr)
+    ssim = re.search(r"SSIM .*All:(\d+\.?\d*)", process.stderr)
+    if not psnr or not ssim:
+        raise PSNRError(f"Could not parse quality of {segment_path} from ffmpeg output")
+
+    return {
+        "psnr": None if psnr.group(1) == "inf" else float(psnr.group(1)),
+        "ssim": float(ssim.group(1)),
+    }
+
+def scene_scores(
+    video_path: str,
+    start_s: float = 0.0,
+    duration_s: Optional[float] = None,
+) -> List[Tuple[float, float]]:
+    """
+    Score how much every frame differs from the previous one, using ffmpeg's
+    scene detection on a downscaled copy.
+
+    Returns:
+        A list of (timestamp, score) with source timestamps in seconds and
+        scores from 0 (identical) to 1 (scene cut).
+
+    Raises:
+        PSNRError: If ffmpeg fails.
+    """
+    range_args = ["-ss", f"{start_s:.3f}"]
+    if duration_s is not None:
+        range_args += ["-t", f"{duration_s:.3f}"]
+    command = [
+        "/usr/bin/ffmpeg",
+        "-hide_banner", "-nostats",
+    ] + range_args + [
+        "-i", str(video_path),
+        "-an",
+        "-vf", "scale=160:-2,select='gte(scene\\,0)',metadata=print:key=lavfi.scene_score:file=-",
+        "-f", "null",
+        "-"
+    ]
+    process = _run_ffmpeg_command(command, f"Scoring frames of {Path(video_path).name} from {start_s:.1f}s")
+    return _parse_frame_metadata(process.stdout, "lavfi.scene_score", start_s)
+
+def frame_similarity(
+    video_path: str,
+    image_path: str,
+    start_s: float,
+    duration_s: float,
+    size: Tuple[int, int] = (320, 180),
+) -> List[Tuple[float, float]]:
+    """
+    Compare every frame of a time range of a video with a still image, such
+    as a screenshot of the player, using SSIM at a reduced size.
+
+    Returns:
+        A list of (timestamp, ssim) with source timestamps in seconds.
+
+    Raises:
+        PSNRError: If ffmpeg fails.
+    """
+    width, height = size
+    scale = f"scale={width}:{height},setsar=1,format=yuv420p"
+    command = [
+        "/usr/bin/ffmpeg",
+        "-hide_banner", "-nostats",
+        "-ss", f"{start_s:.3f}", "-t", f"{duration_s:.3f}",
+        "-i", str(video_path),
+        "-loop", "1", "-i", str(image_path),
+        "-an",
+        "-filter_complex",
+        f"[0:v]{scale}[frames];[1:v]{scale}[image];"
+        f"[frames][image]ssim=shortest=1,metadata=print:key=lavfi.ssim.All:file=-",
+        "-f", "null",
+        "-"
+    ]
+    process = _run_ffmpeg_command(
+        command, f"Comparing {Path(image_path).name} with {Path(video_path).name} from {start_s:.1f}s"
+    )
+    return _parse_frame_metadata(process.stdout, "lavfi.ssim.All", start_s)
+
+def perceptual_hash(image_path: str) -> int:
+    """
+    64-bit difference hash (dHash) of an image: whether each pixel of a 9x8
+    grayscale thumbnail is brighter than its right neighbour. Re-encoded or
+    rescaled copies of an image differ in only a few bits.
+
+    Raises:
+        PSNRError: If ffmpeg fails.
+    """
+    command = [
+        "/usr/bin/ffmpeg",
+        "-hide_banner", "-nostats",
+        "-i", str(image_path),
+        "-vf", "scale=9:8:flags=area,format=gray",
+        "-frames:v", "1",
+        "-f", "rawvideo",
+        "-"
+    ]
+    process = _run_ffmpeg_command(command, f"Hashing {Path(image_path).name}", text=False)
+    pixels = process.stdout
+    if len(pixels) != 72:
+        raise PSNRError(f"Expected a 9x8 thumbnail of {image_path}, got {len(pixels)} bytes")
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+def normalize_image(image_path: str, output_path: str, short_side: int) -> None:
+    """
+    Decode an image and scale it so its shorter side is short_side pixels,
+    keeping the aspect ratio, as embedding models resize their input.
+
+    Raises:
+        PSNRError: If the image can't be decoded.
+    """
+    scale = f"scale='if(lt(iw,ih),{short_side},-2)':'if(lt(iw,ih),-2,{short_side})':flags=area"
+    command = [
+        "/usr/bin/ffmpeg",
+        "-y", "-hide_banner", "-nostats",
+        "-i", str(image_path),
+        "-vf", scale,
+        "-frames:v", "1",
+        str(output_path)
+    ]
+    _run_ffmpeg_command(command, f"Normalizing {Path(image_path).name}")
+
+def _parse_frame_metadata(output: str, key: str, start_s: float) -> List[Tuple[float, float]]:
+    """Parse the (timestamp, value) pairs printed by ffmpeg's metadata=print filter."""
+    values = []
+    timestamp = None
+    pattern = re.compile(re.escape(key) + r"=(-?\d+\.?\d*)")
+    for line in output.splitlines():
+        match = re.search(r"pts_time:(-?\d+\.?\d*)", line)
+        if match:
+            timestamp = start_s + float(match.group(1))
+            continue
+        match = pattern.match(line.strip())
+        if match and timestamp is not None:
+            values.append((round(timestamp, 3), float(match.group(1))))
+            timestamp = None
+    return values
+
 if __name__ == "__main__":
     video_path = "/home/yuval/DEV/sparse_codec/data/raw/sample_1080p30.mp4"
     base_path = "."
@@ -1,9 +1,47 @@
-from typing import Optional, Any, Dict, List
-from .base_flow import BaseFlow, FlowError, validate_file_exists
+import time
+from pathlib import Path
+from typing import Optional, Any, Dict, List, Tuple
+from .base_flow import BaseFlow, FlowError, validate_file_exists, validate_directory_exists
+from .embedding_index import EmbeddingIndexError, read_meta
+from .event_schemas import (
+    VectorSearchPreprocessingEvent, VectorSearchEndedEvent, VectorSearchRefinedEvent, CrossSearchEndEvent,
+)
+from .temporal_refinement import TemporalRefiner, REFINE_TOP_K
 from demo.backend import MAPPINGS
 
 
+# Factor mapping timestamps reported by the search script onto the player timeline.
+# Indexes that store exact source times in seconds need no scaling.
+TIMESTAMP_SCALE = 30 / 7
+# Longest the search waits for its hits to be refined after the search process exits
+REFINE_TIMEOUT_S = 120.0
+# Query embeddings shared by all searches (see query_cache). Kept out of the
+# data directory, whose subdirectories the janitor treats as per-video artifacts.
+QUERY_CACHE_DIR = Path("./demo/backend/query_cache")
+
+
+def timestamp_scale(index_dir: Optional[str]) -> float:
+    """Scale for the timestamps of a search over the index at index_dir."""
+    if not index_dir:
+        return TIMESTAMP_SCALE
+    try:
+        meta = read_meta(index_dir)
+    except EmbeddingIndexError:
+        return TIMESTAMP_SCALE
+    return 1.0 if meta.get("timestamp_unit") == "seconds" else TIMESTAMP_SCALE
+
+
 class VectorSearchFlow(BaseFlow):
+    resource_profile = {"cpu_fraction": 0.25, "nice": 5}
+    event_handlers = {
+        "vector_search_preprocessing": "_on_preprocessing",
+        "vector_search_ended": "_on_search_ended",
+        "vector_search_refined": "_on_hit_refined",
+        # Searches over a prebuilt index with cached query embeddings
+        "cross_search_query": "_on_search_ended",
+        "cross_search_end": "_on_cached_search_end",
+    }
+
     def __init__(self):
         super().__init__("VectorSearchFlow", timeout=900.0)  # 15 minute timeout
         
@@ -15,14 +53,49 @@ class VectorSearchFlow(BaseFlow):
         self.preprocessing_duration: Optional[float] = None
         self.processed_frames: Optional[int] = None
         self.resolution: Optional[str] = None
+        self.timestamp_scale = TIMESTAMP_SCALE
+        # Frame-accurate hits by (query, rank), see temporal_refinement
+        self.refine = False
+        self.query_cache_stats: Optional[Dict[str, int]] = None
+        self._refined: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        # Counts refinements so pollers can ask for those made since their last call
+        self._refined_seq = 0
+        self._refiner: Optional[TemporalRefiner] = None
+
+    def start_search(self, video_src: str, img_srcs: List[str], index_dir: Optional[str] = None,
+                     refine: bool = False, cache_queries: bool = False):
+        """
+        Start the vector search process. With index_dir the search reuses an
+        embedding index built while decoding instead of preprocessing the video,
+        and with cache_queries it is searched in-process with query embeddings
+        from the shared cache, embedding only new screenshots.
+        With refine the top hits are moved to the exact frame that matches.
+        """
+        self._restore_inputs(video_src, img_srcs, index_dir, refine, cache_queries)
+        self.start(video_src, img_srcs, index_dir, refine, cache_queries)
 
-    def start_search(self, video_src: str, img_srcs: List[str]):
-        """Start the vector search process."""
+    def _restore_inputs(self, video_src: str, img_srcs: List[str], index_dir: Optional[str] = None,
+                        refine: bool = False, cache_queries: bool = False) -> None:
         self.video_src = video_src
         self.img_srcs = img_srcs
-        self.start(video_src, img_srcs)
+        # Cached-query searches report source timestamps in seconds
+        self.timestamp_scale = 1.0 if index_dir and cache_queries else timestamp_scale(index_dir)
+        self.refine = refine
 
-    def _validate_inputs(self, video_src: str, img_srcs: List[str]) -> None:
+    def _reset_state(self) -> None:
+        super()._reset_state()
+        self._stop_refiner()
+        self._refined.clear()
+        self._refined_seq = 0
+        self.query_cache_stats = None
+
+    def _is_run_complete(self) -> bool:
+        """A search is complete once every query image has its results."""
+        with self._lock:
+            return bool(self.img_srcs) and len(self.results) >= len(self.img_srcs)
+
+    def _validate_inputs(self, video_src: str, img_srcs: List[str], index_dir: Optional[str] = None,
+                         refine: bool = False, cache_queries: bool = False) -> None:
         """Validate vector search inputs."""
         if not video_src:
             raise FlowError("Video source is required")
@@ -41,33 +114,111 @@ class VectorSearchFlow(BaseFlow):
         # Validate image files exist
         for img_src in img_srcs:
             validate_file_exists(img_src, "Image file")
+        
+        if index_dir:
+            validate_directory_exists(index_dir)
 
-    def _build_command(self, video_src: str, img_srcs: List[str]) -> List[str]:
+    def _build_command(self, video_src: str, img_srcs: List[str], index_dir: Optional[str] = None,
+                       refine: bool = False, cache_queries: bool = False) -> List[str]:
         """Build the vector search command."""
+        if index_dir and cache_queries:
+            return [
+                "python", "-m", "demo.backend.cross_video_search",
+                "--images", *img_srcs,
+                "--index", f"{video_src}={index_dir}",
+                "--query-cache", str(QUERY_CACHE_DIR),
+                "--",
+            ] + self.query_command()
         mapping = MAPPINGS.get_video_model_paths(video_src)
-        src = mapping["raw_path"]
-        
+        index_args = ["--index", index_dir] if index_dir else []
+        return self.index_command(mapping["raw_path"]) + img_srcs + index_args
+
+    @staticmethod
+    def index_command(src: str) -> List[str]:
+        """
+        Command that preprocesses a video into its frame-embedding index.
+        Searches add their query images to it and reuse the stored index.
+        """
         return [
             "python",
             "integration_example.py",
             "video",
             src,
-        ] + img_srcs
+        ]
 
-    def _process_log_line(self, log_obj: Dict[str, Any]) -> None:
-        """Process vector search specific log lines."""
-        log_type = log_obj.get("type")
+    @staticmethod
+    def query_command() -> List[str]:
+        """
+        Command that embeds query images, called with the images and
+        "--index <dir>" appended. It writes an index with one entry per image,
+        in order.
+        """
+        return ["python", "integration_example.py", "images"]
 
-        if log_type == "vector_search_preprocessing":
-            with self._lock:
-                self.video_id = log_obj.get("video_id")
-                self.preprocessing_duration = log_obj.get("duration_seconds")
-                self.processed_frames = log_obj.get("processed_frames")
-                self.resolution = log_obj.get("resolution")
+    def _on_preprocessing(self, event: VectorSearchPreprocessingEvent) -> None:
+        with self._lock:
+            self.video_id = event.get("video_id")
+            self.preprocessing_duration = event.get("duration_seconds")
+            self.processed_frames = event.get("processed_frames")
+            self.resolution = event.get("resolution")
 
-        elif log_type == "vector_search_ended":
-            with self._lock:
-                self.results.append(log_obj)
+    def _on_search_ended(self, event: VectorSearchEndedEvent) -> None:
+        # Stamped before the event is journaled, so a replay keeps the original timing
+        event.setdefault("completed_at", time.time())
+        with self._lock:
+            self.results.append(event)
+            query = len(self.results) - 1
+            # Only a running search refines; restored results come with their refinements
+            live = self._process is not None or self._adopted_pid is not None
+            if not (self.refine and live) or query >= len(self.img_srcs or []):
+                return
+            if self._refiner is None:
+                mapping = MAPPINGS.get_video_model_paths(self.video_src)
+                refiner = TemporalRefiner(
+                    mapping["raw_path"],
+                    on_refined=lambda query, rank, refined: self._on_refined(refiner, query, rank, refined),
+                )
+                self._refiner = refiner
+                refiner.start()
+            hits = event.get("top_results", [])[:REFINE_TOP_K]
+            self._refiner.submit(
+                query, self.img_srcs[query], [hit["timestamp"] * self.timestamp_scale for hit in hits]
+            )
+
+    def _on_refined(self, refiner: TemporalRefiner, query: int, rank: int, refined: Dict[str, Any]) -> None:
+        with self._lock:
+            if refiner is not self._refiner:
+                return
+        # Dispatched like a search event so it is journaled with the results
+        self._dispatch_event({"type": "vector_search_refined", "query": query, "rank": rank, **refined})
+
+    def _on_cached_search_end(self, event: CrossSearchEndEvent) -> None:
+        with self._lock:
+            self.preprocessing_duration = 0.0
+            self.query_cache_stats = event.get("query_cache")
+
+    def _on_hit_refined(self, event: VectorSearchRefinedEvent) -> None:
+        with self._lock:
+            self._refined_seq += 1
+            self._refined[(event["query"], event["rank"])] = {
+                "timestamp": event["timestamp"],
+                "similarity": event.get("similarity"),
+                "seq": self._refined_seq,
+            }
+
+    def _on_process_completed(self) -> None:
+        """Finish refining the hits before the results are frozen."""
+        with self._lock:
+            refiner = self._refiner
+        if refiner and not refiner.wait(REFINE_TIMEOUT_S):
+            self.logger.warning(f"Refinement took over {REFINE_TIMEOUT_S:.0f}s; unrefined hits keep their index timestamps")
+            refiner.stop()
+
+    def _stop_refiner(self) -> None:
+        with self._lock:
+            refiner, self._refiner = self._refiner, None
+        if refiner:
+            refiner.stop()
 
     # Backward compatibility methods
     def is_search_started(self) -> bool:
@@ -80,6 +231,40 @@ class VectorSearchFlow(BaseFlow):
         with self._lock:
             return list(self.results)
 
+    def get_scaled_results(self) -> List[Dict[str, Any]]:
+        """
+        Get a copy of the results with timestamps scaled to the player timeline.
+        Refined hits report the matching frame, keeping the index hit as coarse_timestamp,
+        and the refinement's sequence number as refined_seq.
+        Each result carries its query index and when it completed: elapsed_seconds
+        since the search started and duration_seconds since the previous result.
+        """
+        with self._lock:
+            data = []
+            previous = self.start_time
+            for query, item in enumerate(self.results):
+                scaled = dict(item)
+                scaled["query"] = query
+                completed_at = item.get("completed_at")
+                if completed_at and self.start_time:
+                    scaled["elapsed_seconds"] = round(completed_at - self.start_time, 3)
+                    scaled["duration_seconds"] = round(completed_at - previous, 3)
+                    previous = completed_at
+                scaled["top_results"] = []
+                for rank, result in enumerate(item.get("top_results", [])):
+                    hit = {**result, "timestamp": result["timestamp"] * self.timestamp_scale}
+                    refined = self._refined.get((query, rank))
+                    if refined:
+                        hit.update(
+                            coarse_timestamp=hit["timestamp"],
+                            timestamp=refined["timestamp"],
+                            similarity=refined["similarity"],
+                            refined_seq=refined["seq"],
+                        )
+                    scaled["top_results"].append(hit)
+                data.append(scaled)
+            return data
+
     def get_preprocessing_info(self) -> Dict[str, Any]:
         """Get preprocessing information."""
         with self._lock:
@@ -88,10 +273,29 @@ class VectorSearchFlow(BaseFlow):
                 "duration_seconds": self.preprocessing_duration,
                 "processed_frames": self.processed_frames,
                 "resolution": self.resolution,
+                "refined_hits": len(self._refined) if self.refine else None,
+                "query_cache": self.query_cache_stats,
             }
 
+    def _build_result_payload(self) -> Optional[Dict[str, Any]]:
+        if not self.results:
+            return None
+        return {
+            "result": "ok",
+            "data": self.get_scaled_results(),
+            "metadata": self._with_resources(self.get_preprocessing_info()),
+        }
+
+    def _get_status_fields(self) -> Dict[str, Any]:
+        return {
+            "total_queries": len(self.img_srcs or []),
+            "results": self.get_scaled_results(),
+            "metadata": self.get_preprocessing_info(),
+        }
+
     def reset(self) -> None:
         """Reset vector search specific state and call parent reset."""
+        self._stop_refiner()
         with self._lock:
             self.results.clear()
             self.video_src = None
@@ -100,5 +304,9 @@ class VectorSearchFlow(BaseFlow):
             self.preprocessing_duration = None
             self.processed_frames = None
             self.resolution = None
+            self.timestamp_scale = TIMESTAMP_SCALE
+            self.refine = False
+            self.query_cache_stats = None
+            self._refined.clear()
         
         super().reset()
\ No newline at end of file
@@ -5,17 +5,32 @@ import mimetypes
 import os
 import re
 import shutil
-from typing import Any, Dict, Optional
-from fastapi import FastAPI, HTTPException, Request, File, UploadFile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Request, File, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from demo.backend import MAPPINGS
-from demo.backend.DecodeFlow import DecodeFlow
+from demo.backend.CrossVideoSearchFlow import CrossVideoSearchFlow
+from demo.backend.DecodeFlow import DecodeFlow, PLAYLISTS
+from demo.backend.embedding_index import META_NAME
 from demo.backend.EncodeFlow import EncodeFlow
-from demo.backend.PSNRCalc import process_video, PSNRError
-from demo.backend.VectorSearchFlow import VectorSearchFlow
-from demo.backend.base_flow import FlowError
+from demo.backend.IndexFlow import IndexFlow
+from demo.backend.PSNRCalc import process_video, probe_video, scan_keyframes, PSNRError
+from demo.backend.VectorSearchFlow import VectorSearchFlow, QUERY_CACHE_DIR
+from demo.backend.base_flow import FlowError, current_status_version, wait_for_status_change_async
+from demo.backend.session_store import SessionStore, StatusPublisher, WORKER_ID, is_process_alive
+from demo.backend.janitor import Janitor
+from demo.backend.keyframe_index import keyframe_at, gop_byte_range
+from demo.backend.process_tree import ProcessReaper, terminate_process_group
+from demo.backend.single_flight import SingleFlight
+from demo.backend.speculative import SpeculativeScheduler
+from demo.backend.stream_handoff import StreamHandoff, HANDOFF_NAME
+from demo.backend.segment_index import SegmentFeed, FEED_NAME
+from demo.backend.screenshot_ingest import ScreenshotIngestor
 from pathlib import Path
 
 app = FastAPI()
@@ -30,59 +45,494 @@ app.add_middleware(
 )
 
 DATA_DIR = Path("./demo/backend/data/")
+SESSION_DB_PATH = Path("./demo/backend/sessions.db")
+JOBS_DIR = Path("./demo/backend/jobs/")
+JOURNAL_DIR = Path("./demo/backend/journal/")
+
+SESSION_TTL_S = 6 * 60 * 60
+DATA_DIR_BUDGET_BYTES = 50 * 1024 ** 3
+JANITOR_INTERVAL_S = 300.0
+# Session accesses are recorded at most this often per key
+SESSION_TOUCH_INTERVAL_S = 30.0
+REAPER_INTERVAL_S = 60.0
+# Journaled flows are re-adopted after a restart, so by default their process
+# trees outlive a shutdown; set this to kill them instead
+TERMINATE_FLOWS_ON_SHUTDOWN = False
+# Opt-in: precompute a registered video's media probe, codec comparison and
+# frame-embedding index in the background, yielding to interactive flows
+SPECULATIVE_PRECOMPUTE = False
+SPECULATIVE_INDEX_TIMEOUT_S = 900.0
+# Default for building the embedding index from decoded segments during a decode
+INDEX_DURING_DECODE = False
+# Default for preprocessing a vector search in parallel shards when no index exists
+SHARDED_PREPROCESSING = False
+# Default for picking the frames of a sharded index by content (see frame_sampling)
+ADAPTIVE_SAMPLING = False
+# Default for moving the top search hits to the exact matching frame (see temporal_refinement)
+REFINE_SEARCH_HITS = False
+# Quantization ("sq8" or "pq") added to sharded indexes for in-process search, or None
+INDEX_QUANTIZATION = None
+# Default for searching prebuilt indexes in-process with cached query embeddings (see query_cache)
+CACHE_QUERY_EMBEDDINGS = False
+# Opt-in: embed screenshots into the query cache as they are uploaded through
+# /upload_vector_images. Only searches over a prebuilt index read the cache.
+INGEST_SCREENSHOTS = False
+# Workers normalizing screenshots uploaded through /upload_vector_images
+SCREENSHOT_INGEST_WORKERS = 2
 
 
 # ==============================================================================
-# 2. STARTUP EVENT & CACHE CLEARING
+# 2. STARTUP EVENT & CACHE EVICTION
 # ==============================================================================
-# @app.on_event("startup")
-# def clear_cache_on_startup():
-#     """
-#     Deletes the entire data directory to clear all cache from previous runs,
-#     then recreates it to be ready for the new session.
-#     """
-#     print("--- Server starting up: Clearing cache directory ---")
-#     if DATA_DIR.exists() and DATA_DIR.is_dir():
-#         try:
-#             shutil.rmtree(DATA_DIR)
-#             print(f"Successfully cleared cache directory: {DATA_DIR}")
-#         except Exception as e:
-#             print(f"Error clearing cache directory {DATA_DIR}: {e}")
-    
-#     try:
-#         # Recreate the directory to ensure it exists for the application
-#         DATA_DIR.mkdir(parents=True, exist_ok=True)
-#         print(f"Successfully created empty cache directory: {DATA_DIR}")
-#     except Exception as e:
-#         print(f"FATAL: Could not create cache directory {DATA_DIR}: {e}")
+@app.on_event("startup")
+def start_janitor_on_startup():
+    """
+    Instead of wiping DATA_DIR on startup, a background janitor evicts idle
+    sessions and keeps DATA_DIR within its disk budget while the server runs.
+    """
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    recover_flows()
+    # Kill whatever runs that could not be re-adopted left behind
+    process_reaper.reap_once()
+    process_reaper.start()
+    janitor.start()
+    if INGEST_SCREENSHOTS:
+        screenshot_ingestor.start()
+    if SPECULATIVE_PRECOMPUTE:
+        speculative.start()
+    print(f"--- Janitor started: session TTL {SESSION_TTL_S}s, disk budget {DATA_DIR_BUDGET_BYTES} bytes ---")
+
+@app.on_event("shutdown")
+def stop_janitor_on_shutdown():
+    janitor.stop()
+    process_reaper.stop()
+    speculative.stop()
+    screenshot_ingestor.stop()
+    if TERMINATE_FLOWS_ON_SHUTDOWN:
+        with _flow_instances_lock:
+            flows = [flow for key_flows in flow_instances.values() for flow in key_flows.values()]
+        for flow in flows:
+            flow.terminate()
 
 
 # ==============================================================================
 # 3. CORE LOGIC & HELPER FUNCTIONS
 # ==============================================================================
 
-# Global flow storage - each key maps to its own set of flows
+# Sessions, flow status and flow ownership are shared by all workers through
+# the session store. flow_instances only holds this worker's flow objects; a
+# flow's subprocess is supervised by the worker that owns it.
+session_store = SessionStore(SESSION_DB_PATH)
 flow_instances: Dict[str, Dict[str, Any]] = {}
+_flow_instances_lock = threading.Lock()
+_session_touches: Dict[str, float] = {}
+
+FLOW_CLASSES = {
+    'encode_flow': EncodeFlow,
+    'decode_flow': DecodeFlow,
+    'vector_search_flow': VectorSearchFlow,
+    'index_flow': IndexFlow,
+    'cross_search_flow': CrossVideoSearchFlow,
+}
 
 def get_or_create_flows(key: str) -> Dict[str, Any]:
-    """Get or create flow instances for a given key."""
-    if key not in flow_instances:
-        flow_instances[key] = {
-            'encode_flow': EncodeFlow(),
-            'decode_flow': DecodeFlow(),
-            'vector_search_flow': VectorSearchFlow(),
-            'uploaded_filename': None
-        }
-    return flow_instances[key]
+    """Get or create this worker's flow instances for a given key and register the session."""
+    with session_store.key_lock(key):
+        created = session_store.create_session(key)
+        with _flow_instances_lock:
+            flows = flow_instances.get(key)
+            # Local flows left over from a deleted session are stale
+            if flows is None or created:
+                flows = {name: flow_class() for name, flow_class in FLOW_CLASSES.items()}
+                for name, flow in flows.items():
+                    flow.add_status_listener(StatusPublisher(session_store, key, name))
+                    flow.enable_journal(JOURNAL_DIR / key / f"{name}.jsonl")
+                flow_instances[key] = flows
+        if created:
+            for name, flow in flows.items():
+                session_store.reset_flow_state(key, name, flow.get_status())
+    return flows
 
 def validate_key(key: Optional[str]) -> str:
-    """Validate that a key exists in our flow instances."""
+    """Validate that a key exists in the session store."""
     if not key:
         raise HTTPException(status_code=400, detail="Key parameter is required")
-    if key not in flow_instances:
+    if not session_store.session_exists(key):
         raise HTTPException(status_code=404, detail="Invalid key - no flows found for this key")
+    
+    now = time.time()
+    if now - _session_touches.get(key, 0.0) > SESSION_TOUCH_INTERVAL_S:
+        _session_touches[key] = now
+        session_store.touch_session(key)
     return key
 
+def get_flow_status(key: str, flow_name: str) -> Dict[str, Any]:
+    """Get a flow's status as published by whichever worker owns it."""
+    status = session_store.get_flow_status(key, flow_name)
+    if status is None:
+        status = get_or_create_flows(key)[flow_name].get_status()
+    return status
+
+def with_resources(metadata, status: Dict[str, Any]):
+    """Attach a flow's published resource usage to its metadata."""
+    if not isinstance(metadata, dict):
+        return metadata
+    return {**metadata, "resources": status["resources"]}
+
+def get_owned_frozen_response(key: str, flow_name: str):
+    """Get a flow's frozen result if this worker owns the flow that produced it."""
+    owner = session_store.get_flow_owner(key, flow_name)
+    if not owner or owner["worker_id"] != WORKER_ID:
+        return None
+    return get_or_create_flows(key)[flow_name].get_frozen_response()
+
+def start_owned_flow(key: str, flow_name: str, start, attach: bool = False) -> bool:
+    """
+    Claim a flow for this worker and start it with start(flow).
+    A flow that is running, or finished successfully, on another live worker stays there.
+    With attach=True a request for a flow that is already running joins it
+    instead of failing. Returns True if the request attached to a running flow.
+    """
+    status = get_flow_status(key, flow_name)
+    running = status["started"] and not status["finished"]
+    completed = status["finished"] and not status["error"]
+    
+    if running and attach:
+        return True
+    
+    if not session_store.claim_flow(key, flow_name, steal=not running and not completed):
+        if running:
+            raise FlowError(f"{flow_name} already started and running on another worker")
+        return False
+    
+    flow = get_or_create_flows(key)[flow_name]
+    try:
+        start(flow)
+    except Exception:
+        if not flow.is_started():
+            session_store.release_flow(key, flow_name)
+        raise
+    return False
+
+def reset_flow(key: str, flow_name: str) -> None:
+    """
+    Reset a flow wherever it runs. The process tree of a subprocess
+    supervised by another worker is terminated through its process group.
+    """
+    flow = get_or_create_flows(key)[flow_name]
+    if flow_name in ('encode_flow', 'decode_flow'):
+        cancel_pipeline(key)
+    if flow_name in ('decode_flow', 'index_flow'):
+        cancel_segment_feed(key)
+    owner = session_store.get_flow_owner(key, flow_name)
+    if (owner and owner["worker_id"] != WORKER_ID and owner["process_pid"]
+            and is_process_alive(owner["worker_pid"])):
+        terminate_process_group(owner["process_pid"])
+    
+    flow.reset()
+    session_store.reset_flow_state(key, flow_name, flow.get_status())
+
+# Pipelined encode -> decode runs supervised by this worker
+pipelines: Dict[str, StreamHandoff] = {}
+
+def cancel_pipeline(key: str) -> None:
+    pipeline = pipelines.pop(key, None)
+    if pipeline:
+        pipeline.cancel()
+
+# Segment feeds from decodes supervised by this worker to their index flows
+segment_feeds: Dict[str, SegmentFeed] = {}
+
+def cancel_segment_feed(key: str) -> None:
+    feed = segment_feeds.pop(key, None)
+    if feed:
+        feed.cancel()
+
+def start_segment_feed(key: str, filename: str) -> None:
+    """Build the embedding index of a key's video from its decoded segments as they are written."""
+    reset_flow(key, 'index_flow')
+    flows = get_or_create_flows(key)
+    feed_path = DATA_DIR / filename / FEED_NAME
+    feed = SegmentFeed(
+        flows['decode_flow'],
+        filename,
+        DATA_DIR / filename / "decoded" / PLAYLISTS["TreeA"],
+        feed_path,
+        start_index=lambda: start_owned_flow(
+            key, 'index_flow', lambda flow: flow.start_index(filename, follow=str(feed_path))
+        ),
+    )
+    segment_feeds[key] = feed
+    feed.start()
+
+def completed_index_dir(key: str, video_src: str) -> Optional[str]:
+    """
+    The embedding index built for a video during its decode, or speculatively
+    for the current version of its source, if indexing finished.
+    """
+    index_dir = IndexFlow.index_dir(video_src)
+    status = get_flow_status(key, 'index_flow')
+    if status["finished"] and not status["error"] and status["metadata"] and status["filename"] == video_src:
+        return str(index_dir) if index_dir.is_dir() else None
+    mapping = MAPPINGS.get_video_model_paths(video_src)
+    if mapping and single_flight.get_result(embedding_index_job(mapping["raw_path"]), embedding_index_exists):
+        return str(index_dir)
+    return None
+
+def search_can_use_query_cache(key: str, video_src: str) -> bool:
+    """
+    Whether a search of the video would read the query cache: only searches
+    over a prebuilt index do, so the index exists or the defaults build one.
+    """
+    return (
+        CACHE_QUERY_EMBEDDINGS or SHARDED_PREPROCESSING or INDEX_DURING_DECODE
+        or completed_index_dir(key, video_src) is not None
+    )
+
+def start_search_after_index(key: str, video_path: str, images_path, shards: Optional[int] = None,
+                             adaptive: bool = False, refine: bool = False,
+                             quantize: Optional[str] = INDEX_QUANTIZATION, cache_queries: bool = False) -> None:
+    """
+    Build the video's index in parallel shards, then run the search on it.
+    If indexing fails the search preprocessing runs as usual.
+    """
+    reset_flow(key, 'index_flow')
+    index_flow = get_or_create_flows(key)['index_flow']
+    
+    def on_index_status(flow, status):
+        if not status["started"]:
+            # The index flow was reset; the search was abandoned with it
+            flow.remove_status_listener(on_index_status)
+            return
+        if not status["finished"]:
+            return
+        flow.remove_status_listener(on_index_status)
+        index_dir = completed_index_dir(key, video_path)
+        try:
+            start_owned_flow(
+                key, 'vector_search_flow',
+                lambda search: search.start_search(video_path, images_path, index_dir, refine, cache_queries),
+            )
+        except Exception as e:
+            print(f"Could not start vector search for key '{key}' after indexing: {e}")
+    
+    index_flow.add_status_listener(on_index_status)
+    try:
+        start_owned_flow(key, 'index_flow', lambda flow: flow.start_sharded(video_path, shards, adaptive, quantize))
+    except Exception:
+        index_flow.remove_status_listener(on_index_status)
+        raise
+
+def reset_flows(key: str, flow_names=tuple(FLOW_CLASSES)) -> None:
+    """Reset several flows of a key, all of them by default."""
+    if set(flow_names) == set(FLOW_CLASSES):
+        speculative.cancel(key)
+    for flow_name in flow_names:
+        reset_flow(key, flow_name)
+
+def recover_flows() -> None:
+    """
+    Rebuild flows whose owner worker is gone, e.g. after a restart or reload,
+    from their journals. Finished runs are restored, runs still in progress
+    are re-adopted, and runs that can't be recovered are marked failed.
+    """
+    for key in session_store.list_sessions():
+        for flow_name in FLOW_CLASSES:
+            status = session_store.get_flow_status(key, flow_name)
+            if not status or not status["started"]:
+                continue
+            owner = session_store.get_flow_owner(key, flow_name)
+            if owner and is_process_alive(owner["worker_pid"]):
+                continue
+            if not session_store.claim_flow(key, flow_name):
+                continue
+            
+            flow = get_or_create_flows(key)[flow_name]
+            if flow.replay_journal():
+                print(f"Recovered {flow_name} for key '{key}' from its journal")
+            else:
+                print(f"No journal for {flow_name} of key '{key}'; resetting it")
+                reset_flow(key, flow_name)
+
+def remove_session_journals(key: str) -> None:
+    journal_dir = JOURNAL_DIR / key
+    if journal_dir.exists():
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+def is_session_busy(key: str) -> bool:
+    """Check whether any flow of a key is running on any worker."""
+    for flow_name in FLOW_CLASSES:
+        status = session_store.get_flow_status(key, flow_name)
+        if status and status["started"] and not status["finished"]:
+            return True
+    return False
+
+def get_busy_videos():
+    """Videos whose sessions have running flows; the janitor never touches their files."""
+    return {
+        filename for key, filename in session_store.list_sessions().items()
+        if filename and is_session_busy(key)
+    }
+
+def evict_session(key: str) -> bool:
+    """Drop an idle session from the store and from memory. Sessions with running flows are kept."""
+    if is_session_busy(key):
+        return False
+    speculative.cancel(key)
+    screenshot_ingestor.forget(key)
+    session_store.delete_session(key)
+    with _flow_instances_lock:
+        flow_instances.pop(key, None)
+    _session_touches.pop(key, None)
+    remove_session_journals(key)
+    return True
+
+def prune_local_flows() -> None:
+    """Drop this worker's flow objects for sessions that were removed elsewhere."""
+    with _flow_instances_lock:
+        for key in list(flow_instances):
+            flows = flow_instances[key]
+            if any(flow.is_running() for flow in flows.values()):
+                continue
+            if not session_store.session_exists(key):
+                del flow_instances[key]
+                _session_touches.pop(key, None)
+
+# Codec comparisons are shared by every session of a scene: one run per source
+# file, with concurrent requests attached to it and finished results reused.
+single_flight = SingleFlight(JOBS_DIR)
+
+def _source_fingerprint(raw_path: str):
+    try:
+        stat = os.stat(raw_path)
+        return (stat.st_size, stat.st_mtime)
+    except OSError:
+        return None
+
+def codec_comparison_job(raw_path: str):
+    """Single-flight key of the codec comparison of a source file."""
+    return ("codec_comparison", raw_path, _source_fingerprint(raw_path), str(DATA_DIR.resolve()))
+
+def media_probe_job(raw_path: str):
+    """Single-flight key of the media probe of a source file."""
+    return ("media_probe", raw_path, _source_fingerprint(raw_path))
+
+def keyframe_index_job(video_path: str):
+    """Single-flight key of the keyframe index of a source or encoded video."""
+    return ("keyframe_index", video_path, _source_fingerprint(video_path))
+
+def get_keyframe_index(video_path: str):
+    """Keyframes of a video, scanned once per version of the file and kept in JOBS_DIR."""
+    return single_flight.do(keyframe_index_job(video_path), lambda progress: scan_keyframes(video_path))
+
+def embedding_index_job(raw_path: str):
+    """Single-flight key of the frame-embedding index of a source file."""
+    return ("embedding_index", raw_path, _source_fingerprint(raw_path))
+
+def embedding_index_exists(result) -> bool:
+    """Check that the index of a stored speculative indexing run is still on disk."""
+    return "index_dir" in result and (Path(result["index_dir"]) / META_NAME).is_file()
+
+def codec_outputs_exist(result) -> bool:
+    """Check that the encoded files of a stored codec comparison are still on disk."""
+    return all(
+        Path(codec["path"]).exists()
+        for codec in result["codecs"].values()
+        if codec["path"] not in ["ERROR", "SKIPPED", "NO_ENCODER"]
+    )
+
+janitor = Janitor(
+    DATA_DIR,
+    list_idle_sessions=session_store.list_idle_sessions,
+    evict_session=evict_session,
+    list_video_sessions=session_store.find_keys_by_filename,
+    busy_videos=get_busy_videos,
+    session_ttl=SESSION_TTL_S,
+    disk_budget_bytes=DATA_DIR_BUDGET_BYTES,
+    interval=JANITOR_INTERVAL_S,
+    acquire_lease=session_store.acquire_lease,
+    prune_local=prune_local_flows,
+)
+
+# Each worker reaps leftover processes of the flow subprocesses it spawned or adopted
+process_reaper = ProcessReaper(interval=REAPER_INTERVAL_S)
+
+def interactive_flows_running() -> bool:
+    """Check whether any flow supervised by this worker is running."""
+    with _flow_instances_lock:
+        flows = [flow for key_flows in flow_instances.values() for flow in key_flows.values()]
+    return any(flow.is_running() for flow in flows)
+
+def run_media_probe(ctx, filename: str):
+    raw_path = MAPPINGS.get_video_model_paths(filename)["raw_path"]
+    return single_flight.do(media_probe_job(raw_path), lambda progress: probe_video(raw_path))
+
+def run_keyframe_index(ctx, filename: str):
+    return get_keyframe_index(MAPPINGS.get_video_model_paths(filename)["raw_path"])
+
+def run_codec_comparison(ctx, filename: str):
+    raw_path = MAPPINGS.get_video_model_paths(filename)["raw_path"]
+    job = codec_comparison_job(raw_path)
+    # Once a request has attached to the run, a reset no longer stops it
+    def unshared():
+        return (single_flight.get_progress(job) or {}).get("waiters", 0) <= 1
+    return single_flight.do(
+        job,
+        lambda progress: process_video(raw_path, DATA_DIR, progress_callback=ctx.guard(progress, unshared)),
+        codec_outputs_exist,
+    )
+
+def run_embedding_index(ctx, filename: str):
+    raw_path = MAPPINGS.get_video_model_paths(filename)["raw_path"]
+    index_dir = IndexFlow.index_dir(filename)
+    def index(progress):
+        if (index_dir / META_NAME).is_file():
+            # Already built while the video was decoded or searched
+            return {"index_dir": str(index_dir)}
+        # Built beside the index an IndexFlow of the video may write, and moved into place when done
+        build_dir = index_dir.with_name(index_dir.name + ".speculative")
+        command = IndexFlow.sharded_command(raw_path, str(build_dir), quantize=INDEX_QUANTIZATION)
+        try:
+            returncode = ctx.run(command, timeout=SPECULATIVE_INDEX_TIMEOUT_S)
+            if returncode != 0:
+                raise RuntimeError(f"Indexing exited with code {returncode}")
+            if index_dir.exists():
+                shutil.rmtree(index_dir)
+            build_dir.replace(index_dir)
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            shutil.rmtree(str(build_dir) + ".shards", ignore_errors=True)
+        return {"index_dir": str(index_dir)}
+    return single_flight.do(embedding_index_job(raw_path), index, embedding_index_exists)
+
+# Speculative jobs of this worker's sessions, run in this order
+speculative = SpeculativeScheduler(is_busy=interactive_flows_running)
+speculative.register("media_probe", run_media_probe)
+speculative.register("keyframe_index", run_keyframe_index)
+speculative.register("codec_comparison", run_codec_comparison)
+speculative.register("embedding_index", run_embedding_index)
+
+# Screenshots uploaded in batches are embedded into the query cache before their search starts
+screenshot_ingestor = ScreenshotIngestor(
+    QUERY_CACHE_DIR, VectorSearchFlow.query_command(), workers=SCREENSHOT_INGEST_WORKERS
+)
+
+def schedule_speculative(key: str, filename: str) -> None:
+    """Queue the speculative jobs of a newly registered video when enabled."""
+    if SPECULATIVE_PRECOMPUTE and MAPPINGS.get_video_model_paths(filename):
+        speculative.schedule(key, filename)
+
+def frozen_json_response(request: Request, frozen) -> Response:
+    """
+    Serve a result frozen at flow completion.
+    Answers 304 when the client already holds the same ETag.
+    """
+    body, etag = frozen
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 def get_video_file_info(base_name: str) -> Dict[str, Any]:
     """Get information about an existing video file."""
     video_dir = DATA_DIR / base_name
@@ -132,13 +582,13 @@ async def upload_video(file: UploadFile = File(...)):
         key = base_name
         
         # Check if key already exists and file is already uploaded
-        if key in flow_instances:
-            flows = flow_instances[key]
+        if session_store.session_exists(key):
             video_dir = DATA_DIR / base_name
             expected_file_path = video_dir / file.filename
             
             # If file already exists, return success without re-uploading
             if expected_file_path.exists():
+                schedule_speculative(key, base_name)
                 return {
                     "result": "ok",
                     "key": key,
@@ -149,16 +599,14 @@ async def upload_video(file: UploadFile = File(...)):
                 }
         
         # Get or create flows for this key
-        flows = get_or_create_flows(key)
+        get_or_create_flows(key)
         
         video_dir = DATA_DIR / base_name
 
         # If a new video is uploaded with the same key, reset the flows
-        if flows['uploaded_filename'] != base_name:
+        if session_store.get_uploaded_filename(key) != base_name:
             print(f"New video uploaded with key '{key}': {file.filename}. Resetting flows for this key.")
-            flows['encode_flow'].reset()
-            flows['decode_flow'].reset()
-            flows['vector_search_flow'].reset()
+            reset_flows(key)
             # Optionally, clean up the old directory
             if os.path.exists(video_dir):
                 shutil.rmtree(video_dir)
@@ -172,9 +620,9 @@ async def upload_video(file: UploadFile = File(...)):
             while content := await file.read(1024 * 1024):  # Read in 1MB chunks
                 buffer.write(content)
 
-        # Update the state of the encode flow with the new base name
-        flows['encode_flow'].uploaded_filename = base_name
-        flows['uploaded_filename'] = base_name
+        # Record the uploaded video for this session
+        session_store.set_uploaded_filename(key, base_name)
+        schedule_speculative(key, base_name)
 
         return {
             "result": "ok",
@@ -213,11 +661,11 @@ async def get_or_create_key(request: Request):
         
         if video_info:
             # File exists, get or create flows
-            flows = get_or_create_flows(key)
+            get_or_create_flows(key)
             
             # Update the state
-            flows['encode_flow'].uploaded_filename = base_name
-            flows['uploaded_filename'] = base_name
+            session_store.set_uploaded_filename(key, base_name)
+            schedule_speculative(key, base_name)
             
             return {
                 "result": "ok",
@@ -249,21 +697,22 @@ async def reset_file_upload(request: Request):
         body = await request.json()
         key = validate_key(body.get("key"))
         
-        flows = flow_instances[key]
+        uploaded_filename = session_store.get_uploaded_filename(key)
         
         # Reset all stateful flow objects for this key
-        flows['encode_flow'].reset()
-        flows['decode_flow'].reset()
-        flows['vector_search_flow'].reset()
+        reset_flows(key)
         
         # Clean up the video directory for this key
-        if flows['uploaded_filename']:
-            video_dir = DATA_DIR / flows['uploaded_filename']
+        if uploaded_filename:
+            video_dir = DATA_DIR / uploaded_filename
             if video_dir.exists() and video_dir.is_dir():
                 shutil.rmtree(video_dir)
         
-        # Remove the flows from memory
-        del flow_instances[key]
+        # Remove the session from the store and the flows from memory
+        session_store.delete_session(key)
+        with _flow_instances_lock:
+            flow_instances.pop(key, None)
+        remove_session_journals(key)
 
         return {
             "result": "ok",
@@ -281,13 +730,12 @@ def check_key(key: str):
     Check if a key exists in the flow map.
     Returns the status and associated filename if it exists.
     """
-    if key in flow_instances:
-        flows = flow_instances[key]
+    if session_store.session_exists(key):
         return {
             "result": "ok",
             "exists": True,
             "key": key,
-            "uploaded_filename": flows['uploaded_filename'],
+            "uploaded_filename": session_store.get_uploaded_filename(key),
             "message": f"Key '{key}' exists and is ready for operations"
         }
     else:
@@ -312,13 +760,12 @@ async def check_key_post(request: Request):
         if not key:
             return {"result": "error", "message": "Key parameter is required"}
         
-        if key in flow_instances:
-            flows = flow_instances[key]
+        if session_store.session_exists(key):
             return {
                 "result": "ok",
                 "exists": True,
                 "key": key,
-                "uploaded_filename": flows['uploaded_filename'],
+                "uploaded_filename": session_store.get_uploaded_filename(key),
                 "message": f"Key '{key}' exists and is ready for operations"
             }
         else:
@@ -339,12 +786,28 @@ def list_keys():
     """
     return {
         "result": "ok",
-        "keys": {
-            key: flows['uploaded_filename'] 
-            for key, flows in flow_instances.items()
-        }
+        "keys": session_store.list_sessions()
     }
 
+@app.get("/media_info")
+async def media_info(key: str):
+    """
+    Stream properties of the key's video. Reuses a speculative probe when one ran.
+    """
+    validate_key(key)
+    filename = session_store.get_uploaded_filename(key)
+    mappings = MAPPINGS.get_video_model_paths(filename) if filename else None
+    if not mappings:
+        return {"result": "error", "message": "No video file uploaded for this key"}
+    raw_path = mappings["raw_path"]
+    try:
+        info = await run_in_threadpool(
+            single_flight.do, media_probe_job(raw_path), lambda progress: probe_video(raw_path)
+        )
+    except PSNRError as e:
+        return {"result": "error", "message": str(e)}
+    return {"result": "ok", "data": info}
+
 @app.get("/reset_all")
 def reset_all(key: str):
     """
@@ -352,11 +815,7 @@ def reset_all(key: str):
     """
     try:
         validate_key(key)
-        flows = flow_instances[key]
-        
-        flows['encode_flow'].reset()
-        flows['decode_flow'].reset()
-        flows['vector_search_flow'].reset()
+        reset_flows(key)
         
         return {"result": "ok", "message": f"All flows for key '{key}' have been reset."}
     except Exception as e:
@@ -372,7 +831,6 @@ async def start_encode(request: Request):
     try:
         body = await request.json()
         key = validate_key(body.get("key"))
-        flows = flow_instances[key]
         
         filename: str = body.get("filename")
         if not filename:
@@ -381,12 +839,10 @@ async def start_encode(request: Request):
         base_name = os.path.splitext(filename)[0]
         
         # Only reset if filename is different from current one
-        if flows['encode_flow'].uploaded_filename != base_name:
-            flows['encode_flow'].reset()
-            flows['decode_flow'].reset()
-            flows['vector_search_flow'].reset()
+        if session_store.get_uploaded_filename(key) != base_name:
+            reset_flows(key)
         
-        flows['encode_flow'].start_encode(base_name)
+        start_owned_flow(key, 'encode_flow', lambda flow: flow.start_encode(base_name))
         return {"result": "ok"}
 
     except FlowError as e:
@@ -397,17 +853,16 @@ async def start_encode(request: Request):
 @app.get("/poll_encode_started")
 def poll_encode_started(key: str):
     validate_key(key)
-    flows = flow_instances[key]
-    result = flows['encode_flow'].get_start_time()
+    result = get_flow_status(key, 'encode_flow')["start_time"]
     return {"result": result}
 
 @app.get("/poll_encode")
 def poll_encode(key: str):
     validate_key(key)
-    flows = flow_instances[key]
+    status = get_flow_status(key, 'encode_flow')
     
-    end_time = flows['encode_flow'].get_end_time()
-    start_time = flows['encode_flow'].get_start_time()
+    end_time = status["end_time"]
+    start_time = status["start_time"]
 
     if start_time is None:
         return {
@@ -427,11 +882,13 @@ def poll_encode(key: str):
     }
 
 @app.get("/metadata_encode")
-def metadata_encode(key: str):
+def metadata_encode(key: str, request: Request):
     validate_key(key)
-    flows = flow_instances[key]
-    result = flows['encode_flow'].get_metadata()
-    return {"result": result}
+    frozen = get_owned_frozen_response(key, 'encode_flow')
+    if frozen:
+        return frozen_json_response(request, frozen)
+    status = get_flow_status(key, 'encode_flow')
+    return {"result": with_resources(status["metadata"], status)}
 
 @app.post("/reset_encode")
 async def reset_encode(request: Request):
@@ -441,20 +898,10 @@ async def reset_encode(request: Request):
     try:
         body = await request.json()
         key = validate_key(body.get("key"))
-        flows = flow_instances[key]
-        
-        # Preserve the currently uploaded filename
-        current_filename = flows['uploaded_filename']
-
-        # Reset all stateful flow objects for this key
-        flows['encode_flow'].reset()
-        flows['decode_flow'].reset()
-        flows['vector_search_flow'].reset()
 
-        # Restore the filename
-        if current_filename:
-            flows['encode_flow'].uploaded_filename = current_filename
-            flows['uploaded_filename'] = current_filename
+        # Reset all stateful flow objects for this key; the uploaded
+        # filename lives in the session and is preserved
+        reset_flows(key)
 
         return {
             "result": "ok",
@@ -474,9 +921,8 @@ async def encode_and_psnr(request: Request):
     try:
         body = await request.json()
         key = validate_key(body.get("key"))
-        flows = flow_instances[key]
        
-        filename = flows['uploaded_filename']
+        filename = session_store.get_uploaded_filename(key)
        
         if not filename:
             return {"result": "error", "message": "No video file uploaded for this key"}
@@ -487,9 +933,16 @@ async def encode_and_psnr(request: Request):
        
         print(f"Starting multi-codec encoding for key '{key}'")
        
-        # Use the enhanced process_video function with better error handling
+        # Use the enhanced process_video function with better error handling.
+        # Concurrent requests for the same scene share a single run.
+        raw_path = mappings["raw_path"]
         try:
-            result = process_video(mappings["raw_path"], DATA_DIR)
+            result = await run_in_threadpool(
+                single_flight.do,
+                codec_comparison_job(raw_path),
+                lambda progress: process_video(raw_path, DATA_DIR, progress_callback=progress),
+                codec_outputs_exist,
+            )
         except PSNRError as e:
             return {"result": "error", "message": f"PSNR calculation failed: {str(e)}"}
         except Exception as e:
@@ -556,21 +1009,44 @@ async def encode_and_psnr(request: Request):
     except Exception as e:
         return {"result": "error", "message": f"Unexpected error: {str(e)}"}
 
+@app.get("/poll_encode_and_psnr")
+def poll_encode_and_psnr(key: str):
+    """
+    Progress of the codec comparison running for this key's scene, shared by
+    every request attached to it. Returns null when no comparison is running.
+    """
+    validate_key(key)
+    filename = session_store.get_uploaded_filename(key)
+    mappings = MAPPINGS.get_video_model_paths(filename) if filename else None
+    if not mappings:
+        return {"result": None}
+    return {"result": single_flight.get_progress(codec_comparison_job(mappings["raw_path"]))}
+
 # ==============================================================================
 # 6. DECODE & HLS STREAMING ENDPOINTS
 # ==============================================================================
 
 @app.get("/start_decode")
-async def start_decode(key: str):
+async def start_decode(key: str, index: bool = INDEX_DURING_DECODE):
+    """
+    Start decoding the uploaded video. With index=true the embedding index
+    for vector search is built from the decoded segments as they land.
+    """
     try:
         validate_key(key)
-        flows = flow_instances[key]
+        uploaded_filename = session_store.get_uploaded_filename(key)
         
-        if not flows['uploaded_filename'] or flows['uploaded_filename'] == "":
+        if not uploaded_filename:
             return {"result": "error", "message": "No filename available for decode"}
         
-        flows['decode_flow'].start_decode(flows['uploaded_filename'])
-        return {"result": "ok"}
+        # Requests for a decode that is already running attach to it
+        attached = start_owned_flow(
+            key, 'decode_flow', lambda flow: flow.start_decode(uploaded_filename), attach=True
+        )
+        # The feed picks up the segments the decode already wrote
+        if index:
+            start_segment_feed(key, uploaded_filename)
+        return {"result": "ok", "attached": attached}
 
     except FlowError as e:
         return {"result": "error", "message": f"Flow error: {str(e)}"}
@@ -580,30 +1056,30 @@ async def start_decode(key: str):
 @app.get("/poll_decode_started")
 def poll_decode_started(key: str):
     validate_key(key)
-    flows = flow_instances[key]
-    result = flows['decode_flow'].get_start_time()
+    result = get_flow_status(key, 'decode_flow')["start_time"]
     return {"result": result}
 
 @app.get("/poll_decode")
 def poll_decode(key: str):
     validate_key(key)
-    flows = flow_instances[key]
+    status = get_flow_status(key, 'decode_flow')
     
-    result = flows['decode_flow'].get_end_time()
     return {
         "result": {
-            "end_time": result,
-            "eta": flows['decode_flow'].get_decode_eta_seconds(),
-            "progress": flows['decode_flow'].get_decode_progress(),
+            "end_time": status["end_time"],
+            "eta": status["eta"],
+            "progress": status["progress"],
         }
     }
 
 @app.get("/metadata_decode")
-def metadata_decode(key: str):
+def metadata_decode(key: str, request: Request):
     validate_key(key)
-    flows = flow_instances[key]
-    result = flows['decode_flow'].get_metadata()
-    return {"result": result}
+    frozen = get_owned_frozen_response(key, 'decode_flow')
+    if frozen:
+        return frozen_json_response(request, frozen)
+    status = get_flow_status(key, 'decode_flow')
+    return {"result": with_resources(status["metadata"], status)}
 
 @app.post("/reset_decode")
 async def reset_decode(request: Request):
@@ -613,11 +1089,9 @@ async def reset_decode(request: Request):
     try:
         body = await request.json()
         key = validate_key(body.get("key"))
-        flows = flow_instances[key]
         
         # Reset only the decode flow's internal state
-        flows['decode_flow'].reset()
-        flows['vector_search_flow'].reset()
+        reset_flows(key, ('decode_flow', 'vector_search_flow'))
 
         return {
             "result": "ok",
@@ -629,6 +1103,91 @@ async def reset_decode(request: Request):
             detail=f"An error occurred while resetting the decode flow: {str(e)}"
         )
 
+@app.post("/start_pipeline")
+async def start_pipeline(request: Request):
+    """
+    Encode and decode the uploaded video as one pipeline: the decoder starts
+    on the first encoded batch and follows the encoder, which is paused when
+    it runs too far ahead.
+    """
+    try:
+        body = await request.json()
+        key = validate_key(body.get("key"))
+        uploaded_filename = session_store.get_uploaded_filename(key)
+        if not uploaded_filename:
+            return {"result": "error", "message": "No filename available for the pipeline"}
+        
+        reset_flows(key, ('encode_flow', 'decode_flow', 'vector_search_flow'))
+        flows = get_or_create_flows(key)
+        for flow_name in ('encode_flow', 'decode_flow'):
+            if not session_store.claim_flow(key, flow_name):
+                if flow_name == 'decode_flow':
+                    session_store.release_flow(key, 'encode_flow')
+                return {"result": "error", "message": f"{flow_name} is busy on another worker"}
+        
+        index = body.get("index", INDEX_DURING_DECODE)
+        handoff_path = DATA_DIR / uploaded_filename / HANDOFF_NAME
+        pipeline = StreamHandoff(
+            flows['encode_flow'],
+            flows['decode_flow'],
+            uploaded_filename,
+            handoff_path,
+            start_decode=lambda: start_owned_flow(
+                key, 'decode_flow',
+                lambda flow: flow.start_decode(uploaded_filename, stream_from=str(handoff_path)),
+            ),
+        )
+        pipelines[key] = pipeline
+        try:
+            if index:
+                start_segment_feed(key, uploaded_filename)
+            pipeline.start()
+        except Exception:
+            # Drop the pipeline, its feed and the flow claims; resetting the flows does all three
+            reset_flows(key, ('encode_flow', 'decode_flow') + (('index_flow',) if index else ()))
+            raise
+        return {"result": "ok"}
+
+    except FlowError as e:
+        return {"result": "error", "message": f"Flow error: {str(e)}"}
+    except Exception as e:
+        return {"result": "error", "message": f"Unexpected error: {str(e)}"}
+
+@app.get("/poll_pipeline")
+def poll_pipeline(key: str):
+    """Report the handoff between encoder and decoder and how long the first decoded segment took."""
+    validate_key(key)
+    encode_status = get_flow_status(key, 'encode_flow')
+    decode_status = get_flow_status(key, 'decode_flow')
+    return {
+        "result": {
+            "handoff": encode_status.get("handoff"),
+            "encoded_batches": encode_status.get("encoded_batches"),
+            "decode_progress": decode_status["progress"],
+            "encode_finished": encode_status["finished"],
+            "decode_finished": decode_status["finished"],
+            "error": encode_status["error"] or decode_status["error"],
+        }
+    }
+
+@app.get("/poll_index")
+def poll_index(key: str):
+    """Progress of the embedding index built from decoded segments."""
+    validate_key(key)
+    status = get_flow_status(key, 'index_flow')
+    feed = segment_feeds.get(key)
+    return {
+        "result": {
+            "started": status["started"],
+            "finished": status["finished"],
+            "error": status["error"],
+            "indexed_segments": status["indexed_segments"],
+            "processed_frames": status["processed_frames"],
+            "published_segments": feed.get_status()["published_segments"] if feed else None,
+            "metadata": with_resources(status["metadata"], status),
+        }
+    }
+
 @app.get("/hls/{video_name}/decoded/stream.m3u8")
 def combined_playlist(video_name: str, key: str = None):
     """
@@ -641,11 +1200,7 @@ def combined_playlist(video_name: str, key: str = None):
     # If no key provided, try to find a key that matches the video_name
     if not key:
         # Look for a key that has this video_name as uploaded_filename
-        matching_key = None
-        for k, flows in flow_instances.items():
-            if flows['uploaded_filename'] == video_name:
-                matching_key = k
-                break
+        matching_key = session_store.find_key_by_filename(video_name)
         
         if not matching_key:
             raise HTTPException(
@@ -714,14 +1269,14 @@ async def upload_vector_image(request: Request, file: UploadFile = File(...)):
         form_data = await request.form()
         key = form_data.get("key")
         validate_key(key)
-        flows = flow_instances[key]
+        uploaded_filename = session_store.get_uploaded_filename(key)
 
         # Ensure a video has been uploaded for this session to create a directory
-        if not flows['uploaded_filename']:
+        if not uploaded_filename:
             raise HTTPException(status_code=400, detail=f"No video uploaded for key '{key}'. Please upload a video first.")
 
         # Define the target directory inside DATA_DIR using the video's base name
-        session_dir = DATA_DIR / flows['uploaded_filename']
+        session_dir = DATA_DIR / uploaded_filename
         session_dir.mkdir(parents=True, exist_ok=True) # Ensure the directory exists
 
         # Define the final path for the image file within the session directory
@@ -736,13 +1291,56 @@ async def upload_vector_image(request: Request, file: UploadFile = File(...)):
             "result": "ok", 
             "filename": file.filename, 
             "path": str(file_location), 
-            "video_path": flows['uploaded_filename']
+            "video_path": uploaded_filename
         }
     except HTTPException as e:
         # Re-raise HTTPExceptions to preserve status code and detail
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save image: {str(e)}")
+
+@app.post("/upload_vector_images")
+async def upload_vector_images(key: str = Form(...), files: List[UploadFile] = File(...)):
+    """
+    Upload a batch of search images. Each is written to the session's data
+    directory off the event loop and queued for normalizing and embedding,
+    so a search started on them only has to match.
+    """
+    validate_key(key)
+    if not files:
+        raise HTTPException(status_code=400, detail="At least one image is required.")
+    for file in files:
+        if not (file.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"Only image files are allowed: {file.filename}")
+
+    uploaded_filename = session_store.get_uploaded_filename(key)
+    if not uploaded_filename:
+        raise HTTPException(status_code=400, detail=f"No video uploaded for key '{key}'. Please upload a video first.")
+
+    session_dir = DATA_DIR / uploaded_filename
+    session_dir.mkdir(parents=True, exist_ok=True)
+
+    ingest = INGEST_SCREENSHOTS and search_can_use_query_cache(key, uploaded_filename)
+    saved = []
+    try:
+        for file in files:
+            file_location = session_dir / Path(file.filename).name
+            with open(file_location, "wb") as out:
+                await run_in_threadpool(shutil.copyfileobj, file.file, out, 1024 * 1024)
+            if ingest:
+                screenshot_ingestor.submit(key, str(file_location))
+            saved.append({"filename": file.filename, "path": str(file_location)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save image: {str(e)}")
+
+    return {"result": "ok", "images": saved, "video_path": uploaded_filename, "ingesting": ingest}
+
+@app.get("/poll_vector_images")
+def poll_vector_images(key: str):
+    """Ingestion state of the images uploaded through /upload_vector_images."""
+    validate_key(key)
+    return {"result": "ok", **screenshot_ingestor.get_status(key)}
+
 @app.post("/start_vector_search")
 async def start_vector_search(request: Request):
     """
@@ -751,9 +1349,8 @@ async def start_vector_search(request: Request):
     try:
         body = await request.json()
         key = validate_key(body.get("key"))
-        flows = flow_instances[key]
         
-        flows['vector_search_flow'].reset()
+        reset_flow(key, 'vector_search_flow')
         
         video_path = body.get("video_path")
         images_path = body.get("images_path")
@@ -761,8 +1358,26 @@ async def start_vector_search(request: Request):
         if not video_path or not images_path:
             return {"result": "error", "message": "video_path and images_path parameters are required"}
         
-        flows['vector_search_flow'].start_search(video_path, images_path)
-        return {"result": "ok"}
+        refine = bool(body.get("refine", REFINE_SEARCH_HITS))
+        # Images ingested at upload time are already in the query cache
+        cache_queries = bool(body.get(
+            "cache_queries", CACHE_QUERY_EMBEDDINGS or screenshot_ingestor.is_ingested(key, images_path)
+        ))
+        
+        # Reuse the index built while decoding, if there is one
+        index_dir = completed_index_dir(key, video_path)
+        if index_dir is None and body.get("sharded", SHARDED_PREPROCESSING):
+            adaptive = bool(body.get("adaptive", ADAPTIVE_SAMPLING))
+            start_search_after_index(
+                key, video_path, images_path, body.get("shards"), adaptive, refine,
+                body.get("quantize", INDEX_QUANTIZATION), cache_queries,
+            )
+            return {"result": "ok", "prebuilt_index": False, "sharded": True, "adaptive": adaptive, "refine": refine}
+        start_owned_flow(
+            key, 'vector_search_flow',
+            lambda flow: flow.start_search(video_path, images_path, index_dir, refine, cache_queries),
+        )
+        return {"result": "ok", "prebuilt_index": index_dir is not None, "refine": refine}
     
     except FlowError as e:
         return {"result": "error", "message": f"Flow error: {str(e)}"}
@@ -775,38 +1390,119 @@ def poll_vector_search(key: str):
     Poll the status of vector search operation.
     """
     validate_key(key)
-    flows = flow_instances[key]
     
-    is_finished = flows['vector_search_flow'].is_search_finished()
+    status = get_flow_status(key, 'vector_search_flow')
+    is_finished = status["finished"]
     return {
         "result": {
             "finished": is_finished,
-            "in_progress": not is_finished
+            "in_progress": not is_finished,
+            "completed_queries": len(status.get("results") or []),
+            "total_queries": status.get("total_queries"),
         }
     }
 
+@app.get("/vector_search_partial_results")
+def vector_search_partial_results(key: str, since: int = 0, refined_since: int = 0):
+    """
+    Results of the queries completed since the cursor, while the search runs.
+    Pass the returned next_cursor as since and next_refined_cursor as
+    refined_since on the next call. Hits of earlier queries that were
+    refined since are listed under "refined".
+    """
+    validate_key(key)
+    if since < 0 or refined_since < 0:
+        raise HTTPException(status_code=400, detail="Cursors must not be negative")
+    
+    status = get_flow_status(key, 'vector_search_flow')
+    results = status.get("results") or []
+    refined = [
+        {"query": query, "rank": rank, **hit}
+        for query, item in enumerate(results[:since])
+        for rank, hit in enumerate(item.get("top_results", []))
+        if hit.get("refined_seq", 0) > refined_since
+    ]
+    # Refinements of the hits in data are already applied to them
+    next_refined_cursor = max(
+        (hit.get("refined_seq", 0) for item in results for hit in item.get("top_results", [])),
+        default=0,
+    )
+    return {
+        "result": "ok",
+        "finished": status["finished"],
+        "error": status["error"],
+        "data": results[since:],
+        "refined": refined,
+        "next_cursor": len(results),
+        "next_refined_cursor": max(next_refined_cursor, refined_since),
+        "total_queries": status.get("total_queries"),
+    }
+
 @app.get("/vector_search_results")
-def vector_search_results(key: str):
+def vector_search_results(key: str, request: Request):
     """
     Get vector search results.
+    Finished searches are served from the response frozen at completion.
     """
     validate_key(key)
-    flows = flow_instances[key]
     
-    results = flows['vector_search_flow'].get_results()
-    if not results:
-        return {"result": "no_results", "message": "No results available yet"}
+    frozen = get_owned_frozen_response(key, 'vector_search_flow')
+    if frozen:
+        return frozen_json_response(request, frozen)
     
-    data = []
-    for item in results:
-        for result in item["top_results"]:
-            result["timestamp"] = result["timestamp"] * (30/7)
-        data.append(item)
+    status = get_flow_status(key, 'vector_search_flow')
+    if not status["results"]:
+        return {"result": "no_results", "message": "No results available yet"}
     
     return {
         "result": "ok", 
-        "data": data, 
-        "metadata": flows['vector_search_flow'].get_preprocessing_info()
+        "data": status["results"], 
+        "metadata": with_resources(status["metadata"], status)
+    }
+
+@app.post("/start_cross_video_search")
+async def start_cross_video_search(request: Request):
+    """
+    Search screenshots against every indexed video at once, or the videos
+    listed in "videos". Each hit carries the video_id it was found in.
+    """
+    try:
+        body = await request.json()
+        key = validate_key(body.get("key"))
+        images_path = body.get("images_path")
+        if not images_path:
+            return {"result": "error", "message": "images_path parameter is required"}
+        
+        reset_flow(key, 'cross_search_flow')
+        videos, k = body.get("videos"), body.get("k")
+        start_owned_flow(key, 'cross_search_flow', lambda flow: flow.start_search(images_path, videos, k))
+        return {"result": "ok"}
+    
+    except FlowError as e:
+        return {"result": "error", "message": f"Flow error: {str(e)}"}
+    except Exception as e:
+        return {"result": "error", "message": f"Unexpected error: {str(e)}"}
+
+@app.get("/cross_video_search_results")
+def cross_video_search_results(key: str, request: Request):
+    """
+    Progress and results of a cross-video search.
+    Finished searches are served from the response frozen at completion.
+    """
+    validate_key(key)
+    
+    frozen = get_owned_frozen_response(key, 'cross_search_flow')
+    if frozen:
+        return frozen_json_response(request, frozen)
+    
+    status = get_flow_status(key, 'cross_search_flow')
+    return {
+        "result": "ok" if status["results"] else "no_results",
+        "finished": status["finished"],
+        "error": status["error"],
+        "videos": status["videos"],
+        "data": status["results"],
+        "metadata": with_resources(status["metadata"], status),
     }
 
 
@@ -817,6 +1513,45 @@ def vector_search_results(key: str):
 @app.get("/")
 def read_root():
     return {"message": "Hello, World"}
+
+@app.get("/janitor_stats")
+def janitor_stats():
+    """
+    Report session evictions and bytes reclaimed from DATA_DIR by the janitor.
+    """
+    return {"result": "ok", "data": janitor.get_stats()}
+
+@app.get("/resource_usage")
+def resource_usage(key: str):
+    """
+    Report CPU time, peak RSS, I/O bytes and context switches of each flow's
+    subprocess tree for a key; live while a flow runs, final once it finished.
+    """
+    validate_key(key)
+    return {
+        "result": "ok",
+        "data": {flow_name: get_flow_status(key, flow_name)["resources"] for flow_name in FLOW_CLASSES},
+    }
+
+@app.get("/reaper_stats")
+def reaper_stats():
+    """
+    Report leaked flow processes reaped by this worker and the resources they held.
+    """
+    return {"result": "ok", "data": process_reaper.get_stats()}
+
+@app.get("/speculative_status")
+def speculative_status(key: str):
+    """
+    State of the speculative jobs queued for a key's video on this worker.
+    """
+    validate_key(key)
+    return {
+        "result": "ok",
+        "enabled": SPECULATIVE_PRECOMPUTE,
+        "jobs": speculative.get_status(key),
+        "scheduler": speculative.get_stats(),
+    }
 from starlette.status import HTTP_206_PARTIAL_CONTENT
 
 @app.get("/stream/{file_path:path}")
@@ -882,4 +1617,141 @@ async def stream_video(file_path: str, key: str, request: Request):
             "Content-Length": str(file_size),
             "Accept-Ranges": "bytes",
         },
-    )
\ No newline at end of file
+    )
+
+def session_video_path(key: str, file_path: str) -> Optional[str]:
+    """
+    The session's source video or one of its encodes in DATA_DIR, if
+    file_path names one of them; keyframe indexes are built only for those.
+    """
+    filename = session_store.get_uploaded_filename(key)
+    mapping = MAPPINGS.get_video_model_paths(filename) if filename else None
+    if not mapping:
+        return None
+    path = Path(file_path).resolve()
+    source = Path(mapping["raw_path"]).resolve()
+    is_encode = path.parent == DATA_DIR.resolve() and path.name.startswith(f"{source.stem}_")
+    if (path == source or is_encode) and path.is_file():
+        return str(path)
+    return None
+
+@app.get("/keyframes/{file_path:path}")
+async def keyframes(file_path: str, key: str, t: Optional[float] = None):
+    """
+    Keyframe index (timestamp, byte offset, frame number) of a video, built
+    on first use and cached. With t, only the keyframe a seek to t starts
+    decoding at and the byte range of its GOP. The range can be decoded on
+    its own only in MPEG-TS; other containers also need their headers
+    (e.g. an MP4's moov box), which a player reads through /stream.
+    """
+    validate_key(key)
+
+    video_path = await run_in_threadpool(session_video_path, key, file_path)
+    if video_path is None:
+        raise HTTPException(status_code=404, detail="Not a video of this session")
+    try:
+        index = await run_in_threadpool(get_keyframe_index, video_path)
+    except PSNRError as e:
+        return {"result": "error", "message": str(e)}
+
+    if t is None:
+        return {"result": "ok", "data": index}
+    position = keyframe_at(index, t)
+    if position is None:
+        return {"result": "error", "message": f"No keyframe at or before {t}s"}
+    start, end = gop_byte_range(index, t, os.path.getsize(video_path))
+    return {"result": "ok", "data": {**index[position], "byte_range": [start, end]}}
+
+
+# ==============================================================================
+# 9. CONSOLIDATED STATUS ENDPOINT
+# ==============================================================================
+
+STATUS_FLOWS = {
+    "encode": "encode_flow",
+    "decode": "decode_flow",
+    "vector_search": "vector_search_flow",
+    "index": "index_flow",
+    "cross_search": "cross_search_flow",
+}
+STATUS_MAX_TIMEOUT = 60.0
+STATUS_IDLE_RETRY_S = 5.0
+STATUS_MIN_RETRY_S = 0.5
+# Changes published by other workers are picked up at this interval
+STATUS_STORE_POLL_S = 0.25
+
+def suggest_retry_interval(key_list) -> float:
+    """
+    Suggest how long a client should wait before polling again.
+    Idle sessions poll slowly; running flows poll at a tenth of their ETA.
+    """
+    interval = STATUS_IDLE_RETRY_S
+    for key in key_list:
+        for flow_name in STATUS_FLOWS.values():
+            status = session_store.get_flow_status(key, flow_name)
+            if not status or not status["started"] or status["finished"]:
+                continue
+            eta = status.get("eta")
+            if isinstance(eta, (int, float)):
+                flow_interval = min(max(eta / 10, STATUS_MIN_RETRY_S), STATUS_IDLE_RETRY_S)
+            else:
+                flow_interval = 1.0
+            interval = min(interval, flow_interval)
+    return interval
+
+def collect_status_changes(key_list, since_version: int):
+    """Collect the status fields of every flow of every key that changed after since_version."""
+    changes: Dict[str, Any] = {}
+    stored_changes = session_store.get_status_changes(key_list, since_version)
+    for key in key_list:
+        if not session_store.session_exists(key):
+            changes[key] = None
+            continue
+        key_changes = {
+            status_name: stored_changes[key][flow_name]
+            for status_name, flow_name in STATUS_FLOWS.items()
+            if flow_name in stored_changes.get(key, {})
+        }
+        if key_changes:
+            changes[key] = key_changes
+    version = max(since_version, session_store.get_status_version(key_list))
+    return version, changes
+
+@app.get("/status")
+async def status(keys: str, since_version: int = 0, timeout: float = 25.0):
+    """
+    Long-poll the encode, decode and vector search state of one or more keys.
+
+    `keys` is a comma-separated list of keys. The call blocks until a field
+    changes after `since_version` or `timeout` seconds pass, and returns only
+    the changed fields. Pass the returned `version` as the next `since_version`;
+    `since_version=0` returns the full snapshot. A key that was removed while
+    waiting is reported as null. Waiting clients hold no worker thread; only
+    the store reads between waits run in the threadpool.
+    """
+    key_list = [validate_key(k.strip()) for k in keys.split(",") if k.strip()]
+    if not key_list:
+        raise HTTPException(status_code=400, detail="At least one key is required")
+
+    # A client holding a version from another store gets a full snapshot
+    if since_version > await run_in_threadpool(session_store.get_status_version):
+        since_version = 0
+
+    deadline = time.monotonic() + min(max(timeout, 0.0), STATUS_MAX_TIMEOUT)
+    while True:
+        observed = current_status_version()
+        version, changes = await run_in_threadpool(collect_status_changes, key_list, since_version)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        # Local flows wake us immediately; other workers' flows are seen on the next pass
+        await wait_for_status_change_async(observed, min(remaining, STATUS_STORE_POLL_S))
+
+    retry_after = await run_in_threadpool(suggest_retry_interval, key_list)
+    return {
+        "result": "ok",
+        "version": version,
+        "changed": bool(changes),
+        "retry_after": retry_after,
+        "data": changes,
+    }
@@ -3,17 +3,28 @@ Base flow class with common subprocess management and error handling.
 This eliminates code duplication across flow classes.
 """
 
+import asyncio
 import subprocess
 import json
 import threading
 import logging
 import os
 import time
-from typing import Optional, Any, Dict, List, Callable
+import itertools
+import hashlib
+from typing import Optional, Any, Dict, List, Callable, Set, Tuple
 from abc import ABC, abstractmethod
 from pathlib import Path
 from contextlib import contextmanager
 
+from .event_channel import EVENT_FD_ENV, MIRROR_PREFIX, read_frames
+from .event_schemas import decode_event, validate_event
+from .process_tree import (
+    THREAD_ENV_VARS, ResourceMonitor, allocate_cores, release_cores, apply_process_limits,
+    terminate_process_group, process_group_alive, track_session, release_session,
+    process_start_time, is_same_process, resume_process_group,
+)
+
 
 class FlowError(Exception):
     """Custom exception for flow-related errors."""
@@ -25,12 +36,105 @@ class ProcessTimeoutError(FlowError):
     pass
 
 
+# Status versioning shared by all flows. Every observable change to any flow
+# gets a new, process-wide monotonically increasing version, so a client can
+# ask "what changed since version N" across several flows and keys at once.
+_status_versions = itertools.count(1)
+_status_condition = threading.Condition()
+_status_version = 0
+# Futures of async waiters, resolved on their event loop by the next change
+_status_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+_UNSET = object()
+
+
+def is_process_alive(pid: Optional[int]) -> bool:
+    """Check whether a process with the given PID exists on this host."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def freeze_response(payload: Any) -> Tuple[bytes, str]:
+    """Serialize a response payload once and return (body, etag)."""
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return body, etag
+
+
+def current_status_version() -> int:
+    """Return the latest status version issued to any flow."""
+    with _status_condition:
+        return _status_version
+
+
+def wait_for_status_change(since_version: int, timeout: float) -> int:
+    """Block until any flow publishes a version newer than since_version or the timeout passes."""
+    with _status_condition:
+        _status_condition.wait_for(lambda: _status_version > since_version, timeout=timeout)
+        return _status_version
+
+
+async def wait_for_status_change_async(since_version: int, timeout: float) -> int:
+    """Like wait_for_status_change, without holding a thread while waiting."""
+    loop = asyncio.get_running_loop()
+    waiter = (loop, loop.create_future())
+    with _status_condition:
+        if _status_version > since_version:
+            return _status_version
+        _status_waiters.add(waiter)
+    try:
+        await asyncio.wait_for(waiter[1], timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with _status_condition:
+            _status_waiters.discard(waiter)
+    return current_status_version()
+
+
+def _wake_status_waiters() -> None:
+    """Resolve every async waiter; called with _status_condition held."""
+    for loop, future in _status_waiters:
+        try:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+        except RuntimeError:
+            # The waiter's loop has closed
+            pass
+    _status_waiters.clear()
+
+
 class BaseFlow(ABC):
     """Base class for all flow operations with robust error handling."""
     
+    # Log type that marks a successful run; used to judge adopted processes
+    completion_event: Optional[str] = None
+    
+    # Resources granted to the subprocess tree at spawn:
+    #   cpu_fraction: share of the worker's cores it is pinned to; thread
+    #                 pools are capped to the same number of cores
+    #   nice: scheduling niceness
+    #   max_address_space_bytes, max_data_bytes: RLIMIT_AS / RLIMIT_DATA
+    resource_profile: Dict[str, Any] = {}
+    
+    # Offer the subprocess a framed event pipe (see event_channel); scripts
+    # that don't use it keep reporting JSON lines on stdout
+    event_channel = True
+    
+    # Event type -> name of the method handling it (see _process_log_line)
+    event_handlers: Dict[str, str] = {}
+    
     def   __init__(self, name: str, timeout: Optional[float] = None):
         self.name = name
         self.timeout = timeout or 300.0  # 5 minute default timeout
+        # Time the subprocess spent stopped doesn't count towards the timeout
+        self._timeout_paused_s = 0.0
+        self._timeout_paused_since: Optional[float] = None
         
         # State management
         self._logs: List[Dict[str, Any]] = []
@@ -39,12 +143,41 @@ class BaseFlow(ABC):
         self._finished = False
         self._lock = threading.RLock()  # Use RLock to prevent deadlocks
         self._process: Optional[subprocess.Popen] = None
+        self._adopted_pid: Optional[int] = None
+        self._adopted_since = 0.0
+        # /proc start time of the adopted process, telling it apart from a later one with its PID
+        self._adopted_started_at: Optional[float] = None
+        self._resource_monitor: Optional[ResourceMonitor] = None
+        self._cores: Optional[List[int]] = None
+        self._event_reader: Optional[threading.Thread] = None
         self._error: Optional[Exception] = None
         
         # Timing
         self.start_time: Optional[float] = None
         self.end_time: Optional[float] = None
         
+        # Resource usage of the subprocess tree (see get_resource_usage)
+        self.resource_usage: Optional[Dict[str, Any]] = None
+        
+        # Versioned status snapshot (see get_status_delta)
+        self._status_values: Dict[str, Any] = {}
+        self._field_versions: Dict[str, int] = {}
+        
+        self._status_listeners: List[Callable[["BaseFlow", Dict[str, Any]], None]] = []
+        
+        # Result frozen at successful completion (see get_frozen_response)
+        self._frozen_response: Optional[Tuple[bytes, str]] = None
+        
+        # Durable journal (see enable_journal)
+        self.journal_path: Optional[Path] = None
+        self._journal_lock = threading.Lock()
+        self._start_args: Tuple[List[Any], Dict[str, Any]] = ([], {})
+        
+        # Bound event handlers, looked up once per event type
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            event_type: getattr(self, method) for event_type, method in self.event_handlers.items()
+        }
+        
         # Setup logging
         self.logger = logging.getLogger(f"{self.__class__.__name__}")
         
@@ -53,15 +186,20 @@ class BaseFlow(ABC):
         """Build the command to execute. Must be implemented by subclasses."""
         pass
     
-    @abstractmethod
     def _process_log_line(self, log_obj: Dict[str, Any]) -> None:
-        """Process a parsed JSON log line. Must be implemented by subclasses."""
-        pass
+        """Dispatch a parsed JSON log line to the handler registered for its type."""
+        handler = self._handlers.get(log_obj.get("type"))
+        if handler:
+            handler(log_obj)
     
     def _validate_inputs(self, *args, **kwargs) -> None:
         """Validate inputs before starting. Override in subclasses if needed."""
         pass
     
+    def _restore_inputs(self, *args, **kwargs) -> None:
+        """Restore input attributes from journaled start arguments. Override in subclasses if needed."""
+        pass
+    
     def start(self, *args, **kwargs) -> None:
         """Start the flow operation."""
         with self._lock:
@@ -80,6 +218,8 @@ class BaseFlow(ABC):
             
             # Reset state for new run
             self._reset_state()
+            self._start_args = (list(args), dict(kwargs))
+            self._journal("start", truncate=True, args=list(args), kwargs=kwargs)
             
             # Start the thread
             self._thread = threading.Thread(
@@ -90,6 +230,8 @@ class BaseFlow(ABC):
             )
             self._started = True
             self._thread.start()
+        
+        self._mark_changed()
     
     def _reset_state(self) -> None:
         """Reset internal state for a new run."""
@@ -98,16 +240,32 @@ class BaseFlow(ABC):
         self._error = None
         self.start_time = None
         self.end_time = None
+        self.resource_usage = None
+        self._frozen_response = None
+        self._timeout_paused_s = 0.0
+        self._timeout_paused_since = None
     
     def _run_with_error_handling(self, *args, **kwargs) -> None:
         """Wrapper that handles all errors during execution."""
+        self._run_guarded(self._run_flow, *args, **kwargs)
+    
+    def _run_guarded(self, runner: Callable[..., None], *args, **kwargs) -> None:
+        """Run a flow body, recording any error and freezing the result on success."""
         try:
-            self._run_flow(*args, **kwargs)
+            runner(*args, **kwargs)
+            self._freeze_result()
         except Exception as e:
             with self._lock:
                 self._error = e
                 self._finished = True
             self.logger.error(f"{self.name} failed: {e}")
+        finally:
+            self._journal(
+                "finish", sync=True,
+                error=str(self._error) if self._error else None,
+                resources=self.resource_usage,
+            )
+            self._mark_changed()
     
     def _run_flow(self, *args, **kwargs) -> None:
         """Main execution logic with robust error handling."""
@@ -115,58 +273,165 @@ class BaseFlow(ABC):
             # Build command
             cmd = self._build_command(*args, **kwargs)
             self.logger.info(f"Starting {self.name} with command: {' '.join(cmd)}")
+            log_path = self._get_output_log_path(*args, **kwargs)
             
             # Start process with timeout
-            with self._create_process(cmd) as process:
+            with self._create_process(cmd, log_path) as process:
                 self._process = process
                 self.start_time = time.time()
+                self._on_process_started(process.pid, log_path)
+                self._journal(
+                    "process", sync=True, pid=process.pid, process_started_at=process_start_time(process.pid),
+                    log_path=str(log_path) if log_path else None,
+                )
+                self._mark_changed()
                 
-                collected_logs = []
-                
-                # Process output with timeout
-                for line in self._read_output_with_timeout(process):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    try:
-                        log_obj = json.loads(line)
-                        if isinstance(log_obj, dict):
-                            collected_logs.append(log_obj)
-                            self._process_log_line(log_obj)
-                            self.logger.debug(f"Processed log: {log_obj.get('type', 'unknown')}")
-                    except json.JSONDecodeError:
-                        # Log non-JSON output for debugging
-                        self.logger.debug(f"Non-JSON output: {line}")
-                        continue
+                # Process output with timeout; mirrored events arrive through the channel
+                self._consume_output(
+                    self._read_output_with_timeout(process, log_path),
+                    skip_mirrored=self._event_reader is not None,
+                )
                 
                 # Wait for process completion
                 return_code = process.wait()
+                self._join_event_reader()
                 if return_code != 0:
                     raise FlowError(f"Process exited with code {return_code}")
+            self._on_process_completed()
                 
         except Exception as e:
             raise FlowError(f"{self.name} execution failed: {e}")
         finally:
             with self._lock:
-                self._logs = collected_logs
                 self.end_time = time.time()
                 self._finished = True
                 self._process = None
     
+    def _consume_output(self, lines, skip_mirrored: bool = False) -> None:
+        """
+        Parse JSON log lines from the subprocess and dispatch them. Events
+        mirrored from the event channel are skipped when the channel itself
+        is being read.
+        """
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(MIRROR_PREFIX):
+                if skip_mirrored:
+                    continue
+                line = line[len(MIRROR_PREFIX):]
+            
+            log_obj = decode_event(line)
+            if log_obj is not None:
+                self._dispatch_event(log_obj)
+    
+    def _dispatch_event(self, log_obj: Dict[str, Any]) -> None:
+        problem = validate_event(log_obj)
+        if problem:
+            # Handlers rely on the required keys, so the event is dropped
+            self.logger.warning(f"{self.name} dropped a malformed event: {problem}")
+            return
+        with self._lock:
+            self._logs.append(log_obj)
+        self._process_log_line(log_obj)
+        self._journal("log", data=log_obj)
+        self._mark_changed()
+    
+    def _read_event_channel(self, fd: int) -> None:
+        try:
+            for event in read_frames(fd):
+                self._dispatch_event(event)
+        except Exception as e:
+            self.logger.error(f"{self.name} event channel failed: {e}")
+    
+    def _join_event_reader(self, timeout: float = 5.0) -> None:
+        """Wait for the event channel to drain after the subprocess exited."""
+        reader, self._event_reader = self._event_reader, None
+        if reader:
+            reader.join(timeout)
+            if reader.is_alive():
+                self.logger.warning(f"{self.name} event channel still open after the process exited")
+    
+    def _get_output_log_path(self, *args, **kwargs) -> Optional[Path]:
+        """
+        File that receives the subprocess output instead of a pipe, so the
+        subprocess can outlive the server and be adopted. Journaled flows tee
+        their output next to the journal; override in subclasses if needed.
+        """
+        if self.journal_path:
+            return self.journal_path.with_suffix(".log")
+        return None
+    
+    def _on_process_started(self, pid: int, log_path: Optional[Path]) -> None:
+        """Hook called once the subprocess is running. Override in subclasses if needed."""
+        pass
+    
+    def _on_process_completed(self) -> None:
+        """
+        Hook called once the subprocess completed successfully, before the flow
+        is marked finished. Override in subclasses if needed.
+        """
+        pass
+    
     @contextmanager
-    def _create_process(self, cmd: List[str]):
+    def _create_process(self, cmd: List[str], log_path: Optional[Path] = None):
         """Create and manage subprocess with proper cleanup."""
         process = None
+        read_fd = write_fd = None
+        if self.resource_profile.get("cpu_fraction"):
+            self._cores = allocate_cores(self.resource_profile["cpu_fraction"])
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                shell=False,
-                env=self._get_environment()
-            )
+            env = self._get_environment()
+            pass_fds = ()
+            if self.event_channel:
+                read_fd, write_fd = os.pipe()
+                env[EVENT_FD_ENV] = str(write_fd)
+                pass_fds = (write_fd,)
+            
+            # Every subprocess leads its own session and process group, so its
+            # whole tree (data loaders, ffmpeg) can be killed together
+            if log_path:
+                # Output goes to a file, so it survives a server restart and
+                # can be adopted afterwards
+                log_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(log_path, "w") as log_file:
+                    process = subprocess.Popen(
+                        cmd,
+                        stdout=log_file,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                        shell=False,
+                        env=env,
+                        pass_fds=pass_fds,
+                        start_new_session=True
+                    )
+            else:
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    shell=False,
+                    env=env,
+                    pass_fds=pass_fds,
+                    start_new_session=True
+                )
+            if write_fd is not None:
+                # Only the subprocess tree writes; the reader sees EOF once it exits
+                os.close(write_fd)
+                write_fd = None
+                self._event_reader = threading.Thread(
+                    target=self._read_event_channel, args=(read_fd,), daemon=True
+                )
+                self._event_reader.start()
+                read_fd = None
+            self._apply_resource_profile(process.pid)
+            track_session(process.pid, self.name)
+            monitor = self._start_resource_monitor(process.pid)
+            threading.Thread(
+                target=self._watch_leader, args=(process, monitor, not log_path), daemon=True
+            ).start()
             yield process
         except Exception as e:
             self.logger.error(f"Failed to create process: {e}")
@@ -174,20 +439,89 @@ class BaseFlow(ABC):
         finally:
             if process:
                 self._cleanup_process(process)
+                self._stop_resource_monitor()
+            if self._cores:
+                release_cores(self._cores)
+                self._cores = None
+            for fd in (read_fd, write_fd):
+                if fd is not None:
+                    os.close(fd)
+    
+    def _watch_leader(self, process: subprocess.Popen, monitor: ResourceMonitor, kill_leftovers: bool) -> None:
+        """
+        Once the leader exits, take the final resource sample and, in pipe
+        mode, kill the children it left behind; they would otherwise hold the
+        output pipe open and block the reader forever.
+        """
+        try:
+            # Wait without reaping, so the final sample still sees the leader
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            pass
+        monitor.stop()
+        if kill_leftovers and process_group_alive(process.pid):
+            self.logger.warning(f"Terminating leftover {self.name} child processes...")
+            terminate_process_group(process.pid)
+    
+    def _start_resource_monitor(self, pid: int, not_before: float = 0.0) -> ResourceMonitor:
+        monitor = ResourceMonitor(pid, not_before)
+        monitor.start()
+        with self._lock:
+            self._resource_monitor = monitor
+        return monitor
+    
+    def _stop_resource_monitor(self) -> None:
+        """Stop sampling and keep the final usage."""
+        with self._lock:
+            monitor, self._resource_monitor = self._resource_monitor, None
+        if monitor:
+            monitor.stop()
+            self.resource_usage = monitor.get_usage()
+    
+    def get_resource_usage(self) -> Optional[Dict[str, Any]]:
+        """
+        CPU time, peak RSS, I/O bytes and context switches of the subprocess
+        tree; live while running, final once finished.
+        """
+        with self._lock:
+            monitor = self._resource_monitor
+            if not monitor:
+                return self.resource_usage
+        return monitor.get_usage()
+    
+    def _with_resources(self, metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Copy of a metadata dict with the resource usage of the run attached."""
+        if not isinstance(metadata, dict):
+            return metadata
+        return {**metadata, "resources": self.get_resource_usage()}
     
     def _get_environment(self) -> Dict[str, str]:
         """Get environment variables for the subprocess."""
         env = os.environ.copy()
-        # Add any common environment variables here
+        if self._cores:
+            # One thread per assigned core instead of one per machine core
+            for var in THREAD_ENV_VARS:
+                env[var] = str(len(self._cores))
         return env
     
-    def _read_output_with_timeout(self, process: subprocess.Popen):
+    def _apply_resource_profile(self, pid: int) -> None:
+        """Apply the core set, nice level and memory limits of the resource profile."""
+        try:
+            apply_process_limits(pid, self._cores, self.resource_profile)
+        except OSError as e:
+            self.logger.warning(f"Could not apply resource profile to {self.name} process {pid}: {e}")
+    
+    def _read_output_with_timeout(self, process: subprocess.Popen, log_path: Optional[Path] = None):
         """Read process output with timeout handling."""
+        if log_path:
+            yield from self._follow_log(log_path, lambda: process.poll() is None)
+            return
+        
         start_time = time.time()
         
         while True:
             # Check timeout
-            if time.time() - start_time > self.timeout:
+            if self._timed_out(start_time):
                 raise ProcessTimeoutError(f"{self.name} timed out after {self.timeout} seconds")
             
             # Check if process is still running
@@ -208,49 +542,287 @@ class BaseFlow(ABC):
                 self.logger.warning(f"Error reading output: {e}")
                 break
     
+    def pause_timeout(self) -> None:
+        """Stop counting time towards the timeout, e.g. while the subprocess is stopped."""
+        with self._lock:
+            if self._timeout_paused_since is None:
+                self._timeout_paused_since = time.time()
+    
+    def resume_timeout(self) -> None:
+        with self._lock:
+            if self._timeout_paused_since is not None:
+                self._timeout_paused_s += time.time() - self._timeout_paused_since
+                self._timeout_paused_since = None
+    
+    def _timed_out(self, start_time: float) -> bool:
+        with self._lock:
+            now = self._timeout_paused_since or time.time()
+            return now - start_time - self._timeout_paused_s > self.timeout
+    
+    def _is_run_complete(self) -> bool:
+        """Whether the logged events show a complete run. Override in subclasses if needed."""
+        if not self.completion_event:
+            return False
+        return any(log.get("type") == self.completion_event for log in self.get_logs())
+    
+    def _follow_log(self, log_path: Path, is_alive: Callable[[], bool]):
+        """Yield complete lines from a log file until its writer exits."""
+        start_time = time.time()
+        pending = ""
+        
+        with open(log_path, "r") as log_file:
+            while True:
+                if self._timed_out(start_time):
+                    raise ProcessTimeoutError(f"{self.name} timed out after {self.timeout} seconds")
+                
+                alive = is_alive()
+                chunk = log_file.readline()
+                if chunk:
+                    pending += chunk
+                    if pending.endswith("\n"):
+                        yield pending
+                        pending = ""
+                    continue
+                
+                if not alive:
+                    # The writer is gone and the file is drained
+                    if pending:
+                        yield pending
+                    break
+                time.sleep(0.1)  # Brief pause if no output
+    
+    def adopt(self, pid: int, log_path: Path, started_at: Optional[float] = None,
+              process_started_at: Optional[float] = None) -> None:
+        """
+        Supervise a subprocess started by an earlier server process.
+        Its log file is replayed from the start to rebuild the flow state.
+        process_started_at is the process's /proc start time, read now if not given;
+        the process is only waited on and signalled while its PID keeps it.
+        """
+        with self._lock:
+            if self._started and not self._finished:
+                raise FlowError(f"{self.name} already started and running")
+            
+            self._reset_state()
+            self._adopted_pid = pid
+            self._adopted_since = started_at or 0.0
+            self._adopted_started_at = process_started_at if process_started_at is not None else process_start_time(pid)
+            track_session(pid, self.name, not_before=self._adopted_since)
+            # A server that died while pausing the process (see stream_handoff) left it stopped
+            resume_process_group(pid)
+            args, kwargs = self._start_args
+            self._journal("start", truncate=True, args=args, kwargs=kwargs)
+            self._journal(
+                "process", sync=True, pid=pid, process_started_at=self._adopted_started_at, log_path=str(log_path)
+            )
+            self._thread = threading.Thread(
+                target=self._run_guarded,
+                args=(self._run_adopted, pid, Path(log_path), self._adopted_started_at),
+                daemon=True
+            )
+            self._started = True
+            self._thread.start()
+        
+        self.logger.info(f"{self.name} adopted running process {pid}")
+        self._mark_changed()
+    
+    def _run_adopted(self, pid: int, log_path: Path, process_started_at: Optional[float]) -> None:
+        """Follow an adopted subprocess until it exits."""
+        try:
+            self.start_time = time.time()
+            self._start_resource_monitor(pid, self._adopted_since)
+            self._consume_output(self._follow_log(log_path, lambda: is_same_process(pid, process_started_at)))
+            if process_group_alive(pid) and process_start_time(pid) is None:
+                # The leader exited but left children behind in its group
+                terminate_process_group(pid)
+            
+            # The exit code of a process we didn't spawn is unknown, so success
+            # is judged from the events it logged
+            if not self._is_run_complete():
+                raise FlowError(f"Adopted process {pid} exited before completing")
+            self._on_process_completed()
+        except Exception as e:
+            raise FlowError(f"{self.name} execution failed: {e}")
+        finally:
+            self._stop_resource_monitor()
+            with self._lock:
+                self.end_time = time.time()
+                self._finished = True
+                self._adopted_pid = None
+                self._adopted_started_at = None
+            release_session(pid)
+    
     def _cleanup_process(self, process: subprocess.Popen) -> None:
-        """Safely cleanup a subprocess."""
+        """Safely cleanup a subprocess together with everything it forked."""
         if not process:
             return
         
         try:
             if process.poll() is None:  # Process still running
-                self.logger.info(f"Terminating {self.name} process...")
-                process.terminate()
-                
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    self.logger.warning(f"Force killing {self.name} process...")
-                    process.kill()
-                    process.wait()
+                self.logger.info(f"Terminating {self.name} process tree...")
+                terminate_process_group(process.pid)
+                process.wait()
+            elif process_group_alive(process.pid):
+                # The leader exited but left children behind in its group
+                self.logger.warning(f"Terminating leftover {self.name} child processes...")
+                terminate_process_group(process.pid)
         except Exception as e:
             self.logger.error(f"Error cleaning up process: {e}")
         finally:
+            release_session(process.pid)
             if hasattr(process, 'stdout') and process.stdout:
                 try:
                     process.stdout.close()
                 except Exception:
                     pass
     
+    def terminate(self) -> None:
+        """Kill the process tree of a running flow without resetting its state."""
+        with self._lock:
+            process = self._process
+            adopted_pid = self._adopted_pid
+            adopted_started_at = self._adopted_started_at
+        if process:
+            self._cleanup_process(process)
+        elif adopted_pid:
+            if not is_same_process(adopted_pid, adopted_started_at) and process_start_time(adopted_pid) is not None:
+                # The PID now belongs to another process; its group is not ours to signal
+                self.logger.warning(f"Adopted {self.name} process {adopted_pid} is gone; not signalling its reused PID")
+            else:
+                self.logger.info(f"Terminating adopted {self.name} process tree {adopted_pid}...")
+                terminate_process_group(adopted_pid)
+            release_session(adopted_pid)
+    
     def reset(self) -> None:
         """Reset the flow to initial state."""
         with self._lock:
-            # Cleanup running process
-            if self._process:
-                self._cleanup_process(self._process)
+            # Cleanup running process tree
+            self.terminate()
             
             # Reset all state
             self._process = None
+            self._adopted_pid = None
             self._started = False
             self._finished = False
             self._error = None
             self._logs.clear()
             self.start_time = None
             self.end_time = None
+            self.resource_usage = None
             self._thread = None
+            self._frozen_response = None
+            self._timeout_paused_s = 0.0
+            self._timeout_paused_since = None
+            self._clear_journal()
             
             self.logger.info(f"{self.name} reset completed")
+        
+        self._mark_changed()
+    
+    # Journal
+    def enable_journal(self, journal_path: Path) -> None:
+        """
+        Record lifecycle events and parsed log events in an append-only
+        journal, and tee subprocess output to a file next to it, so the flow
+        can be rebuilt after a server restart (see replay_journal).
+        """
+        self.journal_path = Path(journal_path)
+    
+    def _journal(self, event: str, truncate: bool = False, sync: bool = False, **fields) -> None:
+        """Append one record to the journal. Lifecycle records are synced to disk."""
+        if not self.journal_path:
+            return
+        record = {"event": event, "time": time.time(), **fields}
+        try:
+            with self._journal_lock:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.journal_path, "w" if truncate else "a") as journal_file:
+                    journal_file.write(json.dumps(record, default=str) + "\n")
+                    if sync:
+                        journal_file.flush()
+                        os.fsync(journal_file.fileno())
+        except OSError as e:
+            self.logger.warning(f"Could not write {self.name} journal: {e}")
+    
+    def _clear_journal(self) -> None:
+        if not self.journal_path:
+            return
+        with self._journal_lock:
+            for path in (self.journal_path, self.journal_path.with_suffix(".log")):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+    
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        records = []
+        if not self.journal_path or not self.journal_path.exists():
+            return records
+        with open(self.journal_path, "r") as journal_file:
+            for line in journal_file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last record from a crash
+                    break
+        return records
+    
+    def replay_journal(self) -> bool:
+        """
+        Rebuild the flow from its journal after a restart. Finished runs are
+        restored; a run whose process is still alive is adopted through its
+        PID and output log. A run whose process is gone, or whose PID now
+        belongs to another process, is recorded as interrupted. Returns False
+        if there is nothing to replay.
+        """
+        records = self._read_journal()
+        if not records or records[0].get("event") != "start":
+            return False
+        
+        start = records[0]
+        process = next((r for r in records if r["event"] == "process"), None)
+        finish = next((r for r in records if r["event"] == "finish"), None)
+        args, kwargs = start.get("args", []), start.get("kwargs", {})
+        
+        with self._lock:
+            self._reset_state()
+            self._start_args = (args, kwargs)
+            self._restore_inputs(*args, **kwargs)
+        
+        if (not finish and process and process.get("log_path") and Path(process["log_path"]).exists()
+                and is_same_process(process["pid"], process.get("process_started_at"))):
+            self.adopt(process["pid"], Path(process["log_path"]), process["time"], process["process_started_at"])
+            return True
+        
+        if process:
+            # Let the reaper kill anything the interrupted run left behind
+            track_session(process["pid"], self.name, active=False, not_before=process["time"])
+        
+        with self._lock:
+            self._started = True
+            self.start_time = start["time"]
+            if finish:
+                self.resource_usage = finish.get("resources")
+            for record in records:
+                if record["event"] == "log":
+                    self._logs.append(record["data"])
+                    self._process_log_line(record["data"])
+            self._finished = True
+            if finish:
+                self.end_time = finish["time"]
+                if finish.get("error"):
+                    self._error = FlowError(finish["error"])
+            else:
+                self.end_time = time.time()
+                self._error = FlowError(f"{self.name} was interrupted by a server restart")
+        
+        if not finish:
+            self._journal("finish", sync=True, error=str(self._error))
+        elif not self._error:
+            self._freeze_result()
+        self.logger.info(f"{self.name} restored from journal")
+        self._mark_changed()
+        return True
     
     # Status methods
     def is_started(self) -> bool:
@@ -290,6 +862,104 @@ class BaseFlow(ABC):
                 return self.end_time - self.start_time
             return None
     
+    def _build_result_payload(self) -> Optional[Any]:
+        """Final result payload frozen at completion. Override in subclasses if needed."""
+        return None
+    
+    def _freeze_result(self) -> None:
+        """Serialize the final result once so later reads are a lookup."""
+        with self._lock:
+            payload = self._build_result_payload()
+            if payload is not None:
+                self._frozen_response = freeze_response(payload)
+    
+    def get_frozen_response(self) -> Optional[Tuple[bytes, str]]:
+        """Get the (body, etag) frozen at successful completion, if any."""
+        with self._lock:
+            return self._frozen_response
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get a JSON-serializable snapshot of the flow state."""
+        with self._lock:
+            status = {
+                "started": self._started,
+                "finished": self._finished,
+                "error": str(self._error) if self._error else None,
+                "start_time": self.start_time,
+                "end_time": self.end_time,
+                "resources": self.get_resource_usage(),
+            }
+            status.update(self._get_status_fields())
+            return status
+    
+    def _get_status_fields(self) -> Dict[str, Any]:
+        """Flow-specific status fields. Override in subclasses if needed."""
+        return {}
+    
+    def _mark_changed(self) -> None:
+        """Diff the current status against the last snapshot and version the changed fields."""
+        global _status_version
+        
+        status = self.get_status()
+        with _status_condition:
+            changed = [
+                field for field, value in status.items()
+                if self._status_values.get(field, _UNSET) != value
+            ]
+            if not changed:
+                return
+            
+            version = next(_status_versions)
+            for field in changed:
+                self._status_values[field] = status[field]
+                self._field_versions[field] = version
+            _status_version = version
+            _status_condition.notify_all()
+            _wake_status_waiters()
+        
+        self._notify_status_listeners(status)
+    
+    def _notify_status_listeners(self, status: Dict[str, Any]) -> None:
+        for listener in list(self._status_listeners):
+            try:
+                listener(self, status)
+            except Exception as e:
+                self.logger.error(f"Status listener failed for {self.name}: {e}")
+    
+    def add_status_listener(self, listener: Callable[["BaseFlow", Dict[str, Any]], None]) -> None:
+        """Register a callback invoked with (flow, full status) whenever the status changes."""
+        self._status_listeners.append(listener)
+    
+    def remove_status_listener(self, listener: Callable[["BaseFlow", Dict[str, Any]], None]) -> None:
+        try:
+            self._status_listeners.remove(listener)
+        except ValueError:
+            pass
+    
+    def get_process_pid(self) -> Optional[int]:
+        """Get the PID of the running subprocess, if any."""
+        process = self._process
+        return process.pid if process else self._adopted_pid
+    
+    def get_status_delta(self, since_version: int = 0) -> tuple:
+        """
+        Get the status fields that changed after since_version.
+        
+        Returns (version, fields), where version is the newest version of any
+        field of this flow and fields holds only the fields newer than since_version.
+        """
+        if not self._field_versions:
+            self._mark_changed()
+        
+        with _status_condition:
+            fields = {
+                field: self._status_values[field]
+                for field, version in self._field_versions.items()
+                if version > since_version
+            }
+            version = max(self._field_versions.values(), default=0)
+            return version, fields
+    
     def wait_for_completion(self, timeout: Optional[float] = None) -> bool:
         """Wait for the flow to complete."""
         if not self._thread:
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of subprocess event decoding.
+
+Compares the old path (json.loads on every output line, an exception and a
+debug f-string per non-JSON line, if/elif dispatch on the event type) with
+the prefilter, fast decoder and handler table of event_schemas and BaseFlow.
+
+    python bench_event_decoding.py [--events N] [--noise-per-event K]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add the backend path to sys.path for benchmarking
+sys.path.insert(0, str(Path(__file__).parent))
+
+import event_schemas
+from event_schemas import decode_event
+
+logger = logging.getLogger("bench")
+
+NOISE = [
+    "UserWarning: torch.meshgrid: in an upcoming release, it will be required to pass the indexing argument.",
+    "Decoding batches:  42%|████▏     | 42/100 [00:12<00:17,  3.38it/s]",
+    "[h264 @ 0x55d5c0] non-existing PPS 0 referenced",
+    "",
+]
+
+
+def make_events():
+    return [
+        {"type": "encode_start", "start_time": 1700000000.0},
+        {"type": "encode", "device_used": "cuda:0", "target_size": [1920, 1080],
+         "low_rank_approximation_psnr": 38.2, "mask_density_actual_target": [0.11, 0.1]},
+        {"type": "decode", "tree_name": "TreeA", "batch_index": 7, "total_batches": 100, "time": 1700000001.5},
+        {"type": "decode", "tree_name": "TreeB", "batch_index": 7, "total_batches": 100, "time": 1700000001.6},
+        {"type": "vector_search_preprocessing", "video_id": "lot", "duration_seconds": 4.2,
+         "processed_frames": 900, "resolution": "1920x1080"},
+        {"type": "vector_search_ended", "top_results": [{"timestamp": 3.5, "score": 0.91}] * 5},
+        {"type": "encode_end", "end_time": 1700000100.0, "duration_s": 100.0, "fps": 29.97,
+         "memory_usage_bytes": 123456789, "video_frames": 3000},
+    ]
+
+
+def make_lines(n_events, noise_per_event):
+    events = make_events()
+    lines = []
+    for i in range(n_events):
+        for k in range(noise_per_event):
+            lines.append(NOISE[(i + k) % len(NOISE)] + "\n")
+        lines.append(json.dumps(events[i % len(events)]) + "\n")
+    return lines
+
+
+class Sink:
+    """Stand-in flow state touched by the handlers."""
+
+    def __init__(self):
+        self.count = 0
+
+    def handle(self, log_obj):
+        self.count += 1
+
+
+def run_before(lines, sink):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            log_obj = json.loads(line)
+            if isinstance(log_obj, dict):
+                log_type = log_obj.get("type")
+                if log_type == "encode_start":
+                    sink.handle(log_obj)
+                elif log_type == "encode":
+                    sink.handle(log_obj)
+                elif log_type == "encode_end":
+                    sink.handle(log_obj)
+                elif log_type == "decode":
+                    sink.handle(log_obj)
+                elif log_type == "decode_end":
+                    sink.handle(log_obj)
+                elif log_type == "vector_search_preprocessing":
+                    sink.handle(log_obj)
+                elif log_type == "vector_search_ended":
+                    sink.handle(log_obj)
+        except json.JSONDecodeError:
+            logger.debug(f"Non-JSON output: {line}")
+            continue
+
+
+def run_after(lines, sink):
+    handlers = {event_type: sink.handle for event_type in event_schemas.EVENT_SCHEMAS}
+    for line in lines:
+        log_obj = decode_event(line.strip())
+        if log_obj is not None:
+            handler = handlers.get(log_obj.get("type"))
+            if handler:
+                handler(log_obj)
+
+
+def bench(name, fn, lines, n_events, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        sink = Sink()
+        start = time.perf_counter()
+        fn(lines, sink)
+        best = min(best, time.perf_counter() - start)
+        assert sink.count == n_events, f"{name} dispatched {sink.count} of {n_events} events"
+    print(f"{name:>7}: {n_events / best:12,.0f} events/s  {len(lines) / best:12,.0f} lines/s")
+    return n_events / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--noise-per-event", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = make_lines(args.events, args.noise_per_event)
+    decoder = "orjson" if event_schemas.orjson is not None else "json"
+    print(f"{args.events} events, {args.noise_per_event} noise lines per event, decoder: {decoder}")
+
+    before = bench("before", run_before, lines, args.events, args.repeat)
+    after = bench("after", run_after, lines, args.events, args.repeat)
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Screenshot search over every indexed video in one process.
+
+The query images are embedded once, then the index of every video is
+searched in a pool of threads, one video per task (numpy releases the GIL
+while scoring), and the hits are merged into a global top-k per image that
+carries the video ID. Quantized indexes are searched through their codes
+(see quantized_index).
+
+    python -m demo.backend.cross_video_search --images <img>... \\
+        --index <video_id>=<index dir> ... [--k 10] [--query-cache <dir>] \\
+        -- python integration_example.py images
+
+The embedding command is run with the images to embed and "--index <dir>"
+appended and must write an index with one entry per image, in order. With
+--query-cache only images not embedded before are passed to it (see
+query_cache). Result timestamps are source times in seconds.
+"""
+
+import argparse
+import heapq
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional, Any, Dict, List, Sequence, Tuple
+
+from .embedding_index import EmbeddingIndex, EmbeddingIndexError
+from .event_channel import emit
+from .quantized_index import open_index
+from .query_cache import QueryEmbeddingCache
+from .VectorSearchFlow import timestamp_scale
+
+
+# Results per query image
+DEFAULT_K = 10
+
+
+def embed_queries(command: List[str], images: List[str]) -> List[List[float]]:
+    """Run the embedding command on the images and return one vector per image."""
+    count = len(images)
+    query_dir = Path(tempfile.mkdtemp(prefix="cross-search-")) / "queries"
+    try:
+        returncode = subprocess.run(
+            command + list(images) + ["--index", str(query_dir)], stdout=subprocess.DEVNULL
+        ).returncode
+        if returncode != 0:
+            raise RuntimeError(f"Query embedding exited with code {returncode}")
+        queries = EmbeddingIndex.load(query_dir)
+    finally:
+        shutil.rmtree(query_dir.parent, ignore_errors=True)
+    if len(queries) != count:
+        raise RuntimeError(f"Expected {count} query embeddings, got {len(queries)}")
+    return [list(queries.vector(i)) for i in range(count)]
+
+
+def search_video(index_dir: Path, queries: Sequence[Sequence[float]], k: int) -> Tuple[List[List[Tuple[float, float]]], Dict[str, Any]]:
+    """Top-k (timestamp in seconds, score) of every query in one video's index."""
+    started = time.time()
+    index = open_index(index_dir)
+    if queries and index.dim != len(queries[0]):
+        raise EmbeddingIndexError(f"Index has dimension {index.dim}, queries have {len(queries[0])}")
+    scale = timestamp_scale(str(index_dir))
+    hits = [[(timestamp * scale, score) for timestamp, score in index.search(query, k)] for query in queries]
+    return hits, {"entries": len(index), "method": index.method, "duration_seconds": round(time.time() - started, 3)}
+
+
+def merge_hits(per_video: Dict[str, List[List[Tuple[float, float]]]], query_count: int, k: int) -> List[List[Dict[str, Any]]]:
+    """Merge per-video hits into a global top-k per query, best first."""
+    merged = []
+    for query in range(query_count):
+        candidates = (
+            {"video_id": video_id, "timestamp": round(timestamp, 3), "score": score}
+            for video_id, hits in per_video.items()
+            for timestamp, score in hits[query]
+        )
+        merged.append(heapq.nlargest(k, candidates, key=lambda hit: hit["score"]))
+    return merged
+
+
+def cross_video_search(images: List[str], indexes: Dict[str, Path], command: List[str],
+                       k: int = DEFAULT_K, query_cache: Optional[Path] = None) -> List[List[Dict[str, Any]]]:
+    started = time.time()
+    emit({"type": "cross_search_start", "start_time": started, "videos": sorted(indexes)})
+
+    if query_cache:
+        cache = QueryEmbeddingCache(query_cache, model=" ".join(command))
+        queries, cache_stats = cache.embed(images, lambda missing: embed_queries(command, missing))
+    else:
+        queries, cache_stats = embed_queries(command, images), None
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    per_video: Dict[str, List[List[Tuple[float, float]]]] = {}
+    skipped = []
+    with ThreadPoolExecutor(max_workers=max(1, min(len(indexes), cores))) as executor:
+        futures = {
+            executor.submit(search_video, index_dir, queries, k): video_id
+            for video_id, index_dir in indexes.items()
+        }
+        for future in as_completed(futures):
+            video_id = futures[future]
+            try:
+                per_video[video_id], info = future.result()
+            except Exception as e:
+                # One unreadable index doesn't fail the search of the others
+                skipped.append(video_id)
+                emit({"type": "cross_search_video", "video_id": video_id, "error": str(e)})
+                continue
+            emit({"type": "cross_search_video", "video_id": video_id, **info})
+    if not per_video:
+        raise RuntimeError("No video index could be searched")
+
+    results = merge_hits(per_video, len(images), k)
+    for query, (image, top_results) in enumerate(zip(images, results)):
+        emit({"type": "cross_search_query", "query": query, "image": image, "top_results": top_results})
+
+    emit({
+        "type": "cross_search_end",
+        "end_time": time.time(),
+        "videos": sorted(per_video),
+        "skipped": sorted(skipped),
+        "queries": len(images),
+        "query_cache": cache_stats,
+        "duration_seconds": round(time.time() - started, 3),
+    })
+    return results
+
+
+def parse_index(value: str) -> Tuple[str, Path]:
+    video_id, sep, index_dir = value.partition("=")
+    if not sep or not video_id or not index_dir:
+        raise argparse.ArgumentTypeError(f"Expected <video_id>=<index dir>, got {value!r}")
+    return video_id, Path(index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", nargs="+", required=True)
+    parser.add_argument("--index", type=parse_index, action="append", required=True)
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--query-cache", type=Path, default=None, help="Directory of cached query embeddings")
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("The embedding command is required after --")
+    try:
+        cross_video_search(args.images, dict(args.index), command, args.k, args.query_cache)
+    except Exception as e:
+        print(f"Cross-video search failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Incremental quality measurement of decoded output.
+
+While a decode runs, its HLS playlists gain a segment at a time. The monitor
+tails the playlists, measures PSNR and SSIM of every new segment against the
+same time range of the source, and keeps a running aggregate, so the quality
+of the whole decode is known as soon as the last segment lands.
+
+Every tree decodes the full video, so a tree's segments map onto the source
+timeline from 0. A segment's place on it is its first presentation timestamp
+relative to that of the tree's first segment; the rounded #EXTINF durations
+are only summed when a segment can't be probed. Aggregate PSNR is computed from the duration-weighted mean
+MSE, which is what a single PSNR pass over the whole video would report.
+"""
+
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Any, Callable, Dict, List, Tuple
+
+from .PSNRCalc import calculate_segment_quality, probe_video, PSNRError
+
+
+logger = logging.getLogger(__name__)
+
+# 8-bit peak signal value
+_PEAK = 255.0 ** 2
+# Stands in for the MSE of identical frames, whose PSNR is infinite
+_MIN_MSE = 1e-10
+
+
+def parse_playlist(path: Path) -> Tuple[List[Tuple[str, float]], bool]:
+    """Return the (segment name, duration) entries of an HLS playlist and whether it has ended."""
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return [], False
+
+    segments = []
+    duration = None
+    ended = False
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            try:
+                duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+            except ValueError:
+                duration = None
+        elif line == "#EXT-X-ENDLIST":
+            ended = True
+        elif line and not line.startswith("#") and duration is not None:
+            segments.append((line, duration))
+            duration = None
+    return segments, ended
+
+
+def _psnr_to_mse(psnr: Optional[float]) -> float:
+    return _MIN_MSE if psnr is None else _PEAK / (10 ** (psnr / 10))
+
+
+def _mse_to_psnr(mse: float) -> Optional[float]:
+    return None if mse <= _MIN_MSE else round(10 * math.log10(_PEAK / mse), 3)
+
+
+class DecodedQualityMonitor:
+    """Measure decoded segments against the source as they are written."""
+
+    def __init__(
+        self,
+        decoded_dir: Path,
+        source_path: str,
+        playlists: Dict[str, str],
+        on_update: Callable[[Dict[str, Any]], None],
+        is_active: Callable[[], bool],
+        poll_interval: float = 1.0,
+        nice: int = 10,
+    ):
+        self.decoded_dir = Path(decoded_dir)
+        self.source_path = source_path
+        self.playlists = playlists
+        self.on_update = on_update
+        self.is_active = is_active
+        self.poll_interval = poll_interval
+        self.nice = nice
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Per tree: measured segments in playlist order and the time covered so far
+        self._segments: Dict[str, List[Dict[str, Any]]] = {tree: [] for tree in playlists}
+        self._offsets: Dict[str, float] = {tree: 0.0 for tree in playlists}
+        # Per tree: presentation timestamp that maps to the start of the source
+        self._base_pts: Dict[str, float] = {}
+        self._ended: Dict[str, bool] = {tree: False for tree in playlists}
+        self._errors = 0
+        self._source_size: Optional[tuple] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="decoded-quality", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def notify(self) -> None:
+        """Check the playlists now instead of at the next poll."""
+        self._wake.set()
+
+    def is_complete(self) -> bool:
+        with self._lock:
+            return all(self._ended.values())
+
+    def _lower_priority(self) -> None:
+        # Decoding comes first; ffmpeg processes started from this thread inherit its niceness
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (OSError, AttributeError):
+            pass
+
+    def _run(self) -> None:
+        self._lower_priority()
+        try:
+            info = probe_video(self.source_path)
+            if info["width"] and info["height"]:
+                self._source_size = (info["width"], info["height"])
+        except PSNRError as e:
+            logger.warning(f"Could not probe {self.source_path}; segments are compared unscaled: {e}")
+
+        while not self._stop.is_set():
+            # Read activity before scanning so segments written right before exit are seen
+            active = self.is_active()
+            if self._scan() and self.is_complete():
+                return
+            if not active:
+                logger.info(f"Decode stopped before its playlists ended; quality covers {self.get_summary()['segments']} segments")
+                return
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _scan(self) -> bool:
+        """Measure all new segments. Returns True if anything changed."""
+        changed = False
+        for tree, playlist in self.playlists.items():
+            entries, ended = parse_playlist(self.decoded_dir / playlist)
+            done = len(self._segments[tree])
+            for name, duration in entries[done:]:
+                if self._stop.is_set():
+                    return changed
+                self._measure(tree, name, duration)
+                self.on_update(self.get_summary())
+                changed = True
+            if ended and len(self._segments[tree]) == len(entries) and not self._ended[tree]:
+                with self._lock:
+                    self._ended[tree] = True
+                self.on_update(self.get_summary())
+                changed = True
+        return changed
+
+    def _segment_start(self, tree: str, name: str) -> float:
+        """Source offset of a segment, from its first presentation timestamp."""
+        try:
+            pts = probe_video(str(self.decoded_dir / name))["start_s"]
+        except PSNRError:
+            pts = None
+        with self._lock:
+            if pts is None:
+                return self._offsets[tree]
+            # Muxers start streams at a nonzero timestamp; the first probed
+            # segment tells where the source starts
+            base = self._base_pts.setdefault(tree, pts - self._offsets[tree])
+            return max(0.0, pts - base)
+
+    def _measure(self, tree: str, name: str, duration: float) -> None:
+        start = self._segment_start(tree, name)
+        segment = {"name": name, "start_s": round(start, 3), "duration_s": duration, "psnr": None, "ssim": None}
+        try:
+            segment.update(calculate_segment_quality(
+                str(self.decoded_dir / name), self.source_path, start, duration, self._source_size
+            ))
+            segment["mse"] = _psnr_to_mse(segment["psnr"])
+        except PSNRError as e:
+            logger.warning(f"Could not measure {name}: {e}")
+            segment["error"] = str(e)
+        with self._lock:
+            self._segments[tree].append(segment)
+            self._offsets[tree] = start + duration
+            if "error" in segment:
+                self._errors += 1
+
+    @staticmethod
+    def _aggregate(segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        measured = [segment for segment in segments if "mse" in segment]
+        duration = sum(segment["duration_s"] for segment in measured)
+        if not duration:
+            return {"psnr": None, "ssim": None, "min_psnr": None, "segments": 0, "duration_s": 0.0}
+        mse = sum(segment["mse"] * segment["duration_s"] for segment in measured) / duration
+        ssim = sum(segment["ssim"] * segment["duration_s"] for segment in measured) / duration
+        return {
+            "psnr": _mse_to_psnr(mse),
+            "ssim": round(ssim, 5),
+            "min_psnr": _mse_to_psnr(max(segment["mse"] for segment in measured)),
+            "segments": len(measured),
+            "duration_s": round(duration, 3),
+        }
+
+    def get_summary(self) -> Dict[str, Any]:
+        """Running aggregate per tree and over all trees."""
+        with self._lock:
+            trees = {tree: self._aggregate(segments) for tree, segments in self._segments.items()}
+            overall = self._aggregate([segment for segments in self._segments.values() for segment in segments])
+            return {
+                **overall,
+                "trees": trees,
+                "failed_segments": self._errors,
+                "complete": all(self._ended.values()),
+            }
@@ -0,0 +1,142 @@
+"""
+On-disk format of frame-embedding indexes.
+
+An index is a directory holding:
+
+    meta.json          {"format": 1, "dim": D, "count": N, ...}
+    embeddings.f32     N x D little-endian float32 vectors, row-major
+    timestamps.f64     N little-endian float64 source timestamps in seconds
+
+Entries are ordered by timestamp. The search script writes and reads the
+same layout, so indexes built in shards or from decoded segments can be
+merged here and searched there. The binary files can be memory-mapped with
+numpy.fromfile where numpy is available. Quantized indexes also hold compact
+codes for in-process search (see quantized_index).
+"""
+
+import json
+import shutil
+import sys
+from array import array
+from pathlib import Path
+from typing import Optional, Any, Dict, Iterable, List, Sequence, Tuple
+
+
+FORMAT_VERSION = 1
+META_NAME = "meta.json"
+EMBEDDINGS_NAME = "embeddings.f32"
+TIMESTAMPS_NAME = "timestamps.f64"
+
+
+class EmbeddingIndexError(Exception):
+    """Raised for missing or inconsistent index files."""
+    pass
+
+
+def _read_array(path: Path, typecode: str) -> array:
+    values = array(typecode)
+    with open(path, "rb") as f:
+        values.frombytes(f.read())
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _write_array(path: Path, values: array) -> None:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    with open(path, "wb") as f:
+        values.tofile(f)
+
+
+def read_meta(path: Path) -> Dict[str, Any]:
+    """Metadata of the index at path, without loading its vectors."""
+    try:
+        return json.loads((Path(path) / META_NAME).read_text())
+    except (OSError, ValueError) as e:
+        raise EmbeddingIndexError(f"Could not read index metadata {path}: {e}")
+
+
+class EmbeddingIndex:
+    """Frame embeddings of one video with their source timestamps."""
+
+    def __init__(self, dim: int, meta: Optional[Dict[str, Any]] = None):
+        self.dim = dim
+        self.meta: Dict[str, Any] = dict(meta or {})
+        self.embeddings = array("f")
+        self.timestamps = array("d")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def add(self, timestamp: float, vector: Sequence[float]) -> None:
+        if len(vector) != self.dim:
+            raise EmbeddingIndexError(f"Expected a {self.dim}-dimensional vector, got {len(vector)}")
+        self.timestamps.append(timestamp)
+        self.embeddings.extend(vector)
+
+    def vector(self, i: int) -> array:
+        return self.embeddings[i * self.dim:(i + 1) * self.dim]
+
+    def entries(self) -> Iterable[Tuple[float, array]]:
+        for i, timestamp in enumerate(self.timestamps):
+            yield timestamp, self.vector(i)
+
+    @classmethod
+    def load(cls, path: Path) -> "EmbeddingIndex":
+        path = Path(path)
+        try:
+            meta = json.loads((path / META_NAME).read_text())
+            index = cls(int(meta["dim"]), meta)
+            index.embeddings = _read_array(path / EMBEDDINGS_NAME, "f")
+            index.timestamps = _read_array(path / TIMESTAMPS_NAME, "d")
+        except (OSError, ValueError, KeyError) as e:
+            raise EmbeddingIndexError(f"Could not load index {path}: {e}")
+        if len(index.embeddings) != len(index.timestamps) * index.dim:
+            raise EmbeddingIndexError(
+                f"Index {path} has {len(index.embeddings)} values for {len(index.timestamps)} entries of dim {index.dim}"
+            )
+        return index
+
+    def save(self, path: Path) -> None:
+        """Write the index, replacing any index at path only once it is complete."""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+        _write_array(tmp_path / EMBEDDINGS_NAME, self.embeddings)
+        _write_array(tmp_path / TIMESTAMPS_NAME, self.timestamps)
+        meta = {**self.meta, "format": FORMAT_VERSION, "dim": self.dim, "count": len(self)}
+        (tmp_path / META_NAME).write_text(json.dumps(meta))
+        if path.exists():
+            shutil.rmtree(path)
+        tmp_path.replace(path)
+
+
+def merge_indexes(
+    shards: List[Tuple[EmbeddingIndex, float, float]],
+    meta: Optional[Dict[str, Any]] = None,
+) -> EmbeddingIndex:
+    """
+    Merge (index, start_s, end_s) shards into one index ordered by timestamp.
+    Entries outside their shard's [start_s, end_s) range are dropped, so
+    frames both neighbours sampled at a boundary appear once.
+    """
+    dims = {index.dim for index, _, _ in shards}
+    if len(dims) > 1:
+        raise EmbeddingIndexError(f"Cannot merge shards of different dimensions: {sorted(dims)}")
+    merged = EmbeddingIndex(dims.pop() if dims else 0, meta)
+
+    entries = [
+        (timestamp, vector)
+        for index, start_s, end_s in shards
+        for timestamp, vector in index.entries()
+        if start_s <= timestamp < end_s
+    ]
+    entries.sort(key=lambda entry: entry[0])
+    for timestamp, vector in entries:
+        merged.timestamps.append(timestamp)
+        merged.embeddings.extend(vector)
+    return merged
@@ -0,0 +1,117 @@
+"""
+Structured event channel between flow subprocesses and BaseFlow.
+
+The server passes the write end of a dedicated pipe to the subprocess and
+names it in FLOW_EVENT_FD. The subprocess sends each event as one frame:
+
+    4-byte big-endian payload length | 1-byte format tag | payload
+
+where the tag is b"M" for msgpack and b"J" for JSON. Scripts call emit()
+for every event. emit() also mirrors the event to stdout behind
+MIRROR_PREFIX, so the output log stays a complete record that can be
+replayed when a later server process adopts the subprocess. The server
+skips mirrored lines while it receives the channel. Since the mirrored line
+is JSON anyway, emit() sends it as a JSON frame rather than serializing the
+event a second time.
+
+Frames are at most MAX_FRAME_BYTES long; emit() prints larger events as
+plain lines, and a reader stops at a frame header announcing more.
+"""
+
+import json
+import os
+import struct
+import sys
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .event_schemas import loads
+
+
+EVENT_FD_ENV = "FLOW_EVENT_FD"
+MIRROR_PREFIX = "@event "
+
+# Longer lengths can only come from a corrupt stream
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+_HEADER = struct.Struct(">IB")
+_JSON = ord("J")
+_MSGPACK = ord("M")
+
+
+def encode_frame(event: Dict[str, Any]) -> bytes:
+    if msgpack is not None:
+        return _pack(_MSGPACK, msgpack.packb(event, use_bin_type=True, default=str))
+    return _pack(_JSON, json.dumps(event, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def _pack(tag: int, payload: bytes) -> bytes:
+    return _HEADER.pack(len(payload), tag) + payload
+
+
+def decode_payload(tag: int, payload: bytes) -> Any:
+    if tag == _MSGPACK:
+        if msgpack is None:
+            raise ValueError("Received a msgpack frame but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    return loads(payload)
+
+
+def read_frames(fd: int) -> Iterator[Dict[str, Any]]:
+    """Yield the events read from a channel file descriptor until every writer closed it."""
+    with os.fdopen(fd, "rb", buffering=64 * 1024) as stream:
+        while True:
+            header = stream.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, tag = _HEADER.unpack(header)
+            if length > MAX_FRAME_BYTES:
+                raise ValueError(f"Frame of {length} bytes exceeds {MAX_FRAME_BYTES}; the channel is corrupt")
+            payload = stream.read(length)
+            if len(payload) < length:
+                # A writer was killed mid-frame
+                return
+            event = decode_payload(tag, payload)
+            if isinstance(event, dict):
+                yield event
+
+
+# Child side
+_channel: Optional[Any] = None
+_channel_checked = False
+
+
+def _open_channel():
+    global _channel, _channel_checked
+    if not _channel_checked:
+        _channel_checked = True
+        fd = os.environ.get(EVENT_FD_ENV)
+        if fd:
+            try:
+                _channel = os.fdopen(int(fd), "wb", buffering=0)
+            except (OSError, ValueError):
+                _channel = None
+    return _channel
+
+
+def emit(event: Dict[str, Any]) -> None:
+    """Send an event to the supervising flow; prints a plain JSON line when run without a channel."""
+    global _channel
+    line = json.dumps(event, separators=(",", ":"), default=str)
+    channel = _open_channel()
+    payload = line.encode("utf-8")
+    if channel is not None and len(payload) <= MAX_FRAME_BYTES:
+        try:
+            channel.write(_pack(_JSON, payload))
+        except OSError:
+            # The server that created the channel is gone; the mirrored line
+            # is picked up by whoever adopts this process
+            _channel = None
+        else:
+            line = MIRROR_PREFIX + line
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
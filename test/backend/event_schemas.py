@@ -0,0 +1,211 @@
+"""
+Typed schemas and fast decoding of the JSON events reported by flow subprocesses.
+
+Every event is a JSON object with a "type" field naming one of the schemas
+below. Output lines that can't be an event (framework warnings, progress
+bars) are rejected by a cheap prefilter before any parsing happens. Lines
+are parsed with orjson when it is installed. Flows check each event of a
+known type for the keys its schema requires before dispatching it (see
+validate_event); the other keys are optional.
+"""
+
+import json
+from typing import Optional, Any, Dict, TypedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    loads = orjson.loads
+else:
+    loads = json.loads
+
+
+# Keys in a total TypedDict base are required; the schemas below add optional ones
+class _Event(TypedDict):
+    type: str
+
+
+class EncodeStartEvent(_Event, total=False):
+    start_time: float
+
+
+class EncodeEvent(_Event, total=False):
+    device_used: str
+    target_size: Any
+    reconstruction_size: Any
+    low_rank_approximation_psnr: float
+    mask_density_actual_target: Any
+
+
+class EncodeBatchEvent(_Event, total=False):
+    """A batch the decoder can consume; reported in pipelined mode."""
+    batch_index: int
+    total_batches: int
+    path: str
+    time: float
+
+
+class EncodeEndEvent(_Event, total=False):
+    end_time: float
+    dataset_creation_time_s: float
+    memory_usage_bytes: int
+    video_frames: int
+    valid_sequences: int
+    duration_s: float
+    fps: float
+    method: str
+    bitrate_kbps: float
+    codec_output: str
+    compression_ratio: float
+
+
+class DecodeStartEvent(_Event, total=False):
+    start_time: float
+
+
+class DecodeEvent(_Event):
+    """Progress of one tree; _on_decode reads every field."""
+    tree_name: str
+    batch_index: int
+    total_batches: int
+    time: float
+
+
+class DecodeEndEvent(_Event, total=False):
+    end_time: float
+
+
+class VectorSearchPreprocessingEvent(_Event, total=False):
+    video_id: str
+    duration_seconds: float
+    processed_frames: int
+    resolution: str
+
+
+class VectorSearchEndedEvent(_Event, total=False):
+    top_results: list
+    # Added by the flow when the event arrives
+    completed_at: float
+
+
+class _RefinedHit(_Event):
+    query: int
+    rank: int
+    timestamp: float
+
+
+class VectorSearchRefinedEvent(_RefinedHit, total=False):
+    """A search hit moved to the frame that best matches its query image."""
+    similarity: float
+    frames_compared: int
+
+
+class IndexStartEvent(_Event, total=False):
+    start_time: float
+
+
+class IndexSegmentEvent(_Event, total=False):
+    """A decoded segment whose frames were added to the embedding index."""
+    segment: str
+    start_s: float
+    duration_s: float
+    frames: int
+
+
+class IndexEndEvent(_Event, total=False):
+    end_time: float
+    video_id: str
+    processed_frames: int
+    duration_seconds: float
+    shards: int
+    workers: int
+    sampling: Dict[str, Any]
+    quantization: Optional[Dict[str, Any]]
+
+
+class CrossSearchStartEvent(_Event, total=False):
+    start_time: float
+    videos: list
+
+
+class _SearchedVideo(_Event):
+    video_id: str
+
+
+class CrossSearchVideoEvent(_SearchedVideo, total=False):
+    """One video's index was searched, or skipped with an error."""
+    entries: int
+    method: str
+    duration_seconds: float
+    error: str
+
+
+class CrossSearchQueryEvent(_Event, total=False):
+    """Global top-k of one query image over all searched videos."""
+    query: int
+    image: str
+    top_results: list
+
+
+class CrossSearchEndEvent(_Event, total=False):
+    end_time: float
+    videos: list
+    skipped: list
+    queries: int
+    query_cache: Optional[Dict[str, int]]
+    duration_seconds: float
+
+
+EVENT_SCHEMAS: Dict[str, type] = {
+    "encode_start": EncodeStartEvent,
+    "encode": EncodeEvent,
+    "encode_batch": EncodeBatchEvent,
+    "encode_end": EncodeEndEvent,
+    "decode_start": DecodeStartEvent,
+    "decode": DecodeEvent,
+    "decode_end": DecodeEndEvent,
+    "vector_search_preprocessing": VectorSearchPreprocessingEvent,
+    "vector_search_ended": VectorSearchEndedEvent,
+    "vector_search_refined": VectorSearchRefinedEvent,
+    "index_start": IndexStartEvent,
+    "index_segment": IndexSegmentEvent,
+    "index_end": IndexEndEvent,
+    "cross_search_start": CrossSearchStartEvent,
+    "cross_search_video": CrossSearchVideoEvent,
+    "cross_search_query": CrossSearchQueryEvent,
+    "cross_search_end": CrossSearchEndEvent,
+}
+
+
+def validate_event(event: Dict[str, Any]) -> Optional[str]:
+    """
+    Check an event against the schema of its type. Returns what is wrong
+    with it, or None if it has every required key. Events of unknown types
+    have no schema and pass.
+    """
+    schema = EVENT_SCHEMAS.get(event.get("type"))
+    if schema is None:
+        return None
+    missing = sorted(key for key in schema.__required_keys__ if key not in event)
+    if missing:
+        return f"{event['type']} event without {', '.join(missing)}"
+    return None
+
+
+def decode_event(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Decode one stripped output line into an event, or return None if the
+    line isn't a JSON object. Lines that can't be objects are skipped
+    without parsing them.
+    """
+    if not line or line[0] != "{" or line[-1] != "}":
+        return None
+    try:
+        event = loads(line)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
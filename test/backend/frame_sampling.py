@@ -0,0 +1,69 @@
+"""
+Content-adaptive choice of the frames to embed for vector search.
+
+A fixed stride spends as many embeddings on a static parking lot as on a
+busy intersection. Instead, every frame gets a cheap change score (ffmpeg
+scene detection on a downscaled copy) and frames are picked where the
+content changed: a sample is taken once enough change has accumulated since
+the previous one, at every scene cut, and at least every max_interval_s so
+static stretches stay searchable. Samples are never closer than
+min_interval_s. The chosen timestamps are exact source times, which the
+index stores per entry.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .PSNRCalc import scene_scores
+
+
+# Accumulated scene score that triggers a sample; about one moderate change
+CHANGE_BUDGET = 0.3
+# Scores at or above this are scene cuts and always sampled
+CUT_THRESHOLD = 0.4
+MIN_INTERVAL_S = 0.25
+MAX_INTERVAL_S = 4.0
+
+
+def plan_samples(
+    scores: Sequence[Tuple[float, float]],
+    change_budget: float = CHANGE_BUDGET,
+    cut_threshold: float = CUT_THRESHOLD,
+    min_interval_s: float = MIN_INTERVAL_S,
+    max_interval_s: float = MAX_INTERVAL_S,
+) -> List[float]:
+    """Pick the timestamps to embed from per-frame (timestamp, score) pairs."""
+    samples: List[float] = []
+    last: Optional[float] = None
+    change = 0.0
+    for timestamp, score in scores:
+        change += score
+        if last is not None:
+            gap = timestamp - last
+            if gap < min_interval_s:
+                continue
+            if score < cut_threshold and change < change_budget and gap < max_interval_s:
+                continue
+        samples.append(timestamp)
+        last = timestamp
+        change = 0.0
+    return samples
+
+
+def adaptive_timestamps(
+    video_path: str,
+    start_s: float = 0.0,
+    end_s: Optional[float] = None,
+    **params: Any,
+) -> Tuple[List[float], Dict[str, Any]]:
+    """
+    Score the frames of [start_s, end_s) of a video and plan its samples.
+    Returns the timestamps and sampling statistics.
+    """
+    duration_s = None if end_s is None else end_s - start_s
+    scores = scene_scores(video_path, start_s, duration_s)
+    samples = plan_samples(scores, **params)
+    return samples, {
+        "frames_scored": len(scores),
+        "samples": len(samples),
+        "scene_cuts": sum(1 for _, score in scores if score >= params.get("cut_threshold", CUT_THRESHOLD)),
+    }
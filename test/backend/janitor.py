@@ -0,0 +1,237 @@
+"""
+Background janitor for sessions and DATA_DIR.
+
+Evicts sessions that have been idle longer than their TTL and keeps DATA_DIR
+under a byte budget by deleting least recently used artifacts, cheapest to
+recreate first. Artifacts of videos with running flows are never touched.
+"""
+
+import logging
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Any, Callable, Dict, List, Set
+
+
+logger = logging.getLogger(__name__)
+
+# Artifact classes in eviction order: derived encodes go first, uploads last
+ARTIFACT_CLASSES = ("encoded", "decoded", "screenshots", "uploads")
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+# Codec comparison outputs written by PSNRCalc next to the video directories
+_CODEC_OUTPUT_RE = re.compile(r"^(?P<video>.+)_(h264|h265|av1)\.(mp4|webm)$")
+
+
+def _tree_stats(path: Path) -> tuple:
+    """Total size and newest mtime of a file or directory tree."""
+    if path.is_file():
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime
+    size, mtime = 0, path.stat().st_mtime
+    for child in path.rglob("*"):
+        try:
+            stat = child.stat()
+        except FileNotFoundError:
+            continue
+        if child.is_file():
+            size += stat.st_size
+        mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+
+def scan_artifacts(data_dir: Path) -> List[Dict[str, Any]]:
+    """
+    List the artifacts in data_dir with their class, owning video, size and
+    last use. Every directory in data_dir belongs to a video; state shared
+    between videos must live elsewhere.
+    """
+    artifacts = []
+    if not data_dir.exists():
+        return artifacts
+
+    def add(path: Path, kind: str, video: str) -> None:
+        try:
+            size, last_used = _tree_stats(path)
+        except FileNotFoundError:
+            return
+        artifacts.append({"path": path, "kind": kind, "video": video, "size": size, "last_used": last_used})
+
+    for entry in data_dir.iterdir():
+        if entry.is_file():
+            match = _CODEC_OUTPUT_RE.match(entry.name)
+            if match:
+                add(entry, "encoded", match.group("video"))
+            continue
+        if not entry.is_dir():
+            continue
+
+        video = entry.name
+        for child in entry.iterdir():
+            suffix = child.suffix.lower()
+            if child.is_dir() or child.name.startswith("decode"):
+                # Decoded HLS trees and their decode manifest and log
+                add(child, "decoded", video)
+            elif suffix in VIDEO_EXTENSIONS and child.stem == video:
+                add(child, "uploads", video)
+            elif suffix in IMAGE_EXTENSIONS:
+                add(child, "screenshots", video)
+            else:
+                add(child, "encoded", video)
+    return artifacts
+
+
+class Janitor:
+    """Periodically evicts idle sessions and garbage-collects DATA_DIR down to a byte budget."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        list_idle_sessions: Callable[[float], List[str]],
+        evict_session: Callable[[str], bool],
+        list_video_sessions: Callable[[str], List[str]],
+        busy_videos: Callable[[], Set[str]],
+        session_ttl: float,
+        disk_budget_bytes: int,
+        interval: float = 300.0,
+        min_age: float = 600.0,
+        low_watermark: float = 0.9,
+        acquire_lease: Optional[Callable[[str, float], bool]] = None,
+        prune_local: Optional[Callable[[], None]] = None,
+    ):
+        self.data_dir = Path(data_dir)
+        self.list_idle_sessions = list_idle_sessions
+        self.evict_session = evict_session
+        self.list_video_sessions = list_video_sessions
+        self.busy_videos = busy_videos
+        self.session_ttl = session_ttl
+        self.disk_budget_bytes = disk_budget_bytes
+        self.interval = interval
+        self.min_age = min_age
+        self.low_watermark = low_watermark
+        self.acquire_lease = acquire_lease
+        self.prune_local = prune_local
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "runs": 0,
+            "last_run": None,
+            "sessions_evicted": 0,
+            "files_deleted": 0,
+            "bytes_reclaimed": {kind: 0 for kind in ARTIFACT_CLASSES},
+            "disk_usage_bytes": None,
+        }
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="Janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["bytes_reclaimed"] = dict(self.stats["bytes_reclaimed"])
+            stats["bytes_reclaimed_total"] = sum(stats["bytes_reclaimed"].values())
+            return stats
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            # Every worker drops its own stale in-memory state
+            if self.prune_local:
+                try:
+                    self.prune_local()
+                except Exception as e:
+                    logger.error(f"Janitor local prune failed: {e}")
+
+            # With several workers only the lease holder collects
+            if self.acquire_lease and not self.acquire_lease("janitor", self.interval * 2):
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Janitor run failed: {e}")
+
+    def run_once(self) -> None:
+        """Run one eviction and garbage-collection pass."""
+        evicted = self._evict_idle_sessions()
+        deleted, reclaimed, usage, orphaned = self._collect_disk()
+        evicted += orphaned
+
+        with self._lock:
+            self.stats["runs"] += 1
+            self.stats["last_run"] = time.time()
+            self.stats["sessions_evicted"] += evicted
+            self.stats["files_deleted"] += deleted
+            for kind, size in reclaimed.items():
+                self.stats["bytes_reclaimed"][kind] += size
+            self.stats["disk_usage_bytes"] = usage
+
+    def _evict_idle_sessions(self) -> int:
+        evicted = 0
+        for key in self.list_idle_sessions(time.time() - self.session_ttl):
+            try:
+                if self.evict_session(key):
+                    evicted += 1
+            except Exception as e:
+                logger.warning(f"Could not evict session '{key}': {e}")
+        if evicted:
+            logger.info(f"Evicted {evicted} idle sessions")
+        return evicted
+
+    def _collect_disk(self) -> tuple:
+        """Delete LRU artifacts until usage is under the low watermark of the budget."""
+        artifacts = scan_artifacts(self.data_dir)
+        usage = sum(artifact["size"] for artifact in artifacts)
+        reclaimed = {kind: 0 for kind in ARTIFACT_CLASSES}
+        deleted = orphaned = 0
+        if usage <= self.disk_budget_bytes:
+            return deleted, reclaimed, usage, orphaned
+
+        target = self.disk_budget_bytes * self.low_watermark
+        busy = self.busy_videos()
+        recent = time.time() - self.min_age
+        candidates = sorted(
+            (a for a in artifacts if a["video"] not in busy and a["last_used"] < recent),
+            key=lambda a: (ARTIFACT_CLASSES.index(a["kind"]), a["last_used"]),
+        )
+
+        for artifact in candidates:
+            if usage <= target:
+                break
+            path = artifact["path"]
+            try:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not delete {path}: {e}")
+                continue
+
+            usage -= artifact["size"]
+            reclaimed[artifact["kind"]] += artifact["size"]
+            deleted += 1
+            logger.info(f"Reclaimed {artifact['size']} bytes from {artifact['kind']} artifact {path}")
+
+            # A session is useless once its uploaded video is gone
+            if artifact["kind"] == "uploads":
+                for key in self.list_video_sessions(artifact["video"]):
+                    if self.evict_session(key):
+                        orphaned += 1
+
+        if usage > self.disk_budget_bytes:
+            logger.warning(f"DATA_DIR still uses {usage} bytes, over the {self.disk_budget_bytes} byte budget")
+        return deleted, reclaimed, usage, orphaned
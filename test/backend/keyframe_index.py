@@ -0,0 +1,32 @@
+"""
+Timestamp-to-byte lookups in a video's keyframe index.
+
+The index is the list of keyframes PSNRCalc.scan_keyframes reads from the
+container, each with its timestamp, byte offset and frame number. A seek
+to a timestamp starts decoding at the last keyframe at or before it, so the
+bytes a player needs for it are those of that keyframe's GOP: from its
+offset up to the next keyframe's.
+"""
+
+import bisect
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def keyframe_at(keyframes: List[Dict[str, Any]], timestamp: float) -> Optional[int]:
+    """Position of the last keyframe at or before timestamp, or None if there is none."""
+    position = bisect.bisect_right([keyframe["timestamp"] for keyframe in keyframes], timestamp) - 1
+    return position if position >= 0 else None
+
+
+def gop_byte_range(keyframes: List[Dict[str, Any]], timestamp: float, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) byte range of the GOP a seek to timestamp decodes,
+    or None if the index has no keyframe for it.
+    """
+    position = keyframe_at(keyframes, timestamp)
+    if position is None:
+        return None
+    start = keyframes[position]["pos"]
+    # The GOP ends where the next keyframe stored further into the file starts
+    end = next((keyframe["pos"] for keyframe in keyframes[position + 1:] if keyframe["pos"] > start), file_size) - 1
+    return (start, min(end, file_size - 1))
@@ -0,0 +1,435 @@
+"""
+Process-group supervision for flow subprocesses.
+
+Every flow subprocess is started as the leader of its own session, so the
+data-loader workers and ffmpeg children it forks share its session and
+process group. Killing the group takes down the whole tree. Sessions that
+are no longer supervised by a running flow are tracked until a reaper has
+confirmed that nothing in them survived.
+"""
+
+import logging
+import os
+import resource
+import signal
+import threading
+import time
+from typing import Optional, Any, Dict, List
+
+
+logger = logging.getLogger(__name__)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Thread pool size variables of BLAS, OpenMP and friends
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+_RLIMITS = {
+    "max_address_space_bytes": resource.RLIMIT_AS,
+    "max_data_bytes": resource.RLIMIT_DATA,
+}
+
+# Core -> number of running flow processes pinned to it
+_core_usage: Dict[int, int] = {}
+_core_lock = threading.Lock()
+
+# Session id -> {"name", "active", "not_before"}
+_tracked_sessions: Dict[int, Dict[str, Any]] = {}
+_tracked_lock = threading.Lock()
+
+
+def _boot_time() -> float:
+    try:
+        with open("/proc/stat") as stat_file:
+            for line in stat_file:
+                if line.startswith("btime"):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return 0.0
+
+
+_BOOT_TIME = _boot_time()
+
+
+def read_proc_stat(pid: int) -> Optional[Dict[str, Any]]:
+    """Parse /proc/<pid>/stat into the fields the supervisor needs."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            data = stat_file.read()
+    except OSError:
+        return None
+
+    # comm may contain spaces and parentheses; it ends at the last ')'
+    comm = data[data.index("(") + 1:data.rindex(")")]
+    fields = data[data.rindex(")") + 2:].split()
+    return {
+        "pid": pid,
+        "comm": comm,
+        "state": fields[0],
+        "ppid": int(fields[1]),
+        "pgrp": int(fields[2]),
+        "session": int(fields[3]),
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+        "cpu_user_seconds": int(fields[11]) / _CLOCK_TICKS,
+        "cpu_system_seconds": int(fields[12]) / _CLOCK_TICKS,
+        # CPU time of descendants this process has waited for
+        "children_cpu_user_seconds": int(fields[13]) / _CLOCK_TICKS,
+        "children_cpu_system_seconds": int(fields[14]) / _CLOCK_TICKS,
+        "started_at": _BOOT_TIME + int(fields[19]) / _CLOCK_TICKS,
+        "rss_bytes": int(fields[21]) * _PAGE_SIZE,
+    }
+
+
+def process_start_time(pid: Optional[int]) -> Optional[float]:
+    """When a live process started, or None if there is no such process."""
+    stat = read_proc_stat(pid) if pid else None
+    if not stat or stat["state"] == "Z":
+        return None
+    return stat["started_at"]
+
+
+def is_same_process(pid: Optional[int], started_at: Optional[float]) -> bool:
+    """
+    Whether pid is still the process that started at started_at, rather than
+    an unrelated one that got the PID after a reboot or wraparound.
+    """
+    current = process_start_time(pid)
+    return current is not None and started_at is not None and abs(current - started_at) < 0.5
+
+
+def read_proc_counters(pid: int) -> Dict[str, int]:
+    """Read I/O and context switch counters of a process; missing ones are left out."""
+    counters = {}
+    try:
+        with open(f"/proc/{pid}/io") as io_file:
+            for line in io_file:
+                name, _, value = line.partition(":")
+                if name in ("read_bytes", "write_bytes"):
+                    counters[name] = int(value)
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                name, _, value = line.partition(":")
+                if name == "voluntary_ctxt_switches":
+                    counters["voluntary_ctx_switches"] = int(value)
+                elif name == "nonvoluntary_ctxt_switches":
+                    counters["involuntary_ctx_switches"] = int(value)
+                elif name == "VmHWM":
+                    counters["peak_rss_bytes"] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return counters
+
+
+def list_session_processes(
+    session_id: int, not_before: float = 0.0, include_zombies: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    List the live processes of a session. Processes started before not_before
+    belong to an unrelated session that reused the id and are skipped.
+    """
+    processes = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return processes
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        stat = read_proc_stat(int(entry))
+        if not stat or stat["session"] != session_id:
+            continue
+        if stat["state"] == "Z" and not include_zombies:
+            continue
+        if stat["started_at"] < not_before - 1.0:
+            continue
+        processes.append(stat)
+    return processes
+
+
+def process_group_alive(pgid: int) -> bool:
+    """Whether a process group has live members; zombies awaiting their parent's wait() don't count."""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        stat = read_proc_stat(int(entry))
+        if stat and stat["pgrp"] == pgid and stat["state"] != "Z":
+            return True
+    return False
+
+
+def terminate_process_group(pgid: int, grace: float = 5.0) -> None:
+    """
+    Send SIGTERM to a whole process group, then SIGKILL whatever is left after
+    grace seconds. A stopped group is continued so it can act on the SIGTERM.
+    """
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+        os.killpg(pgid, signal.SIGCONT)
+    except ProcessLookupError:
+        return
+
+    deadline = time.time() + grace
+    while time.time() < deadline:
+        if not process_group_alive(pgid):
+            return
+        time.sleep(0.1)
+
+    logger.warning(f"Force killing process group {pgid}...")
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def resume_process_group(pgid: int) -> None:
+    """Continue a process group that may have been stopped with SIGSTOP."""
+    try:
+        os.killpg(pgid, signal.SIGCONT)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def allocate_cores(fraction: float) -> List[int]:
+    """
+    Reserve a share of this worker's cores for a flow process. The least used
+    cores are handed out first, so concurrent flows get disjoint core sets
+    until there are more flows than cores.
+    """
+    with _core_lock:
+        if not _core_usage:
+            for core in os.sched_getaffinity(0):
+                _core_usage[core] = 0
+        count = max(1, min(len(_core_usage), round(len(_core_usage) * fraction)))
+        cores = sorted(sorted(_core_usage), key=lambda core: _core_usage[core])[:count]
+        for core in cores:
+            _core_usage[core] += 1
+        return sorted(cores)
+
+
+def release_cores(cores: List[int]) -> None:
+    with _core_lock:
+        for core in cores:
+            if _core_usage.get(core):
+                _core_usage[core] -= 1
+
+
+def apply_process_limits(pid: int, cores: Optional[List[int]], profile: Dict[str, Any]) -> None:
+    """
+    Pin a freshly started process to its cores and apply the nice level and
+    rlimits of its profile. Children it forks inherit all of them. This runs
+    after the spawn instead of in a preexec_fn, which is unsafe in a
+    threaded server.
+    """
+    if cores:
+        os.sched_setaffinity(pid, cores)
+    if profile.get("nice"):
+        os.setpriority(os.PRIO_PROCESS, pid, profile["nice"])
+    for name, limit in _RLIMITS.items():
+        if profile.get(name):
+            resource.prlimit(pid, limit, (profile[name], profile[name]))
+
+
+def track_session(session_id: int, name: str, active: bool = True, not_before: Optional[float] = None) -> None:
+    """Track a flow subprocess session; active sessions are left alone by the reaper."""
+    with _tracked_lock:
+        _tracked_sessions[session_id] = {
+            "name": name,
+            "active": active,
+            "not_before": time.time() if not_before is None else not_before,
+        }
+
+
+def release_session(session_id: int) -> None:
+    """Mark a session as no longer supervised; the reaper checks it for leftovers."""
+    with _tracked_lock:
+        if session_id in _tracked_sessions:
+            _tracked_sessions[session_id]["active"] = False
+
+
+class ProcessReaper:
+    """Periodically kills processes left behind in sessions of finished flows."""
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "runs": 0,
+            "reaped_processes": 0,
+            "reaped_rss_bytes": 0,
+            "reaped_cpu_seconds": 0.0,
+            "last_reaped": [],
+        }
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ProcessReaper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["last_reaped"] = list(self.stats["last_reaped"])
+        with _tracked_lock:
+            stats["tracked_sessions"] = len(_tracked_sessions)
+        return stats
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.reap_once()
+            except Exception as e:
+                logger.error(f"Process reaper run failed: {e}")
+
+    def reap_once(self) -> List[Dict[str, Any]]:
+        """Kill leftover processes of inactive sessions and report what they were using."""
+        with _tracked_lock:
+            inactive = {
+                session_id: dict(info) for session_id, info in _tracked_sessions.items()
+                if not info["active"]
+            }
+
+        reaped = []
+        for session_id, info in inactive.items():
+            leftovers = list_session_processes(session_id, info["not_before"])
+            if leftovers:
+                rss = sum(p["rss_bytes"] for p in leftovers)
+                cpu = sum(p["cpu_seconds"] for p in leftovers)
+                logger.warning(
+                    f"Reaping {len(leftovers)} leaked processes of {info['name']} "
+                    f"(session {session_id}): {rss} bytes RSS, {cpu:.1f}s CPU"
+                )
+                for process in leftovers:
+                    process["flow"] = info["name"]
+                reaped.extend(leftovers)
+                terminate_process_group(session_id)
+                if list_session_processes(session_id, info["not_before"]):
+                    # Still going; try again on the next run
+                    continue
+
+            with _tracked_lock:
+                current = _tracked_sessions.get(session_id)
+                if current and not current["active"]:
+                    del _tracked_sessions[session_id]
+
+        with self._lock:
+            self.stats["runs"] += 1
+            self.stats["reaped_processes"] += len(reaped)
+            self.stats["reaped_rss_bytes"] += sum(p["rss_bytes"] for p in reaped)
+            self.stats["reaped_cpu_seconds"] += sum(p["cpu_seconds"] for p in reaped)
+            if reaped:
+                self.stats["last_reaped"] = reaped
+        return reaped
+
+
+_COUNTER_FIELDS = ("read_bytes", "write_bytes", "voluntary_ctx_switches", "involuntary_ctx_switches")
+
+
+class ResourceMonitor:
+    """
+    Samples the resource usage of a flow's process tree (its session) from
+    /proc until the tree exits. Counters of processes that exit between
+    samples keep their last sampled value.
+    """
+
+    def __init__(self, session_id: int, not_before: float = 0.0, interval: float = 1.0):
+        self.session_id = session_id
+        self.not_before = not_before
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # (pid, started_at) -> last sample of that process
+        self._processes: Dict[tuple, Dict[str, Any]] = {}
+        self._leader: Optional[Dict[str, Any]] = None
+        self._peak_tree_rss = 0
+        self._samples = 0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name=f"ResourceMonitor-{self.session_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Take a final sample and stop sampling."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self.sample()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self) -> None:
+        # An exited but not yet reaped leader still reports its final times
+        processes = list_session_processes(self.session_id, self.not_before, include_zombies=True)
+        tree_rss = 0
+        with self._lock:
+            for process in processes:
+                process.update(read_proc_counters(process["pid"]))
+                key = (process["pid"], process["started_at"])
+                previous = self._processes.get(key, {})
+                for field in _COUNTER_FIELDS + ("peak_rss_bytes",):
+                    if field not in process and field in previous:
+                        process[field] = previous[field]
+                self._processes[key] = process
+                if process["pid"] == self.session_id:
+                    self._leader = process
+                if process["state"] != "Z":
+                    tree_rss += process["rss_bytes"]
+            self._peak_tree_rss = max(self._peak_tree_rss, tree_rss)
+            self._samples += 1
+
+    def get_usage(self) -> Dict[str, Any]:
+        """Totals over every process seen in the tree."""
+        with self._lock:
+            processes = list(self._processes.values())
+            usage = {
+                "cpu_user_s": sum(p["cpu_user_seconds"] for p in processes),
+                "cpu_system_s": sum(p["cpu_system_seconds"] for p in processes),
+                "peak_rss_bytes": max(
+                    [self._peak_tree_rss] + [p.get("peak_rss_bytes", 0) for p in processes]
+                ),
+                "processes": len(processes),
+                "samples": self._samples,
+            }
+            for field in _COUNTER_FIELDS:
+                usage[field] = sum(p.get(field, 0) for p in processes)
+
+            # The leader's own plus its waited-for descendants' times also
+            # cover children too short-lived to be sampled
+            leader = self._leader
+            if leader:
+                usage["cpu_user_s"] = max(
+                    usage["cpu_user_s"], leader["cpu_user_seconds"] + leader["children_cpu_user_seconds"]
+                )
+                usage["cpu_system_s"] = max(
+                    usage["cpu_system_s"], leader["cpu_system_seconds"] + leader["children_cpu_system_seconds"]
+                )
+        usage["cpu_user_s"] = round(usage["cpu_user_s"], 2)
+        usage["cpu_system_s"] = round(usage["cpu_system_s"], 2)
+        return usage
@@ -0,0 +1,313 @@
+"""
+Compact resident form of frame-embedding indexes.
+
+Quantizing an index adds two files next to its float vectors (see
+embedding_index):
+
+    quantizer.f32      sq8: 2 x D offsets and steps
+                       pq:  M x K x D/M centroids
+    codes.u8           N x D (sq8) or N x M (pq) codes, row-major
+
+sq8 maps every dimension onto 256 levels between its minimum and maximum,
+a quarter of the float size. pq splits vectors into M subvectors and stores
+the nearest of K=256 learned centroids for each, one byte per subvector;
+a 512-dimensional embedding with M=64 takes 64 bytes instead of 2048.
+
+Only the codes and timestamps are kept in memory. Queries are scored
+against the codes without being quantized themselves (asymmetric distance
+computation; for pq through a per-query M x K table of subvector scores),
+and the best candidates are re-ranked with their exact vectors, read from
+embeddings.f32 on disk. Scores are inner products, which are cosine
+similarities for the L2-normalized embeddings the search script writes.
+
+Quantization needs numpy; without it indexes are only searched by the
+search script.
+"""
+
+import json
+import math
+from pathlib import Path
+from typing import Optional, Any, Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .embedding_index import (
+    EmbeddingIndexError, EMBEDDINGS_NAME, META_NAME, TIMESTAMPS_NAME, read_meta,
+)
+
+QUANTIZER_NAME = "quantizer.f32"
+CODES_NAME = "codes.u8"
+QUANTIZATION_METHODS = ("sq8", "pq")
+
+# Dimensions per pq subvector when the subspace count isn't given
+PQ_SUBVECTOR_DIM = 8
+PQ_CENTROIDS = 256
+PQ_ITERATIONS = 12
+# k-means runs on a sample of this many vectors at most
+PQ_TRAIN_SAMPLE = 20000
+# Candidates re-ranked exactly per requested result
+RERANK_FACTOR = 8
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise EmbeddingIndexError("Quantized indexes require numpy")
+
+
+def default_subspaces(dim: int) -> int:
+    """Largest subspace count dividing dim with subvectors of at least PQ_SUBVECTOR_DIM dimensions."""
+    for subspaces in range(max(1, dim // PQ_SUBVECTOR_DIM), 0, -1):
+        if dim % subspaces == 0:
+            return subspaces
+    return 1
+
+
+def _load_vectors(path: Path, dim: int, count: int) -> "np.ndarray":
+    """Memory-map the float vectors of an index; rows are read from disk on access."""
+    if count == 0:
+        return np.zeros((0, dim), dtype="<f4")
+    return np.memmap(path / EMBEDDINGS_NAME, dtype="<f4", mode="r", shape=(count, dim))
+
+
+def _train_scalar(vectors: "np.ndarray") -> "np.ndarray":
+    low = vectors.min(axis=0)
+    step = (vectors.max(axis=0) - low) / 255.0
+    step[step == 0] = 1.0
+    return np.stack([low, step]).astype("<f4")
+
+
+def _encode_scalar(vectors: "np.ndarray", quantizer: "np.ndarray") -> "np.ndarray":
+    low, step = quantizer
+    return np.clip(np.rint((vectors - low) / step), 0, 255).astype(np.uint8)
+
+
+def _nearest(vectors: "np.ndarray", centroids: "np.ndarray") -> "np.ndarray":
+    distances = (
+        (vectors ** 2).sum(axis=1)[:, None]
+        - 2 * vectors @ centroids.T
+        + (centroids ** 2).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1)
+
+
+def _train_product(vectors: "np.ndarray", subspaces: int, centroids: int,
+                   iterations: int, seed: int = 0) -> "np.ndarray":
+    rng = np.random.default_rng(seed)
+    if len(vectors) > PQ_TRAIN_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), PQ_TRAIN_SAMPLE, replace=False)]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = min(centroids, len(vectors))
+    sub_dim = vectors.shape[1] // subspaces
+
+    codebooks = np.empty((subspaces, centroids, sub_dim), dtype="<f4")
+    for m in range(subspaces):
+        sub = vectors[:, m * sub_dim:(m + 1) * sub_dim]
+        book = sub[rng.choice(len(sub), centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = _nearest(sub, book)
+            sums = np.zeros_like(book)
+            np.add.at(sums, assignment, sub)
+            counts = np.bincount(assignment, minlength=centroids)
+            # Empty clusters keep their previous centroid
+            filled = counts > 0
+            book[filled] = sums[filled] / counts[filled, None]
+        codebooks[m] = book
+    return codebooks
+
+
+def _encode_product(vectors: "np.ndarray", codebooks: "np.ndarray", batch: int = 4096) -> "np.ndarray":
+    subspaces, _, sub_dim = codebooks.shape
+    codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+    for start in range(0, len(vectors), batch):
+        chunk = np.asarray(vectors[start:start + batch], dtype=np.float32)
+        for m in range(subspaces):
+            codes[start:start + len(chunk), m] = _nearest(chunk[:, m * sub_dim:(m + 1) * sub_dim], codebooks[m])
+    return codes
+
+
+def quantize_index(path: Path, method: str = "pq", subspaces: Optional[int] = None,
+                   centroids: int = PQ_CENTROIDS, iterations: int = PQ_ITERATIONS) -> "QuantizedIndex":
+    """
+    Add quantized codes to the index at path and return it loaded. The float
+    vectors stay on disk for re-ranking.
+    """
+    _require_numpy()
+    if method not in QUANTIZATION_METHODS:
+        raise EmbeddingIndexError(f"Unknown quantization {method!r}; expected one of {QUANTIZATION_METHODS}")
+    path = Path(path)
+    meta = read_meta(path)
+    dim, count = int(meta["dim"]), int(meta["count"])
+    if count == 0:
+        raise EmbeddingIndexError(f"Index {path} is empty")
+    vectors = _load_vectors(path, dim, count)
+
+    if method == "sq8":
+        quantizer = _train_scalar(np.asarray(vectors))
+        codes = _encode_scalar(vectors, quantizer)
+        quantization: Dict[str, Any] = {"type": "sq8"}
+    else:
+        subspaces = subspaces or default_subspaces(dim)
+        if dim % subspaces:
+            raise EmbeddingIndexError(f"{subspaces} subspaces do not divide dimension {dim}")
+        if centroids > 256:
+            raise EmbeddingIndexError("Product quantization stores one byte per subvector, so at most 256 centroids")
+        quantizer = _train_product(vectors, subspaces, centroids, iterations)
+        codes = _encode_product(vectors, quantizer)
+        quantization = {"type": "pq", "subspaces": subspaces, "centroids": quantizer.shape[1]}
+
+    # The codes are only listed in meta.json once written, so a reader never
+    # sees codes that don't match their quantizer
+    meta.pop("quantization", None)
+    _write_meta(path, meta)
+    quantizer.tofile(path / QUANTIZER_NAME)
+    codes.tofile(path / CODES_NAME)
+    _write_meta(path, {**meta, "quantization": quantization})
+    return QuantizedIndex.load(path)
+
+
+def _write_meta(path: Path, meta: Dict[str, Any]) -> None:
+    meta_tmp = path / (META_NAME + ".tmp")
+    meta_tmp.write_text(json.dumps(meta))
+    meta_tmp.replace(path / META_NAME)
+
+
+class QuantizedIndex:
+    """A quantized index held in memory for in-process search."""
+
+    def __init__(self, path: Path, meta: Dict[str, Any], timestamps: "np.ndarray",
+                 codes: "np.ndarray", quantizer: "np.ndarray"):
+        self.path = Path(path)
+        self.meta = meta
+        self.dim = int(meta["dim"])
+        self.method = meta["quantization"]["type"]
+        self.timestamps = timestamps
+        self.codes = codes
+        self.quantizer = quantizer
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the codes, quantizer and timestamps."""
+        return self.codes.nbytes + self.quantizer.nbytes + self.timestamps.nbytes
+
+    @classmethod
+    def load(cls, path: Path) -> "QuantizedIndex":
+        _require_numpy()
+        path = Path(path)
+        meta = read_meta(path)
+        quantization = meta.get("quantization")
+        if not quantization:
+            raise EmbeddingIndexError(f"Index {path} is not quantized")
+        dim, count = int(meta["dim"]), int(meta["count"])
+        try:
+            timestamps = np.fromfile(path / TIMESTAMPS_NAME, dtype="<f8")
+            codes = np.fromfile(path / CODES_NAME, dtype=np.uint8)
+            quantizer = np.fromfile(path / QUANTIZER_NAME, dtype="<f4")
+        except OSError as e:
+            raise EmbeddingIndexError(f"Could not load quantized index {path}: {e}")
+
+        if quantization["type"] == "sq8":
+            width, quantizer_shape = dim, (2, dim)
+        else:
+            subspaces = int(quantization["subspaces"])
+            width = subspaces
+            quantizer_shape = (subspaces, int(quantization["centroids"]), dim // subspaces)
+        if len(timestamps) != count or codes.size != count * width or quantizer.size != math.prod(quantizer_shape):
+            raise EmbeddingIndexError(f"Quantized index {path} does not match its metadata")
+        return cls(path, meta, timestamps, codes.reshape(count, width), quantizer.reshape(quantizer_shape))
+
+    def approximate_scores(self, query: Sequence[float]) -> "np.ndarray":
+        """Inner products of the query with every entry, computed from the codes."""
+        query = np.asarray(query, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise EmbeddingIndexError(f"Expected a {self.dim}-dimensional query, got shape {query.shape}")
+        if self.method == "sq8":
+            low, step = self.quantizer
+            return self.codes @ (query * step) + float(query @ low)
+        subspaces, _, sub_dim = self.quantizer.shape
+        table = np.einsum("mkd,md->mk", self.quantizer, query.reshape(subspaces, sub_dim))
+        return table[np.arange(subspaces), self.codes].sum(axis=1)
+
+    def search(self, query: Sequence[float], k: int = 5,
+               rerank: Optional[int] = None) -> List[Tuple[float, float]]:
+        """
+        Best k entries for the query as (timestamp, score), best first. The
+        top rerank candidates (RERANK_FACTOR * k by default) are scored again
+        with their exact vectors.
+        """
+        if not len(self) or k <= 0:
+            return []
+        approximate = self.approximate_scores(query)
+        candidates = min(len(self), max(k, rerank if rerank is not None else RERANK_FACTOR * k))
+        top = np.argpartition(-approximate, candidates - 1)[:candidates]
+        if rerank != 0:
+            # Sorted rows keep the reads from the float store sequential
+            top.sort()
+            exact = _load_vectors(self.path, self.dim, len(self))[top] @ np.asarray(query, dtype=np.float32)
+        else:
+            exact = approximate[top]
+        order = np.argsort(-exact)[:k]
+        return [(float(self.timestamps[top[i]]), float(exact[i])) for i in order]
+
+
+class ExactIndex:
+    """An unquantized index searched exactly, with its vectors memory-mapped from disk."""
+
+    method = "exact"
+
+    def __init__(self, path: Path):
+        _require_numpy()
+        self.path = Path(path)
+        self.meta = read_meta(self.path)
+        self.dim = int(self.meta["dim"])
+        try:
+            self.timestamps = np.fromfile(self.path / TIMESTAMPS_NAME, dtype="<f8")
+            self.vectors = _load_vectors(self.path, self.dim, len(self.timestamps))
+        except (OSError, ValueError) as e:
+            raise EmbeddingIndexError(f"Could not load index {path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes
+
+    def search(self, query: Sequence[float], k: int = 5, rerank: Optional[int] = None) -> List[Tuple[float, float]]:
+        if not len(self) or k <= 0:
+            return []
+        scores = self.vectors @ np.asarray(query, dtype=np.float32)
+        top = np.argpartition(-scores, min(k, len(self)) - 1)[:k]
+        return [(float(self.timestamps[i]), float(scores[i])) for i in top[np.argsort(-scores[top])]]
+
+
+def open_index(path: Path):
+    """Open an index for in-process search, through its codes if it is quantized."""
+    if read_meta(path).get("quantization"):
+        return QuantizedIndex.load(path)
+    return ExactIndex(path)
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Quantize a frame-embedding index in place")
+    parser.add_argument("index")
+    parser.add_argument("--method", choices=QUANTIZATION_METHODS, default="pq")
+    parser.add_argument("--subspaces", type=int, default=None)
+    args = parser.parse_args()
+    try:
+        index = quantize_index(Path(args.index), args.method, args.subspaces)
+    except EmbeddingIndexError as e:
+        print(f"Quantization failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{len(index)} entries quantized with {index.method}, {index.nbytes} bytes resident")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Cache of screenshot embeddings shared by all searches.
+
+Query images are keyed by a hash of their content, so a screenshot uploaded
+by several users, or kept across re-runs of a search, is embedded once. An
+image that misses on content but whose perceptual hash is within
+MAX_HASH_DISTANCE bits of a cached image (a re-encoded or rescaled copy of
+the same screenshot) reuses that embedding.
+
+Searches running at the same time share the work: a search holds the cache
+lock while it embeds its misses, and a search needing the same images finds
+them cached once it gets the lock. The cache is stored as an embedding index
+(see embedding_index) whose meta lists the key of every entry, and is only
+valid for the embedding command that wrote it.
+"""
+
+import fcntl
+import hashlib
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .embedding_index import EmbeddingIndex, EmbeddingIndexError
+from .PSNRCalc import perceptual_hash, PSNRError
+
+
+logger = logging.getLogger(__name__)
+
+# dHash bits two copies of a screenshot may differ in
+MAX_HASH_DISTANCE = 4
+# Oldest entries are dropped beyond this
+MAX_ENTRIES = 20000
+INDEX_NAME = "embeddings"
+LOCK_NAME = ".lock"
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class QueryEmbeddingCache:
+    """Embeddings of query images by content, persisted in cache_dir."""
+
+    def __init__(self, cache_dir: Path, model: str, max_distance: int = MAX_HASH_DISTANCE,
+                 max_entries: int = MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.model = model
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        # content hash -> (perceptual hash or None, vector), oldest first
+        self._entries: "OrderedDict[str, Tuple[Optional[int], List[float]]]" = OrderedDict()
+        self._dim: Optional[int] = None
+
+    def _load(self) -> None:
+        self._entries.clear()
+        self._dim = None
+        try:
+            index = EmbeddingIndex.load(self.cache_dir / INDEX_NAME)
+        except EmbeddingIndexError:
+            return
+        if index.meta.get("model") != self.model:
+            logger.info("Query cache was written by another embedding command; starting over")
+            return
+        keys = index.meta.get("keys", [])
+        if len(keys) != len(index):
+            return
+        self._dim = index.dim
+        for i, (key, phash) in enumerate(keys):
+            self._entries[key] = (phash, list(index.vector(i)))
+
+    def _save(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        index = EmbeddingIndex(self._dim or 0, {
+            "model": self.model,
+            "keys": [[key, phash] for key, (phash, _) in self._entries.items()],
+        })
+        for i, (_, vector) in enumerate(self._entries.values()):
+            index.add(float(i), vector)
+        index.save(self.cache_dir / INDEX_NAME)
+
+    def _near_duplicate(self, phash: Optional[int]) -> Optional[List[float]]:
+        if phash is None:
+            return None
+        best, best_distance = None, self.max_distance + 1
+        for cached_phash, vector in self._entries.values():
+            if cached_phash is not None:
+                distance = hamming_distance(phash, cached_phash)
+                if distance < best_distance:
+                    best, best_distance = vector, distance
+        return best
+
+    def embed(self, images: Sequence[str],
+              embed_missing: Callable[[List[str]], List[List[float]]]) -> Tuple[List[List[float]], Dict[str, int]]:
+        """
+        Embeddings of the images, in order. Images not in the cache are
+        embedded with one call of embed_missing, each distinct image once.
+        Returns the embeddings and hit statistics.
+        """
+        keys = [content_hash(image) for image in images]
+        stats = {"hits": 0, "near_duplicates": 0, "embedded": 0}
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / LOCK_NAME, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load()
+
+            found: Dict[str, List[float]] = {}
+            missing: "OrderedDict[str, str]" = OrderedDict()
+            for image, key in zip(images, keys):
+                if key in found or key in missing:
+                    continue
+                if key in self._entries:
+                    found[key] = self._entries[key][1]
+                    self._entries.move_to_end(key)
+                    stats["hits"] += 1
+                else:
+                    missing[key] = image
+
+            phashes: Dict[str, Optional[int]] = {}
+            for key, image in list(missing.items()):
+                try:
+                    phashes[key] = perceptual_hash(image)
+                except PSNRError as e:
+                    logger.warning(f"Could not hash {image}; it is only matched exactly: {e}")
+                    phashes[key] = None
+                vector = self._near_duplicate(phashes[key])
+                if vector is not None:
+                    found[key] = vector
+                    self._entries[key] = (phashes[key], vector)
+                    del missing[key]
+                    stats["near_duplicates"] += 1
+
+            if missing:
+                vectors = embed_missing(list(missing.values()))
+                if len(vectors) != len(missing):
+                    raise EmbeddingIndexError(f"Expected {len(missing)} query embeddings, got {len(vectors)}")
+                for key, vector in zip(missing, vectors):
+                    if self._dim is None:
+                        self._dim = len(vector)
+                    found[key] = list(vector)
+                    self._entries[key] = (phashes[key], list(vector))
+                stats["embedded"] = len(missing)
+
+            # Hits alone change nothing worth rewriting the cache for
+            if missing or stats["near_duplicates"]:
+                self._save()
+
+        return [found[key] for key in keys], stats
@@ -0,0 +1,162 @@
+"""
+Screenshot ingestion at upload time.
+
+Every uploaded screenshot is decoded and scaled to the embedding model's
+input size in a small worker pool, then embedded into the shared query
+cache (see query_cache). Normalized images that arrive while an embedding
+pass runs are collected into the next pass, so the model is loaded once
+per batch rather than once per image. A search started afterwards finds
+its query embeddings cached and only runs the matching; one started
+while a pass is still running waits for it on the cache lock.
+
+Ingestion is best effort: an image that fails here is embedded by the
+search as usual.
+"""
+
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cross_video_search import embed_queries
+from .PSNRCalc import normalize_image, PSNRError
+from .query_cache import QueryEmbeddingCache
+
+
+logger = logging.getLogger(__name__)
+
+# Shorter side of the images the embedding model takes
+MODEL_INPUT_SIZE = 224
+# Images normalized within this long after the first one join its embedding pass
+BATCH_WINDOW_S = 0.5
+
+
+class ScreenshotIngestor:
+    """Normalizes and embeds uploaded screenshots in the background."""
+
+    def __init__(self, cache_dir: Path, command: List[str], workers: int = 2,
+                 batch_window_s: float = BATCH_WINDOW_S, nice: int = 10):
+        self.cache_dir = Path(cache_dir)
+        self.command = command
+        self.workers = workers
+        self.batch_window_s = batch_window_s
+        self.nice = nice
+
+        self._lock = threading.Lock()
+        # Per key: image path -> {"state": "queued" | "normalized" | "embedded" | "failed", ...}
+        self._images: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._embed_queue: "queue.Queue[Optional[Tuple[str, str, str]]]" = queue.Queue()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._embedder: Optional[threading.Thread] = None
+        self._work_dir: Optional[Path] = None
+
+    def start(self) -> None:
+        if self._pool:
+            return
+        self._work_dir = Path(tempfile.mkdtemp(prefix="screenshot-ingest-"))
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="screenshot-normalize", initializer=self._lower_priority
+        )
+        self._embedder = threading.Thread(target=self._run_embedder, name="screenshot-embed", daemon=True)
+        self._embedder.start()
+
+    def stop(self) -> None:
+        if not self._pool:
+            return
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._embed_queue.put(None)
+        self._pool = None
+        if self._work_dir:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+
+    def submit(self, key: str, image_path: str) -> None:
+        """Queue an uploaded image for normalizing and embedding."""
+        with self._lock:
+            self._images.setdefault(key, {})[image_path] = {"state": "queued", "queued_at": time.time()}
+        if self._pool:
+            self._pool.submit(self._normalize, key, image_path)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._images.pop(key, None)
+
+    def is_ingested(self, key: str, image_paths: List[str]) -> bool:
+        """True if every image was uploaded through ingestion and hasn't failed."""
+        with self._lock:
+            images = self._images.get(key, {})
+            return bool(image_paths) and all(
+                path in images and images[path]["state"] != "failed" for path in image_paths
+            )
+
+    def get_status(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            images = {path: dict(info) for path, info in self._images.get(key, {}).items()}
+        pending = sum(1 for info in images.values() if info["state"] in ("queued", "normalized"))
+        return {"images": images, "pending": pending}
+
+    def _set_state(self, key: str, image_path: str, state: str, **fields: Any) -> None:
+        with self._lock:
+            info = self._images.get(key, {}).get(image_path)
+            if info is not None:
+                info.update(state=state, **fields)
+
+    def _lower_priority(self) -> None:
+        # Uploads and interactive flows come first; ffmpeg and the embedder inherit this
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (OSError, AttributeError):
+            pass
+
+    def _normalize(self, key: str, image_path: str) -> None:
+        normalized = self._work_dir / f"{threading.get_native_id()}-{time.monotonic_ns()}.png"
+        try:
+            normalize_image(image_path, str(normalized), MODEL_INPUT_SIZE)
+        except PSNRError as e:
+            logger.warning(f"Could not normalize {image_path}: {e}")
+            self._set_state(key, image_path, "failed", error=str(e))
+            return
+        self._set_state(key, image_path, "normalized")
+        self._embed_queue.put((key, image_path, str(normalized)))
+
+    def _next_batch(self) -> Optional[List[Tuple[str, str, str]]]:
+        item = self._embed_queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window_s
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                item = self._embed_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._embed_queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run_embedder(self) -> None:
+        self._lower_priority()
+        cache = QueryEmbeddingCache(self.cache_dir, model=" ".join(self.command))
+        while (batch := self._next_batch()) is not None:
+            normalized = {image_path: path for _, image_path, path in batch}
+            try:
+                # Cached by the uploaded image, which is what searches are given
+                _, stats = cache.embed(
+                    list(normalized),
+                    lambda missing: embed_queries(self.command, [normalized[path] for path in missing]),
+                )
+                logger.info(f"Embedded {len(batch)} screenshots: {stats}")
+                state, fields = "embedded", {}
+            except Exception as e:
+                logger.warning(f"Could not embed {len(batch)} screenshots; searches will embed them: {e}")
+                state, fields = "failed", {"error": str(e)}
+            for key, image_path, path in batch:
+                self._set_state(key, image_path, state, **fields)
+                Path(path).unlink(missing_ok=True)
@@ -0,0 +1,112 @@
+"""
+Feed of decoded segments from DecodeFlow to IndexFlow.
+
+Every time the decode publishes a status change, the segments newly listed
+in its playlist are appended to a feed file in the video's output directory.
+The indexer, started with --follow on that file once the first segment is
+listed, tails it and embeds the frames of each segment as it arrives:
+
+    {"type": "segment", "index": 0, "path": ".../TreeA_000.ts", "start_s": 0.0, "duration_s": 2.0}
+    ...
+    {"type": "end"}                      (or {"type": "abort", "error": ...})
+
+Segments keep their position on the source timeline, so the indexer can
+embed the decoded frames or read the same time range of the source.
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from .base_flow import BaseFlow
+from .decoded_quality import parse_playlist
+
+
+logger = logging.getLogger(__name__)
+
+FEED_NAME = "index_feed.jsonl"
+
+
+class SegmentFeed:
+    """Publishes the segments of a decode to an index flow as they are written."""
+
+    def __init__(
+        self,
+        decode_flow: BaseFlow,
+        filename: str,
+        playlist_path: Path,
+        feed_path: Path,
+        start_index: Callable[[], None],
+    ):
+        self.decode_flow = decode_flow
+        self.filename = filename
+        self.playlist_path = Path(playlist_path)
+        self.feed_path = Path(feed_path)
+        self.start_index = start_index
+
+        self._lock = threading.Lock()
+        self._published = 0
+        self._start = 0.0
+        self._closed = False
+        self._cancelled = False
+        self._index_started = False
+
+    def start(self) -> None:
+        """Follow the decode; segments it already wrote are published right away."""
+        self.feed_path.parent.mkdir(parents=True, exist_ok=True)
+        self.feed_path.write_text("")
+        self.decode_flow.add_status_listener(self._on_decode_status)
+        self._on_decode_status(self.decode_flow, self.decode_flow.get_status())
+
+    def cancel(self) -> None:
+        """Detach from the decode; an indexer still following the feed is told to stop."""
+        with self._lock:
+            self._cancelled = True
+            if not self._closed:
+                self._append({"type": "abort", "error": "Indexing was cancelled"})
+                self._closed = True
+        self.decode_flow.remove_status_listener(self._on_decode_status)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"published_segments": self._published, "closed": self._closed}
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        with open(self.feed_path, "a") as feed_file:
+            feed_file.write(json.dumps(record) + "\n")
+
+    def _on_decode_status(self, flow: BaseFlow, status: Dict[str, Any]) -> None:
+        start_index = False
+        with self._lock:
+            if self._cancelled or self._closed or not status["started"]:
+                return
+            segments, ended = parse_playlist(self.playlist_path)
+            for name, duration in segments[self._published:]:
+                self._append({
+                    "type": "segment",
+                    "index": self._published,
+                    "path": str((self.playlist_path.parent / name).resolve()),
+                    "start_s": round(self._start, 3),
+                    "duration_s": duration,
+                })
+                self._published += 1
+                self._start += duration
+            if self._published and not self._index_started:
+                self._index_started = start_index = True
+
+            if status["finished"]:
+                if status["error"] or not ended:
+                    self._append({"type": "abort", "error": status["error"] or "Decode ended before its playlist"})
+                else:
+                    self._append({"type": "end"})
+                self._closed = True
+
+        if start_index:
+            try:
+                self.start_index()
+            except Exception as e:
+                logger.error(f"Could not start indexing {self.filename}: {e}")
+        if status["finished"]:
+            self.decode_flow.remove_status_listener(self._on_decode_status)
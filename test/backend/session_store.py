@@ -0,0 +1,372 @@
+"""
+Shared session and flow state store.
+
+Sessions, flow status snapshots and flow ownership live in a local SQLite
+database in WAL mode, so every uvicorn worker can answer polls for any key
+while each flow subprocess stays supervised by exactly one worker (its owner).
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Any, Dict, List
+
+from .base_flow import is_process_alive
+
+
+# Identifies this worker process as a flow owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Progress-only status changes of a flow are published at most this often
+STATUS_PUBLISH_INTERVAL_S = 0.5
+# Status fields whose changes are published at once
+TRANSITION_FIELDS = ("started", "finished", "error")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    uploaded_filename TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flow_owners (
+    key TEXT NOT NULL,
+    flow TEXT NOT NULL,
+    worker_id TEXT,
+    worker_pid INTEGER,
+    process_pid INTEGER,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (key, flow)
+);
+CREATE TABLE IF NOT EXISTS flow_fields (
+    key TEXT NOT NULL,
+    flow TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (key, flow, field)
+);
+CREATE INDEX IF NOT EXISTS flow_fields_version ON flow_fields (key, version);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('status_version', 0);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SessionStore:
+    """SQLite-backed registry of sessions, flow ownership and versioned flow status."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._key_locks_guard = threading.Lock()
+
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction that holds the database write lock from the start."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def key_lock(self, key: str):
+        """
+        Serialize compound operations on one key across all workers: a thread
+        lock within this worker and a file lock next to the database between
+        workers. Lock files are left in place; there is one small file per key.
+        """
+        with self._key_locks_guard:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        lock_dir = self.db_path.parent / "key_locks"
+        lock_dir.mkdir(exist_ok=True)
+        lock_path = lock_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.lock"
+        with lock, open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _next_version(self, conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'status_version'")
+        return conn.execute("SELECT value FROM counters WHERE name = 'status_version'").fetchone()[0]
+
+    # Sessions
+    def create_session(self, key: str) -> bool:
+        """Create a session if it doesn't exist. Returns True if it was created."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO sessions (key, uploaded_filename, created_at, updated_at) "
+                "VALUES (?, NULL, ?, ?)",
+                (key, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def session_exists(self, key: str) -> bool:
+        row = self._connect().execute("SELECT 1 FROM sessions WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def get_uploaded_filename(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT uploaded_filename FROM sessions WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def touch_session(self, key: str) -> None:
+        """Record an access to a session for TTL eviction."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE key = ?", (time.time(), key))
+
+    def list_idle_sessions(self, idle_since: float) -> List[str]:
+        """Keys of sessions not accessed since the given timestamp."""
+        rows = self._connect().execute(
+            "SELECT key FROM sessions WHERE updated_at < ?", (idle_since,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def set_uploaded_filename(self, key: str, filename: Optional[str]) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE sessions SET uploaded_filename = ?, updated_at = ? WHERE key = ?",
+                (filename, time.time(), key),
+            )
+
+    def find_keys_by_filename(self, filename: str) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT key FROM sessions WHERE uploaded_filename = ?", (filename,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def find_key_by_filename(self, filename: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT key FROM sessions WHERE uploaded_filename = ? ORDER BY created_at LIMIT 1",
+            (filename,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def list_sessions(self) -> Dict[str, Optional[str]]:
+        """Map every session key to its uploaded filename."""
+        rows = self._connect().execute("SELECT key, uploaded_filename FROM sessions").fetchall()
+        return {key: filename for key, filename in rows}
+
+    def delete_session(self, key: str) -> None:
+        """Delete a session together with its flow state and ownership."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            conn.execute("DELETE FROM flow_owners WHERE key = ?", (key,))
+            conn.execute("DELETE FROM flow_fields WHERE key = ?", (key,))
+
+    # Leases
+    def acquire_lease(self, name: str, duration: float) -> bool:
+        """Take or renew a named lease so only one worker runs a singleton task."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != WORKER_ID and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                (name, WORKER_ID, now + duration),
+            )
+            return True
+
+    # Flow ownership
+    def get_flow_owner(self, key: str, flow: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT worker_id, worker_pid, process_pid FROM flow_owners "
+            "WHERE key = ? AND flow = ? AND worker_id IS NOT NULL",
+            (key, flow),
+        ).fetchone()
+        if not row:
+            return None
+        return {"worker_id": row[0], "worker_pid": row[1], "process_pid": row[2]}
+
+    def claim_flow(self, key: str, flow: str, steal: bool = False) -> bool:
+        """
+        Make this worker the owner of a flow.
+
+        Succeeds if the flow has no owner, is already owned by this worker,
+        its owner worker is gone, or steal is True.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT worker_id, worker_pid FROM flow_owners WHERE key = ? AND flow = ?",
+                (key, flow),
+            ).fetchone()
+            if row and row[0] and row[0] != WORKER_ID and is_process_alive(row[1]) and not steal:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO flow_owners (key, flow, worker_id, worker_pid, process_pid, updated_at) "
+                "VALUES (?, ?, ?, ?, NULL, ?)",
+                (key, flow, WORKER_ID, os.getpid(), time.time()),
+            )
+            return True
+
+    def release_flow(self, key: str, flow: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM flow_owners WHERE key = ? AND flow = ?", (key, flow))
+
+    # Flow status
+    def _write_fields(self, conn: sqlite3.Connection, key: str, flow: str, status: Dict[str, Any]) -> None:
+        """Write the fields whose value changed, all under one new version."""
+        version = None
+        for field, value in status.items():
+            encoded = json.dumps(value, separators=(",", ":"), default=str)
+            row = conn.execute(
+                "SELECT value FROM flow_fields WHERE key = ? AND flow = ? AND field = ?",
+                (key, flow, field),
+            ).fetchone()
+            if row and row[0] == encoded:
+                continue
+            if version is None:
+                version = self._next_version(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO flow_fields (key, flow, field, value, version) VALUES (?, ?, ?, ?, ?)",
+                (key, flow, field, encoded, version),
+            )
+
+    def publish_flow_status(
+        self, key: str, flow: str, status: Dict[str, Any], process_pid: Optional[int] = None
+    ) -> bool:
+        """
+        Publish a flow status snapshot. Only the owner worker may publish;
+        returns False if this worker no longer owns the flow.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT worker_id FROM flow_owners WHERE key = ? AND flow = ?", (key, flow)
+            ).fetchone()
+            if not row or row[0] != WORKER_ID:
+                return False
+            conn.execute(
+                "UPDATE flow_owners SET process_pid = ?, updated_at = ? WHERE key = ? AND flow = ?",
+                (process_pid, time.time(), key, flow),
+            )
+            self._write_fields(conn, key, flow, status)
+            return True
+
+    def reset_flow_state(self, key: str, flow: str, status: Dict[str, Any]) -> None:
+        """Overwrite a flow's status with the given (idle) snapshot and release its owner."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM flow_owners WHERE key = ? AND flow = ?", (key, flow))
+            self._write_fields(conn, key, flow, status)
+
+    def get_flow_status(self, key: str, flow: str) -> Optional[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT field, value FROM flow_fields WHERE key = ? AND flow = ?", (key, flow)
+        ).fetchall()
+        if not rows:
+            return None
+        return {field: json.loads(value) for field, value in rows}
+
+    def get_status_changes(self, keys: List[str], since_version: int) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Get {key: {flow: {field: value}}} for every field newer than since_version."""
+        changes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        conn = self._connect()
+        for key in keys:
+            rows = conn.execute(
+                "SELECT flow, field, value FROM flow_fields WHERE key = ? AND version > ?",
+                (key, since_version),
+            ).fetchall()
+            for flow, field, value in rows:
+                changes.setdefault(key, {}).setdefault(flow, {})[field] = json.loads(value)
+        return changes
+
+    def get_status_version(self, keys: Optional[List[str]] = None) -> int:
+        """Newest status version overall, or of the given keys."""
+        conn = self._connect()
+        if keys is None:
+            return conn.execute("SELECT value FROM counters WHERE name = 'status_version'").fetchone()[0]
+        placeholders = ",".join("?" for _ in keys)
+        row = conn.execute(
+            f"SELECT MAX(version) FROM flow_fields WHERE key IN ({placeholders})", keys
+        ).fetchone()
+        return row[0] or 0
+
+
+class StatusPublisher:
+    """
+    Flow status listener that coalesces publishes to the store. Lifecycle
+    transitions (TRANSITION_FIELDS) are written at once; other changes, such
+    as progress events, are written at most every interval seconds, always
+    with the latest snapshot, so chatty flows don't hold the write lock that
+    every worker shares.
+    """
+
+    def __init__(self, store: SessionStore, key: str, flow_name: str,
+                 interval: float = STATUS_PUBLISH_INTERVAL_S):
+        self.store = store
+        self.key = key
+        self.flow_name = flow_name
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._published: Optional[Dict[str, Any]] = None
+        self._published_at = 0.0
+        self._pending: Optional[tuple] = None
+        self._timer: Optional[threading.Timer] = None
+
+    def __call__(self, flow, status: Dict[str, Any]) -> None:
+        with self._lock:
+            transition = self._published is None or any(
+                status.get(field) != self._published.get(field) for field in TRANSITION_FIELDS
+            )
+            self._pending = (status, flow.get_process_pid())
+            if transition or time.monotonic() - self._published_at >= self.interval:
+                self._publish_pending()
+            elif self._timer is None:
+                delay = self.interval - (time.monotonic() - self._published_at)
+                self._timer = threading.Timer(delay, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._timer = None
+            if self._pending:
+                self._publish_pending()
+
+    def _publish_pending(self) -> None:
+        """Publish the latest snapshot; called with self._lock held."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        status, process_pid = self._pending
+        self._pending = None
+        self._published = status
+        self._published_at = time.monotonic()
+        self.store.publish_flow_status(self.key, self.flow_name, status, process_pid)
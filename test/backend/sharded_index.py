@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Sharded frame-embedding preprocessing.
+
+Splits a video into time ranges and runs the embedding command once per
+range in a pool of worker processes sized to the cores this process may
+use. Each worker is pinned to its own group of cores and writes a shard
+index (see embedding_index); the shards are merged into one index ordered
+by timestamp. Progress is reported as index_segment events, one per shard,
+followed by index_end.
+
+    python -m demo.backend.sharded_index --video <src> --index <dir> [--shards N] [--adaptive] \\
+        -- python integration_example.py video <src>
+
+The embedding command is run with "--index <shard dir> --range <start> <end>"
+appended and must write source timestamps. With --adaptive each shard first
+picks its frames by content (see frame_sampling) and the command also gets
+"--timestamps <file>", a JSON list of the exact source times to embed.
+With --quantize the merged index also gets compact codes for in-process
+search (see quantized_index).
+"""
+
+import argparse
+import json
+import math
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional, Dict, List, Set, Tuple
+
+from .embedding_index import EmbeddingIndex, EmbeddingIndexError, merge_indexes
+from .event_channel import emit
+from .frame_sampling import adaptive_timestamps
+from .process_tree import THREAD_ENV_VARS
+from .quantized_index import QUANTIZATION_METHODS, quantize_index
+from .PSNRCalc import probe_video
+
+
+# Shorter ranges spend more time loading the model than embedding
+MIN_SHARD_S = 10.0
+
+
+def plan_shards(duration_s: float, workers: int, shards: Optional[int] = None,
+                min_shard_s: float = MIN_SHARD_S) -> List[Tuple[float, float]]:
+    """Split [0, duration_s) into equal ranges, one per worker unless shards is given."""
+    count = shards or workers
+    count = max(1, min(count, int(duration_s // min_shard_s) or 1))
+    step = duration_s / count
+    ranges = [(round(i * step, 3), round((i + 1) * step, 3)) for i in range(count)]
+    # The last range is open so frames at the very end are kept
+    ranges[-1] = (ranges[-1][0], math.inf)
+    return ranges
+
+
+def split_cores(cores: List[int], workers: int) -> List[List[int]]:
+    """Split cores into workers contiguous groups of near-equal size."""
+    size, extra = divmod(len(cores), workers)
+    groups, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def run_shard(command: List[str], shard_dir: Path, start_s: float, end_s: float,
+              cores: List[int], running: Set[subprocess.Popen],
+              video: Optional[str] = None,
+              cancelled: Optional[threading.Event] = None) -> Tuple[EmbeddingIndex, Optional[Dict[str, int]]]:
+    """
+    Embed one range; with video set, only the frames adaptive sampling picks
+    from it. Once cancelled is set the shard's process is killed.
+    """
+    env = os.environ.copy()
+    for var in THREAD_ENV_VARS:
+        env[var] = str(len(cores))
+    end_arg = "inf" if math.isinf(end_s) else f"{end_s:.3f}"
+    args = ["--index", str(shard_dir), "--range", f"{start_s:.3f}", end_arg]
+
+    sampling = None
+    if video:
+        timestamps, sampling = adaptive_timestamps(video, start_s, None if math.isinf(end_s) else end_s)
+        timestamps_path = shard_dir.with_suffix(".timestamps.json")
+        timestamps_path.write_text(json.dumps(timestamps))
+        args += ["--timestamps", str(timestamps_path)]
+
+    process = subprocess.Popen(
+        command + args,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    running.add(process)
+    if cancelled is not None and cancelled.is_set():
+        # Started while another shard failed, possibly after its processes were killed
+        process.kill()
+    try:
+        os.sched_setaffinity(process.pid, cores)
+    except (OSError, AttributeError):
+        pass
+    returncode = process.wait()
+    running.discard(process)
+    if returncode != 0:
+        raise RuntimeError(f"Shard {start_s:.1f}-{end_arg}s exited with code {returncode}")
+    return EmbeddingIndex.load(shard_dir), sampling
+
+
+def build_sharded_index(video: str, index_dir: Path, command: List[str],
+                        shards: Optional[int] = None, adaptive: bool = False,
+                        quantize: Optional[str] = None) -> EmbeddingIndex:
+    started = time.time()
+    emit({"type": "index_start", "start_time": started})
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    duration_s = probe_video(video)["duration_s"]
+    if not duration_s:
+        raise RuntimeError(f"Could not determine the duration of {video}")
+    ranges = plan_shards(duration_s, len(cores), shards)
+    workers = min(len(ranges), len(cores))
+
+    free_cores: "queue.Queue[List[int]]" = queue.Queue()
+    for group in split_cores(cores, workers):
+        free_cores.put(group)
+
+    shard_root = Path(str(index_dir) + ".shards")
+    shutil.rmtree(shard_root, ignore_errors=True)
+    shard_root.mkdir(parents=True)
+
+    running: Set[subprocess.Popen] = set()
+    failed = threading.Event()
+
+    def run(i: int, start_s: float, end_s: float):
+        group = free_cores.get()
+        try:
+            if failed.is_set():
+                raise RuntimeError("Another shard failed")
+            return run_shard(
+                command, shard_root / f"shard-{i:03d}", start_s, end_s, group, running,
+                video if adaptive else None, failed,
+            )
+        except Exception:
+            # Queued shards must not start once a shard failed
+            failed.set()
+            raise
+        finally:
+            free_cores.put(group)
+
+    results: Dict[int, EmbeddingIndex] = {}
+    sampling = {"frames_scored": 0, "samples": 0, "scene_cuts": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, i, start_s, end_s): i for i, (start_s, end_s) in enumerate(ranges)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i], shard_sampling = future.result()
+            except Exception:
+                # Stop the other shards instead of waiting for them
+                failed.set()
+                for process in list(running):
+                    process.kill()
+                raise
+            for stat, value in (shard_sampling or {}).items():
+                sampling[stat] += value
+            start_s, end_s = ranges[i]
+            emit({
+                "type": "index_segment",
+                "segment": f"shard-{i:03d}",
+                "start_s": start_s,
+                "duration_s": round(min(end_s, duration_s) - start_s, 3),
+                "frames": len(results[i]),
+            })
+
+    meta = {
+        **results[0].meta,
+        "video": video,
+        "shards": len(ranges),
+        "timestamp_unit": "seconds",
+        "sampling": {"mode": "adaptive", **sampling} if adaptive else {"mode": "fixed"},
+    }
+    merged = merge_indexes(
+        [(results[i], start_s, end_s) for i, (start_s, end_s) in enumerate(ranges)],
+        meta=meta,
+    )
+    merged.save(index_dir)
+    shutil.rmtree(shard_root, ignore_errors=True)
+
+    quantization = None
+    if quantize and len(merged):
+        # The float index is complete on its own, so a failure here only costs the compact form
+        try:
+            quantized = quantize_index(index_dir, quantize)
+            quantization = {**quantized.meta["quantization"], "resident_bytes": quantized.nbytes}
+        except EmbeddingIndexError as e:
+            print(f"Quantization skipped: {e}", file=sys.stderr)
+
+    emit({
+        "type": "index_end",
+        "end_time": time.time(),
+        "video_id": merged.meta.get("video_id", Path(video).stem),
+        "processed_frames": len(merged),
+        "duration_seconds": round(time.time() - started, 3),
+        "shards": len(ranges),
+        "workers": workers,
+        "sampling": meta["sampling"],
+        "quantization": quantization,
+    })
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--index", required=True)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--adaptive", action="store_true", help="Embed frames picked by content instead of a fixed stride")
+    parser.add_argument("--quantize", choices=QUANTIZATION_METHODS, default=None, help="Also store compact codes of the index")
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("The embedding command is required after --")
+    try:
+        build_sharded_index(args.video, Path(args.index), command, args.shards, args.adaptive, args.quantize)
+    except Exception as e:
+        print(f"Sharded preprocessing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Single-flight coordination for expensive per-scene jobs.
+
+The first request for a job key runs the job; concurrent requests for the same
+key wait for and share its result and progress. Across worker processes the
+job runs under an exclusive file lock, and finished results are kept on disk
+so later requests reuse the artifacts instead of running the job again. The
+progress of a running job and the number of requests waiting for it, in any
+worker, are kept in a progress file beside the result.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Any, Callable, Dict, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Call:
+    """State of one in-flight job shared by its leader and followers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent and repeated runs of the same job."""
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def job_id(job_key: Tuple) -> str:
+        """Stable, filename-safe id for a (scene, job type, parameters...) key."""
+        return hashlib.sha1(json.dumps(job_key, default=str).encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _file_lock(self, job_id: str):
+        """Exclusive lock shared with other worker processes."""
+        with open(self.state_dir / f"{job_id}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _shared_progress(self, job_id: str):
+        """
+        Read-modify-write the job's progress file under its own lock, so
+        updates don't wait for the job lock. The file holds the progress
+        update and the waiter count of each worker process.
+        """
+        path = self.state_dir / f"{job_id}.progress.json"
+        with open(self.state_dir / f"{job_id}.progress.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    state = {"waiters": {}, "progress": {}}
+                yield state
+                # Waiters of worker processes that died are no longer waiting
+                state["waiters"] = {
+                    pid: count for pid, count in state["waiters"].items() if count > 0 and _pid_alive(int(pid))
+                }
+                if state["waiters"]:
+                    tmp_path = path.with_suffix(".tmp")
+                    tmp_path.write_text(json.dumps(state, default=str))
+                    tmp_path.replace(path)
+                else:
+                    path.unlink(missing_ok=True)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _add_waiter(self, job_id: str, delta: int, reset_progress: bool = False) -> None:
+        pid = str(os.getpid())
+        with self._shared_progress(job_id) as state:
+            state["waiters"][pid] = state["waiters"].get(pid, 0) + delta
+            if reset_progress:
+                state["progress"] = {}
+
+    def _load_result(self, job_id: str, is_valid: Optional[Callable[[Any], bool]]) -> Optional[Any]:
+        path = self.state_dir / f"{job_id}.json"
+        if not path.exists():
+            return None
+        try:
+            result = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if is_valid and not is_valid(result):
+            return None
+        return result
+
+    def _store_result(self, job_id: str, result: Any) -> None:
+        path = self.state_dir / f"{job_id}.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(result, default=str))
+        tmp_path.replace(path)
+
+    def do(
+        self,
+        job_key: Tuple,
+        fn: Callable[[Callable[[Dict[str, Any]], None]], Any],
+        is_valid: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Run fn(progress) once for job_key and return its result.
+
+        Concurrent callers with the same key attach to the running call. A
+        stored result that passes is_valid (e.g. its artifacts still exist)
+        is returned without running fn at all.
+        """
+        job_id = self.job_id(job_key)
+
+        with self._lock:
+            call = self._calls.get(job_id)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[job_id] = call
+
+        if not leader:
+            self._add_waiter(job_id, 1)
+            try:
+                call.done.wait()
+            finally:
+                self._add_waiter(job_id, -1)
+            if call.error:
+                raise call.error
+            return call.result
+
+        def progress(update: Dict[str, Any]) -> None:
+            with self._shared_progress(job_id) as state:
+                state["progress"] = dict(update)
+
+        try:
+            self._add_waiter(job_id, 1)
+            with self._file_lock(job_id):
+                # Another worker may have finished the job while we waited for the lock
+                result = self._load_result(job_id, is_valid)
+                if result is None:
+                    logger.info(f"Running job {job_key}")
+                    result = fn(progress)
+                    self._store_result(job_id, result)
+                else:
+                    logger.info(f"Reusing finished job {job_key}")
+            call.result = result
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(job_id, None)
+            call.done.set()
+            # The next run of the job starts without this run's progress
+            self._add_waiter(job_id, -1, reset_progress=True)
+
+    def get_result(self, job_key: Tuple, is_valid: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """Get the stored result of a finished job without running it, or None."""
+        return self._load_result(self.job_id(job_key), is_valid)
+
+    def get_progress(self, job_key: Tuple) -> Optional[Dict[str, Any]]:
+        """
+        Get the shared progress of an in-flight job and the number of
+        requests waiting for it in every worker, or None if none is.
+        """
+        with self._shared_progress(self.job_id(job_key)) as state:
+            waiters = sum(count for pid, count in state["waiters"].items() if _pid_alive(int(pid)))
+            if waiters <= 0:
+                return None
+            return {"waiters": waiters, **state["progress"]}
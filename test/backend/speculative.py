@@ -0,0 +1,240 @@
+"""
+Speculative precomputation of the work a new session is likely to request.
+
+Once a video is registered, jobs such as a media probe or the baseline codec
+comparison are queued here and run one at a time by a background thread at
+the lowest CPU priority (processes it spawns inherit it). The scheduler
+yields to interactive work: no job starts while is_busy() returns True, and
+subprocesses started through JobContext.run are paused until it returns
+False again. Cancelling a session drops its queued jobs and stops its
+running one.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Optional, Any, Callable, Deque, Dict, List, Tuple
+
+from .process_tree import terminate_process_group
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a speculative job whose session was reset."""
+    pass
+
+
+class JobContext:
+    """Handle a running job uses to notice cancellation and yield to interactive work."""
+
+    def __init__(self, key: str, is_busy: Callable[[], bool], poll_interval: float):
+        self.key = key
+        self._is_busy = is_busy
+        self._poll_interval = poll_interval
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Speculative job of '{self.key}' was cancelled")
+
+    def wait_for_idle(self) -> None:
+        """Block while interactive work is running."""
+        while self._is_busy():
+            if self._cancelled.wait(self._poll_interval):
+                break
+        self.check()
+
+    def guard(
+        self,
+        progress: Callable[[Dict[str, Any]], None],
+        cancellable: Optional[Callable[[], bool]] = None,
+    ) -> Callable[[Dict[str, Any]], None]:
+        """
+        Wrap a progress callback so the job stops at its next progress report
+        once cancelled. cancellable() can veto that, e.g. while interactive
+        requests share the job's result.
+        """
+        def report(update: Dict[str, Any]) -> None:
+            if cancellable is None or cancellable():
+                self.check()
+            progress(update)
+        return report
+
+    def run(self, command: List[str], timeout: Optional[float] = None) -> int:
+        """
+        Run a command in its own process group and return its exit code. The
+        group is stopped while interactive work runs and killed on cancel.
+        """
+        self.check()
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.time() + timeout if timeout else None
+        paused = False
+        try:
+            while True:
+                try:
+                    return process.wait(timeout=self._poll_interval)
+                except subprocess.TimeoutExpired:
+                    pass
+                if self.cancelled() or (deadline and time.time() > deadline):
+                    break
+                busy = self._is_busy()
+                if busy != paused:
+                    try:
+                        os.killpg(process.pid, signal.SIGSTOP if busy else signal.SIGCONT)
+                    except ProcessLookupError:
+                        pass
+                    paused = busy
+        finally:
+            if process.poll() is None:
+                if paused:
+                    try:
+                        os.killpg(process.pid, signal.SIGCONT)
+                    except ProcessLookupError:
+                        pass
+                terminate_process_group(process.pid, grace=2.0)
+                process.wait()
+        self.check()
+        raise subprocess.TimeoutExpired(command, timeout)
+
+
+# fn(ctx, filename) runs one job for a session's video
+JobFn = Callable[[JobContext, str], Any]
+
+
+class SpeculativeScheduler:
+    """Queue and run speculative jobs in the background, one at a time."""
+
+    def __init__(
+        self,
+        is_busy: Callable[[], bool],
+        nice: int = 19,
+        poll_interval: float = 1.0,
+    ):
+        self.is_busy = is_busy
+        self.nice = nice
+        self.poll_interval = poll_interval
+
+        self._jobs: Dict[str, JobFn] = {}
+        self._queue: Deque[Tuple[str, str, str, Dict[str, Any]]] = deque()
+        self._states: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._running: Optional[Tuple[str, str, JobContext]] = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, int] = {"completed": 0, "failed": 0, "cancelled": 0}
+
+    def register(self, name: str, fn: JobFn) -> None:
+        """Register a job; jobs run in registration order."""
+        self._jobs[name] = fn
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="speculative", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stop = True
+            if self._running:
+                self._running[2].cancel()
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def schedule(self, key: str, filename: str, jobs: Optional[List[str]] = None) -> None:
+        """Queue the jobs (all registered ones by default) for a session's video."""
+        with self._cond:
+            states = self._states.get(key)
+            if states is None or any(state["filename"] != filename for state in states.values()):
+                self._cancel_locked(key)
+                states = self._states[key] = {}
+            for name in jobs or list(self._jobs):
+                if name in states and states[name]["state"] in ("queued", "running", "done"):
+                    continue
+                states[name] = {"filename": filename, "state": "queued", "error": None, "duration_s": None}
+                self._queue.append((key, filename, name, states[name]))
+            self._cond.notify_all()
+
+    def cancel(self, key: str) -> None:
+        """Drop a session's queued jobs and cancel its running one."""
+        with self._cond:
+            self._cancel_locked(key)
+            self._states.pop(key, None)
+
+    def _cancel_locked(self, key: str) -> None:
+        dropped = [item for item in self._queue if item[0] == key]
+        for item in dropped:
+            self._queue.remove(item)
+        self.stats["cancelled"] += len(dropped)
+        if self._running and self._running[0] == key:
+            self._running[2].cancel()
+
+    def get_status(self, key: str) -> Dict[str, Dict[str, Any]]:
+        with self._cond:
+            return {name: dict(state) for name, state in self._states.get(key, {}).items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self.stats, "queued": len(self._queue), "running": self._running is not None}
+
+    def _lower_priority(self) -> None:
+        # Niceness is per thread on Linux; threads and processes started from
+        # this one inherit it
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Could not lower the priority of speculative jobs: {e}")
+
+    def _run(self) -> None:
+        self._lower_priority()
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                key, filename, name, job_state = self._queue.popleft()
+                ctx = JobContext(key, self.is_busy, self.poll_interval)
+                self._running = (key, name, ctx)
+            self._run_job(ctx, filename, name, job_state)
+            with self._cond:
+                self._running = None
+
+    def _run_job(self, ctx: JobContext, filename: str, name: str, job_state: Dict[str, Any]) -> None:
+        started = time.time()
+        state, error = "done", None
+        try:
+            ctx.wait_for_idle()
+            with self._cond:
+                job_state["state"] = "running"
+
+            self._jobs[name](ctx, filename)
+        except Exception as e:
+            if ctx.cancelled():
+                state = "cancelled"
+            else:
+                state, error = "failed", str(e)
+                logger.warning(f"Speculative {name} for '{ctx.key}' failed: {e}")
+        with self._cond:
+            # A job rescheduled meanwhile has a new state record; this one is dropped
+            job_state.update(state=state, error=error, duration_s=round(time.time() - started, 3))
+            self.stats[{"done": "completed"}.get(state, state)] += 1
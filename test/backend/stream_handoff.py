@@ -0,0 +1,194 @@
+"""
+Streaming handoff from EncodeFlow to DecodeFlow.
+
+In pipelined mode the encoder reports every finished batch with an
+encode_batch event. Each batch is appended to a handoff file in the video's
+output directory, and the decoder, started with --stream-from on that file,
+tails it and decodes each batch as soon as it is listed:
+
+    {"type": "batch", "batch_index": 1, "total_batches": 40, ...}
+    ...
+    {"type": "end"}                      (or {"type": "abort", "error": ...})
+
+The decoder starts with the first batch. If the encoder gets more than
+max_lead batches ahead of the decoder, its process group is paused until
+the decoder is down to half that lead; the encode timeout doesn't run
+while it is paused. A paused encoder is continued by cancel, by
+terminating or resetting the encode flow, and when a restarted server
+adopts it.
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Any, Callable, Dict
+
+from .base_flow import BaseFlow
+
+
+logger = logging.getLogger(__name__)
+
+HANDOFF_NAME = "decode_handoff.jsonl"
+
+
+class StreamHandoff:
+    """Runs an encode and a streaming decode of the same video as one pipeline."""
+
+    def __init__(
+        self,
+        encode_flow: BaseFlow,
+        decode_flow: BaseFlow,
+        filename: str,
+        handoff_path: Path,
+        start_decode: Callable[[], None],
+        max_lead: int = 8,
+    ):
+        self.encode_flow = encode_flow
+        self.decode_flow = decode_flow
+        self.filename = filename
+        self.handoff_path = Path(handoff_path)
+        self.start_decode = start_decode
+        self.max_lead = max(1, max_lead)
+
+        self._lock = threading.Lock()
+        self._published = 0
+        self._decoded = 0
+        self._closed = False
+        self._cancelled = False
+        self._decode_started = False
+        self._paused_pid: Optional[int] = None
+        self.stats: Dict[str, Any] = {
+            "started_at": None,
+            "first_batch_s": None,
+            "first_segment_s": None,
+            "pauses": 0,
+            "paused_s": 0.0,
+        }
+        self._paused_since: Optional[float] = None
+
+    def start(self) -> None:
+        """Start the encoder; the decoder follows once the first batch is published."""
+        self.handoff_path.parent.mkdir(parents=True, exist_ok=True)
+        self.handoff_path.write_text("")
+        self.stats["started_at"] = time.time()
+        self.encode_flow.add_status_listener(self._on_encode_status)
+        self.decode_flow.add_status_listener(self._on_decode_status)
+        self._publish_state()
+        self.encode_flow.start_encode(self.filename)
+
+    def cancel(self) -> None:
+        """Detach from both flows; a paused encoder is resumed first."""
+        with self._lock:
+            self._cancelled = True
+            self._resume_encoder()
+        self.encode_flow.remove_status_listener(self._on_encode_status)
+        self.decode_flow.remove_status_listener(self._on_decode_status)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "published_batches": self._published,
+                "decoded_batches": self._decoded,
+                "encoder_paused": self._paused_pid is not None,
+                "closed": self._closed,
+                **self.stats,
+            }
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        with open(self.handoff_path, "a") as handoff_file:
+            handoff_file.write(json.dumps(record, default=str) + "\n")
+
+    def _publish_state(self) -> None:
+        """Show the pipeline state in the encode flow status, which all workers can read."""
+        self.encode_flow.set_handoff_status(self.get_status())
+
+    def _on_encode_status(self, flow: BaseFlow, status: Dict[str, Any]) -> None:
+        start_decode = False
+        with self._lock:
+            if self._cancelled or self._closed:
+                return
+            batches = flow.get_encoded_batches()
+            for batch in batches[self._published:]:
+                self._append({"type": "batch", **batch})
+            if len(batches) > self._published:
+                if self._published == 0:
+                    self.stats["first_batch_s"] = round(time.time() - self.stats["started_at"], 3)
+                self._published = len(batches)
+                start_decode = not self._decode_started
+                self._decode_started = True
+                self._apply_backpressure()
+
+            if status["finished"]:
+                if status["error"]:
+                    self._append({"type": "abort", "error": status["error"]})
+                else:
+                    self._append({"type": "end"})
+                self._closed = True
+                self._resume_encoder()
+
+        if start_decode:
+            try:
+                self.start_decode()
+            except Exception as e:
+                logger.error(f"Could not start streaming decode of {self.filename}: {e}")
+        if start_decode or status["finished"]:
+            self._publish_state()
+
+    def _on_decode_status(self, flow: BaseFlow, status: Dict[str, Any]) -> None:
+        changed = False
+        with self._lock:
+            if self._cancelled:
+                return
+            decoded = flow.get_decoded_batches()
+            if decoded > self._decoded:
+                if self._decoded == 0:
+                    self.stats["first_segment_s"] = round(time.time() - self.stats["started_at"], 3)
+                self._decoded = decoded
+                changed = True
+            if status["finished"]:
+                # Nobody consumes the handoff any more; let the encoder run freely
+                self._cancelled = True
+                self._resume_encoder()
+                changed = True
+            else:
+                changed = self._apply_backpressure() or changed
+        if changed:
+            self._publish_state()
+
+    def _apply_backpressure(self) -> bool:
+        """Pause or resume the encoder by its lead over the decoder. Returns True if that changed."""
+        lead = self._published - self._decoded
+        if self._paused_pid is None and lead >= self.max_lead and not self._closed:
+            pid = self.encode_flow.get_process_pid()
+            if pid and self._signal_encoder(pid, signal.SIGSTOP):
+                self.encode_flow.pause_timeout()
+                self._paused_pid = pid
+                self._paused_since = time.time()
+                self.stats["pauses"] += 1
+                logger.info(f"Pausing encoder of {self.filename}: {lead} batches ahead of the decoder")
+                return True
+        elif self._paused_pid is not None and lead <= self.max_lead // 2:
+            self._resume_encoder()
+            return True
+        return False
+
+    def _resume_encoder(self) -> None:
+        if self._paused_pid is None:
+            return
+        self._signal_encoder(self._paused_pid, signal.SIGCONT)
+        self.encode_flow.resume_timeout()
+        self.stats["paused_s"] = round(self.stats["paused_s"] + time.time() - self._paused_since, 3)
+        self._paused_pid = None
+        self._paused_since = None
+
+    @staticmethod
+    def _signal_encoder(pid: int, sig: int) -> bool:
+        try:
+            os.killpg(pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
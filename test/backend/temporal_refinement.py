@@ -0,0 +1,111 @@
+"""
+Coarse-to-fine refinement of vector search hits.
+
+The embedding index only holds a sample of the frames, so a hit lands on the
+nearest sampled frame rather than the one the screenshot shows. For the top
+hits of every query the refiner decodes a short window of the source around
+the hit at full frame rate, compares each frame with the screenshot and
+reports the best matching frame's exact timestamp. The index can then use a
+coarse stride, as long as the window covers it.
+"""
+
+import logging
+import os
+import queue
+import threading
+from typing import Optional, Any, Callable, Dict, List, Tuple
+
+from .PSNRCalc import frame_similarity, PSNRError
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds searched on each side of a hit; should cover the index stride
+REFINE_WINDOW_S = 2.0
+# Hits refined per query
+REFINE_TOP_K = 3
+
+
+def refine_hit(video_path: str, image_path: str, timestamp: float,
+               window_s: float = REFINE_WINDOW_S) -> Optional[Dict[str, Any]]:
+    """
+    Find the frame within window_s of timestamp that best matches the image.
+    Returns None if the window holds no frames.
+
+    Raises:
+        PSNRError: If the frames could not be compared.
+    """
+    start_s = max(0.0, timestamp - window_s)
+    scores = frame_similarity(video_path, image_path, start_s, timestamp + window_s - start_s)
+    if not scores:
+        return None
+    best_s, similarity = max(scores, key=lambda score: score[1])
+    return {"timestamp": best_s, "similarity": round(similarity, 5), "frames_compared": len(scores)}
+
+
+class TemporalRefiner:
+    """Refines search hits in the background as the results of each query arrive."""
+
+    def __init__(
+        self,
+        video_path: str,
+        on_refined: Callable[[int, int, Dict[str, Any]], None],
+        window_s: float = REFINE_WINDOW_S,
+        nice: int = 10,
+    ):
+        self.video_path = video_path
+        self.on_refined = on_refined
+        self.window_s = window_s
+        self.nice = nice
+
+        self._queue: "queue.Queue[Optional[Tuple[int, str, List[float]]]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="temporal-refinement", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: int, image_path: str, timestamps: List[float]) -> None:
+        """Refine the hits of one query, given as source timestamps in rank order."""
+        self._queue.put((query, image_path, timestamps))
+
+    def stop(self) -> None:
+        """Drop queued hits; the hit being compared finishes first."""
+        self._stop.set()
+        self._queue.put(None)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted hit is refined. Returns False on timeout."""
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def _lower_priority(self) -> None:
+        # ffmpeg processes started from this thread inherit its niceness
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (OSError, AttributeError):
+            pass
+
+    def _run(self) -> None:
+        self._lower_priority()
+        while not self._stop.is_set():
+            job = self._queue.get()
+            if job is None:
+                return
+            query, image_path, timestamps = job
+            for rank, timestamp in enumerate(timestamps):
+                if self._stop.is_set():
+                    return
+                try:
+                    refined = refine_hit(self.video_path, image_path, timestamp, self.window_s)
+                except PSNRError as e:
+                    logger.warning(f"Could not refine hit {rank} of {image_path}: {e}")
+                    continue
+                if refined:
+                    self.on_refined(query, rank, refined)
@@ -4,6 +4,7 @@ Test script for the refactored backend components.
 This validates that the refactored code works correctly.
 """
 
+import os
 import sys
 import logging
 from pathlib import Path
@@ -15,6 +16,8 @@ from base_flow import BaseFlow, FlowError, validate_file_exists, validate_direct
 from EncodeFlow import EncodeFlow
 from DecodeFlow import DecodeFlow
 from VectorSearchFlow import VectorSearchFlow
+from IndexFlow import IndexFlow
+from CrossVideoSearchFlow import CrossVideoSearchFlow
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -59,6 +62,12 @@ def test_flow_initialization():
         vector_flow = VectorSearchFlow()
         print(f"✅ VectorSearchFlow initialized: {vector_flow.name}")
         
+        index_flow = IndexFlow()
+        print(f"✅ IndexFlow initialized: {index_flow.name}")
+        
+        cross_search_flow = CrossVideoSearchFlow()
+        print(f"✅ CrossVideoSearchFlow initialized: {cross_search_flow.name}")
+        
     except Exception as e:
         print(f"❌ Flow initialization failed: {e}")
 
@@ -122,6 +131,1058 @@ def test_flow_state_management():
         print(f"❌ State management test failed: {e}")
 
 
+def test_flow_status_delta():
+    """Test that status deltas only report fields that changed."""
+    print("\nTesting flow status versioning...")
+    
+    try:
+        flow = DecodeFlow()
+        version, fields = flow.get_status_delta(0)
+        assert "progress" in fields, "Initial delta should be a full snapshot"
+        
+        flow._process_log_line({
+            "type": "decode", "tree_name": "TreeA",
+            "batch_index": 1, "total_batches": 4, "time": 1.0,
+        })
+        flow._mark_changed()
+        new_version, fields = flow.get_status_delta(version)
+        assert new_version > version, "Version should advance after a change"
+        assert fields == {"progress": 12.5}, f"Unexpected delta: {fields}"
+        
+        _, fields = flow.get_status_delta(new_version)
+        assert not fields, "No fields should change without new events"
+        print("✅ Status deltas work correctly")
+        
+    except Exception as e:
+        print(f"❌ Status delta test failed: {e}")
+
+
+def test_async_status_wait():
+    """Test that async status waiters are woken by a change made on another thread."""
+    print("\nTesting async status long-poll...")
+    
+    import asyncio
+    import threading
+    import time
+    from base_flow import current_status_version, wait_for_status_change_async
+    
+    try:
+        flow = DecodeFlow()
+        flow._mark_changed()
+        
+        async def wait():
+            observed = current_status_version()
+            threading.Timer(0.1, lambda: (
+                flow._process_log_line({"type": "decode", "tree_name": "TreeA", "batch_index": 2, "total_batches": 4, "time": 2.0}),
+                flow._mark_changed(),
+            )).start()
+            started = time.monotonic()
+            version = await wait_for_status_change_async(observed, 5.0)
+            return version > observed, time.monotonic() - started
+        
+        changed, waited = asyncio.run(wait())
+        assert changed and waited < 2.0, f"Waiter should wake on the change, waited {waited:.2f}s"
+        
+        async def idle():
+            return await wait_for_status_change_async(current_status_version(), 0.1)
+        assert asyncio.run(idle()) == current_status_version(), "An idle wait should time out"
+        print("✅ Async status waits wake on changes and time out when idle")
+        
+    except Exception as e:
+        print(f"❌ Async status long-poll test failed: {e}")
+
+
+def test_status_publish_coalescing():
+    """Test that progress updates are coalesced while lifecycle changes publish at once."""
+    print("\nTesting status publish coalescing...")
+    
+    import time
+    from session_store import StatusPublisher
+    
+    class FakeStore:
+        def __init__(self):
+            self.published = []
+        def publish_flow_status(self, key, flow, status, process_pid=None):
+            self.published.append(dict(status))
+            return True
+    
+    class FakeFlow:
+        def get_process_pid(self):
+            return 123
+    
+    try:
+        store, flow = FakeStore(), FakeFlow()
+        publisher = StatusPublisher(store, "key", "decode_flow", interval=0.2)
+        publisher(flow, {"started": True, "finished": False, "error": None, "progress": 0})
+        for progress in range(1, 6):
+            publisher(flow, {"started": True, "finished": False, "error": None, "progress": progress})
+        assert [s["progress"] for s in store.published] == [0], f"Progress should be held back: {store.published}"
+        
+        time.sleep(0.35)
+        assert [s["progress"] for s in store.published] == [0, 5], f"Only the latest progress should be published: {store.published}"
+        
+        publisher(flow, {"started": True, "finished": False, "error": None, "progress": 6})
+        publisher(flow, {"started": True, "finished": True, "error": None, "progress": 100})
+        assert store.published[-1]["finished"], "A transition should be published at once"
+        time.sleep(0.35)
+        assert len(store.published) == 3, f"The transition should supersede held-back progress: {store.published}"
+        print("✅ Status publishes are coalesced between transitions")
+        
+    except Exception as e:
+        print(f"❌ Status publish coalescing test failed: {e}")
+
+
+def test_frozen_search_results():
+    """Test that frozen vector search results don't rescale stored timestamps."""
+    print("\nTesting frozen result snapshots...")
+    
+    try:
+        flow = VectorSearchFlow()
+        flow._process_log_line({"type": "vector_search_ended", "top_results": [{"timestamp": 7}]})
+        flow._freeze_result()
+        
+        body, etag = flow.get_frozen_response()
+        assert b'"timestamp":30.0' in body, f"Unexpected frozen body: {body}"
+        assert flow.get_frozen_response()[1] == etag, "ETag should be stable"
+        assert flow.get_results()[0]["top_results"][0]["timestamp"] == 7, "Stored results must not be mutated"
+        print("✅ Frozen results work correctly")
+        
+    except Exception as e:
+        print(f"❌ Frozen results test failed: {e}")
+
+
+def test_partial_search_results():
+    """Test that each query's results are published with their timing as they complete."""
+    print("\nTesting partial vector search results...")
+    
+    try:
+        flow = VectorSearchFlow()
+        flow.img_srcs = ["a.png", "b.png"]
+        flow.start_time = 100.0
+        flow._process_log_line({"type": "vector_search_ended", "top_results": [{"timestamp": 7}], "completed_at": 102.5})
+        
+        status = flow.get_status()
+        assert status["total_queries"] == 2 and len(status["results"]) == 1, status
+        first = status["results"][0]
+        assert first["query"] == 0 and first["elapsed_seconds"] == 2.5 and first["duration_seconds"] == 2.5, first
+        
+        flow._process_log_line({"type": "vector_search_ended", "top_results": [{"timestamp": 14}], "completed_at": 103.0})
+        second = flow.get_status()["results"][1:]
+        assert [r["query"] for r in second] == [1] and second[0]["duration_seconds"] == 0.5, second
+        
+        # Refinements are numbered in order, so pollers can skip those they have seen
+        flow._process_log_line({"type": "vector_search_refined", "query": 1, "rank": 0, "timestamp": 14.2, "similarity": 0.9})
+        flow._process_log_line({"type": "vector_search_refined", "query": 0, "rank": 0, "timestamp": 7.1, "similarity": 0.8})
+        hits = [item["top_results"][0] for item in flow.get_status()["results"]]
+        assert [hit["refined_seq"] for hit in hits] == [2, 1], hits
+        assert hits[0]["coarse_timestamp"] == 7 * flow.timestamp_scale and hits[0]["timestamp"] == 7.1, hits
+        
+        event = {"type": "vector_search_ended", "top_results": []}
+        flow._process_log_line(event)
+        assert "completed_at" in event, "Events should be stamped before they are journaled"
+        print("✅ Partial results carry their query index and timing")
+        
+    except Exception as e:
+        print(f"❌ Partial search results test failed: {e}")
+
+
+def test_event_channel_frames():
+    """Test event frames on the channel, mirrored output lines and damaged streams."""
+    print("\nTesting event channel frames...")
+    
+    import contextlib
+    import io
+    import json
+    import event_channel
+    
+    def read_all(data):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, data)
+        os.close(write_fd)
+        return list(event_channel.read_frames(read_fd))
+    
+    channel = (event_channel._channel, event_channel._channel_checked)
+    try:
+        first = {"type": "decode", "tree_name": "TreeA", "batch_index": 1, "total_batches": 4, "time": 2.5}
+        second = {"type": "decode_end", "end_time": 3.0}
+        frames = event_channel.encode_frame(first) + event_channel._pack(event_channel._JSON, json.dumps(second).encode())
+        assert read_all(frames) == [first, second], "Frames should decode to the events sent"
+        
+        # A writer killed mid-frame loses only its last event
+        partial = event_channel.encode_frame(second)
+        assert read_all(event_channel.encode_frame(first) + partial[:-3]) == [first]
+        assert read_all(event_channel.encode_frame(first) + partial[:3]) == [first]
+        
+        # A header announcing an oversized frame means the stream is corrupt
+        oversized = event_channel._HEADER.pack(event_channel.MAX_FRAME_BYTES + 1, event_channel._JSON)
+        try:
+            read_all(oversized + b"{}")
+            raise AssertionError("An oversized frame should be rejected")
+        except ValueError:
+            pass
+        
+        # emit() frames the event and mirrors the same JSON to stdout
+        read_fd, write_fd = os.pipe()
+        event_channel._channel, event_channel._channel_checked = os.fdopen(write_fd, "wb", buffering=0), True
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            event_channel.emit(first)
+        event_channel._channel.close()
+        assert list(event_channel.read_frames(read_fd)) == [first]
+        line = output.getvalue().strip()
+        assert line.startswith(event_channel.MIRROR_PREFIX), line
+        assert json.loads(line[len(event_channel.MIRROR_PREFIX):]) == first
+        
+        # While the channel is read, only lines it didn't carry are dispatched
+        flow = DecodeFlow()
+        flow._consume_output([line, json.dumps(second), "Loading model..."], skip_mirrored=True)
+        assert flow._logs == [second], flow._logs
+        flow = DecodeFlow()
+        flow._consume_output([line, json.dumps(second)])
+        assert flow._logs == [first, second], "Adopted output should replay the mirrored events"
+        print("✅ Event frames, mirrored lines and damaged streams are handled")
+        
+    except Exception as e:
+        print(f"❌ Event channel test failed: {e}")
+    finally:
+        event_channel._channel, event_channel._channel_checked = channel
+
+def test_event_schema_validation():
+    """Test the output line prefilter and that only events matching their schema are dispatched."""
+    print("\nTesting event schema validation...")
+    
+    from event_schemas import decode_event, validate_event
+    
+    try:
+        # Lines that can't be a JSON object are rejected before parsing
+        for line in ["", "Loading model...", "[1, 2]", '{"type": "decode"', '"type": "decode"}', "{not json}", "{}extra"]:
+            assert decode_event(line) is None, f"{line!r} should not decode"
+        assert decode_event('{"type": "decode", "time": 1.0}') == {"type": "decode", "time": 1.0}
+        
+        assert validate_event({"type": "vector_search_refined", "query": 0, "timestamp": 1.5}) == \
+            "vector_search_refined event without rank"
+        assert validate_event({"type": "encode"}) is None, "Optional keys may be missing"
+        assert validate_event({"type": "progress_bar"}) is None, "Unknown types have no schema"
+        
+        flow = VectorSearchFlow()
+        flow._dispatch_event({"type": "vector_search_refined", "query": 0, "timestamp": 1.5})
+        assert not flow._logs and not flow._refined, "A malformed event should be dropped before its handler"
+        flow._dispatch_event({"type": "vector_search_refined", "query": 0, "rank": 1, "timestamp": 1.5})
+        assert flow._refined[(0, 1)]["timestamp"] == 1.5
+        # Unknown types are kept in the log without a handler
+        flow._dispatch_event({"type": "progress_bar", "percent": 40})
+        assert flow._logs[-1] == {"type": "progress_bar", "percent": 40}, flow._logs
+        
+        # A decode event without its time would fail the handler, and with it the flow
+        decode_flow = DecodeFlow()
+        decode_flow._dispatch_event({"type": "decode", "tree_name": "TreeA", "batch_index": 1, "total_batches": 4})
+        assert not decode_flow._logs and decode_flow.total_batches != 4, "A decode event without time should be dropped"
+        print("✅ Events are prefiltered and checked against their schema")
+        
+    except Exception as e:
+        print(f"❌ Event schema validation test failed: {e}")
+
+def test_janitor_eviction_order():
+    """Test that the janitor evicts derived encodes before uploads and skips busy videos."""
+    print("\nTesting janitor disk garbage collection...")
+    
+    import tempfile
+    from janitor import Janitor
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = Path(tmp)
+            (data_dir / "lot" / "decoded").mkdir(parents=True)
+            (data_dir / "lot" / "lot.mkv").write_bytes(b"0" * 1000)
+            (data_dir / "lot" / "decoded" / "TreeA_0.ts").write_bytes(b"0" * 3000)
+            (data_dir / "lot_h264.mp4").write_bytes(b"0" * 2000)
+            (data_dir / "snow").mkdir()
+            (data_dir / "snow" / "snow_h264.mp4").write_bytes(b"0" * 4000)
+            
+            janitor = Janitor(
+                data_dir,
+                list_idle_sessions=lambda idle_since: [],
+                evict_session=lambda key: True,
+                list_video_sessions=lambda video: [],
+                busy_videos=lambda: {"snow"},
+                session_ttl=3600,
+                disk_budget_bytes=6000,
+                min_age=0,
+            )
+            janitor.run_once()
+            
+            assert (data_dir / "lot" / "lot.mkv").exists(), "Uploads should be evicted last"
+            assert (data_dir / "snow" / "snow_h264.mp4").exists(), "Busy videos must not be touched"
+            assert not (data_dir / "lot_h264.mp4").exists(), "Derived encodes should be evicted first"
+            assert janitor.get_stats()["bytes_reclaimed_total"] == 5000
+        print("✅ Janitor evicts in the right order")
+        
+    except Exception as e:
+        print(f"❌ Janitor test failed: {e}")
+
+
+def test_process_reaper():
+    """Test that the reaper kills processes left in the session of a finished flow."""
+    print("\nTesting process reaper...")
+    
+    import subprocess
+    import time
+    from process_tree import ProcessReaper, track_session, list_session_processes
+    
+    try:
+        process = subprocess.Popen(["sh", "-c", "sleep 60 & sleep 60"], start_new_session=True)
+        track_session(process.pid, "TestFlow", active=False, not_before=time.time() - 1)
+        time.sleep(0.2)
+        
+        reaper = ProcessReaper()
+        reaped = reaper.reap_once()
+        process.wait()
+        
+        assert len(reaped) == 3, f"Expected the shell and both sleeps, got {len(reaped)}"
+        assert not list_session_processes(process.pid), "Reaped session should be empty"
+        assert reaper.get_stats()["reaped_processes"] == 3
+        print("✅ Process reaper kills leaked process trees")
+        
+    except Exception as e:
+        print(f"❌ Process reaper test failed: {e}")
+
+
+def test_proc_resource_accounting():
+    """Test /proc stat parsing and that a process tree's CPU time includes children that already exited."""
+    print("\nTesting /proc resource accounting...")
+    
+    import io
+    import subprocess
+    import sys
+    import time
+    import process_tree
+    from process_tree import ResourceMonitor, read_proc_stat
+    
+    try:
+        # comm may itself contain ") " and spaces; fields start after the last ")"
+        ticks, page = process_tree._CLOCK_TICKS, process_tree._PAGE_SIZE
+        fields = ["S", 1, 4240, 4240, 0, -1, 0, 0, 0, 0, 0, 3 * ticks, ticks, 2 * ticks, 0, 20, 0, 1, 0, 5 * ticks, 0, 25]
+        stat = "4242 (evil) R 1 (x) " + " ".join(map(str, fields)) + "\n"
+        process_tree.open = lambda path: io.StringIO(stat)
+        try:
+            parsed = read_proc_stat(4242)
+        finally:
+            del process_tree.open
+        assert parsed["comm"] == "evil) R 1 (x" and parsed["state"] == "S", parsed
+        assert (parsed["ppid"], parsed["pgrp"], parsed["session"]) == (1, 4240, 4240), parsed
+        assert (parsed["cpu_user_seconds"], parsed["cpu_system_seconds"], parsed["cpu_seconds"]) == (3, 1, 4), parsed
+        assert parsed["children_cpu_user_seconds"] == 2 and parsed["rss_bytes"] == 25 * page, parsed
+        assert parsed["started_at"] == process_tree._BOOT_TIME + 5, parsed
+        assert read_proc_stat(2 ** 22 + 1) is None, "A missing process has no stat"
+        
+        # The child burns CPU and exits between samples; the leader waited for it
+        burn = "import time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass"
+        process = subprocess.Popen(
+            ["sh", "-c", f'"{sys.executable}" -c "$0"; sleep 0.5', burn], start_new_session=True
+        )
+        monitor = ResourceMonitor(process.pid, not_before=time.time() - 1)
+        monitor.sample()
+        time.sleep(0.6)
+        monitor.stop()
+        process.wait()
+        usage = monitor.get_usage()
+        assert usage["cpu_user_s"] + usage["cpu_system_s"] >= 0.25, f"Exited child's CPU time is missing: {usage}"
+        assert usage["samples"] == 2 and usage["processes"] >= 1, usage
+        print("✅ /proc stats are parsed and exited children are accounted")
+        
+    except Exception as e:
+        print(f"❌ /proc resource accounting test failed: {e}")
+
+def test_spawn_resource_profile():
+    """Test that a flow process gets its cores, thread caps, nice level and rlimits at spawn."""
+    print("\nTesting spawn resource profile...")
+    
+    import resource
+    import process_tree
+    from process_tree import THREAD_ENV_VARS
+    
+    try:
+        flow = EncodeFlow()
+        limit = 8 * 1024 ** 3
+        flow.resource_profile = {"cpu_fraction": 0.01, "nice": 7, "max_address_space_bytes": limit}
+        with flow._create_process(["sleep", "30"]) as process:
+            cores = sorted(os.sched_getaffinity(process.pid))
+            assert cores == flow._cores and len(cores) == 1, f"Expected one assigned core, got {cores}"
+            assert process_tree._core_usage[cores[0]] >= 1, "The core should be reserved while the flow runs"
+            assert os.getpriority(os.PRIO_PROCESS, process.pid) >= 7, "The nice level should be applied"
+            assert resource.prlimit(process.pid, resource.RLIMIT_AS) == (limit, limit)
+            with open(f"/proc/{process.pid}/environ", "rb") as environ_file:
+                env = dict(item.split(b"=", 1) for item in environ_file.read().split(b"\0") if b"=" in item)
+            assert all(env[var.encode()] == b"1" for var in THREAD_ENV_VARS), "Thread pools should match the core count"
+            process.kill()
+        assert flow._cores is None and process_tree._core_usage[cores[0]] == 0, "Cores should be released after exit"
+        print("✅ Flow processes are pinned, capped and limited at spawn")
+        
+    except Exception as e:
+        print(f"❌ Spawn resource profile test failed: {e}")
+
+def test_process_identity():
+    """Test that a PID is only trusted while it belongs to the process that was recorded."""
+    print("\nTesting process identity checks...")
+    
+    import subprocess
+    from process_tree import process_start_time, is_same_process
+    
+    try:
+        process = subprocess.Popen(["sleep", "30"])
+        started_at = process_start_time(process.pid)
+        assert started_at is not None, "A live process should have a start time"
+        assert is_same_process(process.pid, started_at)
+        assert not is_same_process(process.pid, started_at - 60), "A reused PID should not match"
+        assert not is_same_process(process.pid, None), "A record without a start time should not match"
+        process.kill()
+        process.wait()
+        assert not is_same_process(process.pid, started_at), "An exited process should not match"
+        print("✅ Reused and exited PIDs are not mistaken for the recorded process")
+        
+    except Exception as e:
+        print(f"❌ Process identity test failed: {e}")
+
+
+def test_journal_replay_reused_pid():
+    """Test that a journaled run whose PID now belongs to another process is not adopted."""
+    print("\nTesting journal replay with a reused PID...")
+    
+    import json
+    import subprocess
+    import tempfile
+    import time
+    from process_tree import process_start_time, release_session
+    
+    stranger = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_path = Path(temp_dir) / "vector_search.journal"
+            journal_path.with_suffix(".log").write_text("")
+            started_at = process_start_time(stranger.pid)
+            records = [
+                {"event": "start", "time": time.time(), "args": ["video", ["a.png"]], "kwargs": {}},
+                # Recorded by a run that started earlier under the same PID
+                {"event": "process", "time": time.time(), "pid": stranger.pid,
+                 "process_started_at": started_at - 60, "log_path": str(journal_path.with_suffix(".log"))},
+            ]
+            journal_path.write_text("".join(json.dumps(record) + "\n" for record in records))
+            
+            flow = VectorSearchFlow()
+            flow.enable_journal(journal_path)
+            assert flow.replay_journal(), "The journal should be replayed"
+            assert flow.is_finished() and "interrupted" in str(flow.get_error()), "The run should be recorded as interrupted"
+            assert flow.get_process_pid() is None, "A reused PID must not be adopted"
+            flow.reset()
+            assert stranger.poll() is None, "Resetting the flow must not signal the unrelated process"
+        print("✅ Runs whose PID was reused are recorded as interrupted")
+        
+    except Exception as e:
+        print(f"❌ Journal replay reused PID test failed: {e}")
+    finally:
+        release_session(stranger.pid)
+        stranger.kill()
+        stranger.wait()
+
+
+def test_stopped_process_handling():
+    """Test that stopped process groups are continued on termination and don't time out while stopped."""
+    print("\nTesting stopped encoder handling...")
+    
+    import signal
+    import subprocess
+    import time
+    from process_tree import terminate_process_group
+    
+    try:
+        process = subprocess.Popen(["sleep", "30"], start_new_session=True)
+        os.killpg(process.pid, signal.SIGSTOP)
+        started = time.monotonic()
+        terminate_process_group(process.pid, grace=5.0)
+        process.wait()
+        assert process.returncode == -signal.SIGTERM, f"SIGTERM should end the stopped group, got {process.returncode}"
+        assert time.monotonic() - started < 2.0, "A stopped group shouldn't need the SIGKILL fallback"
+        
+        flow = EncodeFlow()
+        flow.timeout = 1.0
+        start_time = time.time() - 0.8
+        flow.pause_timeout()
+        time.sleep(0.4)
+        assert not flow._timed_out(start_time), "Time spent paused must not count towards the timeout"
+        flow.resume_timeout()
+        assert not flow._timed_out(start_time)
+        time.sleep(0.3)
+        assert flow._timed_out(start_time), "The timeout should run again once resumed"
+        print("✅ Stopped encoders are continued on termination and their timeout is paused")
+        
+    except Exception as e:
+        print(f"❌ Stopped encoder handling test failed: {e}")
+
+
+def test_speculative_scheduler():
+    """Test that speculative jobs wait for interactive work and stop on cancel."""
+    print("\nTesting speculative scheduler...")
+    
+    import threading
+    import time
+    from speculative import SpeculativeScheduler
+    
+    try:
+        busy = threading.Event()
+        ran = []
+        scheduler = SpeculativeScheduler(is_busy=busy.is_set, poll_interval=0.05)
+        scheduler.register("probe", lambda ctx, filename: ran.append(filename))
+        scheduler.register("index", lambda ctx, filename: ctx.run(["sleep", "30"]))
+        scheduler.start()
+        
+        busy.set()
+        scheduler.schedule("key", "video")
+        time.sleep(0.3)
+        assert not ran, "No job should start while interactive flows run"
+        
+        busy.clear()
+        time.sleep(0.3)
+        assert ran == ["video"]
+        assert scheduler.get_status("key")["index"]["state"] == "running"
+        
+        scheduler.cancel("key")
+        time.sleep(0.5)
+        stats = scheduler.get_stats()
+        assert stats["cancelled"] == 1 and not stats["running"], f"Unexpected stats {stats}"
+        scheduler.stop()
+        print("✅ Speculative scheduler yields and cancels")
+        
+    except Exception as e:
+        print(f"❌ Speculative scheduler test failed: {e}")
+
+
+def test_psnr_process_video_cancel():
+    """Test that a cancelled speculative encode stops its ffmpeg processes and stays cancelled."""
+    print("\nTesting PSNR encode cancellation...")
+    
+    import tempfile
+    import time
+    import types
+    import PSNRCalc
+    from speculative import JobCancelled
+    
+    originals = (PSNRCalc.shutil, PSNRCalc._is_valid_video_file, PSNRCalc._check_encoder_support, PSNRCalc._process_one_codec_adaptive)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            video = Path(temp_dir) / "video.mp4"
+            video.write_bytes(b"video")
+            
+            def encode(codec, input_path, base_path, available_encoders):
+                # h264 finishes at once, the other encodes would run for a minute
+                seconds = "0" if codec == "h264" else "60"
+                PSNRCalc._run_ffmpeg_command(["sleep", seconds], f"{codec} encode")
+                return {"path": codec, "psnr": 40.0}
+            def cancel(progress):
+                raise JobCancelled("superseded")
+            PSNRCalc.shutil = types.SimpleNamespace(which=lambda name: name)
+            PSNRCalc._is_valid_video_file = lambda path: True
+            PSNRCalc._check_encoder_support = lambda: {"libx264": True, "libx265": True, "libsvtav1": True}
+            PSNRCalc._process_one_codec_adaptive = encode
+            
+            started = time.time()
+            try:
+                PSNRCalc.process_video(str(video), temp_dir, progress_callback=cancel)
+                raise AssertionError("process_video should raise the callback's exception")
+            except JobCancelled:
+                pass
+            assert time.time() - started < 10, "process_video should not wait for the cancelled encodes"
+        print("✅ Cancelled encodes are killed and JobCancelled reaches the caller")
+        
+    except Exception as e:
+        print(f"❌ PSNR encode cancellation test failed: {e}")
+    finally:
+        PSNRCalc.shutil, PSNRCalc._is_valid_video_file, PSNRCalc._check_encoder_support, PSNRCalc._process_one_codec_adaptive = originals
+
+def test_single_flight_sharing():
+    """Test that waiters and progress of a running job are visible to every worker and released."""
+    print("\nTesting single-flight job sharing...")
+    
+    import tempfile
+    import threading
+    import time
+    from single_flight import SingleFlight
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            flights = SingleFlight(Path(temp_dir))
+            # A second instance on the same directory stands in for another worker
+            other_worker = SingleFlight(Path(temp_dir))
+            release = threading.Event()
+            def job(progress):
+                progress({"completed": 1, "total": 3})
+                release.wait(5)
+                return {"done": True}
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(flights.do(("job",), job))) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            
+            expected = {"waiters": 2, "completed": 1, "total": 3}
+            deadline = time.time() + 5
+            while other_worker.get_progress(("job",)) != expected and time.time() < deadline:
+                time.sleep(0.05)
+            progress = other_worker.get_progress(("job",))
+            release.set()
+            assert progress == expected, progress
+            
+            release.set()
+            for thread in threads:
+                thread.join(5)
+            assert results == [{"done": True}] * 2, results
+            assert flights.get_progress(("job",)) is None, "A finished job should have no waiters left"
+            
+            def failing(progress):
+                raise RuntimeError("encode failed")
+            try:
+                flights.do(("failing",), failing)
+            except RuntimeError:
+                pass
+            assert flights.get_progress(("failing",)) is None, "A failed job should release its waiter"
+        print("✅ Single-flight waiters and progress are shared and released")
+        
+    except Exception as e:
+        print(f"❌ Single-flight sharing test failed: {e}")
+
+def test_decoded_quality_aggregate():
+    """Test playlist parsing, segment placement and the MSE-weighted PSNR aggregate of decoded segments."""
+    print("\nTesting decoded quality aggregate...")
+    
+    import tempfile
+    import decoded_quality
+    from decoded_quality import DecodedQualityMonitor, parse_playlist, _psnr_to_mse
+    
+    originals = (decoded_quality.probe_video, decoded_quality.calculate_segment_quality)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            playlist = Path(temp_dir) / "TreeA_output.m3u8"
+            playlist.write_text("#EXTM3U\n#EXTINF:2.000000,\nseg0.ts\n#EXTINF:1.000000,\nseg1.ts\n")
+            segments, ended = parse_playlist(playlist)
+            assert segments == [("seg0.ts", 2.0), ("seg1.ts", 1.0)] and not ended
+            playlist.write_text(playlist.read_text() + "#EXT-X-ENDLIST\n")
+            assert parse_playlist(playlist)[1], "Playlist should be ended"
+        
+        summary = DecodedQualityMonitor._aggregate([
+            {"duration_s": 1.0, "psnr": 40.0, "ssim": 0.9, "mse": _psnr_to_mse(40.0)},
+            {"duration_s": 1.0, "psnr": 30.0, "ssim": 0.8, "mse": _psnr_to_mse(30.0)},
+            {"duration_s": 1.0, "psnr": None, "ssim": None, "error": "failed"},
+        ])
+        assert summary["segments"] == 2 and summary["min_psnr"] == 30.0
+        # Averaging MSE weights the worse segment more than averaging PSNR would
+        assert 32.5 < summary["psnr"] < 32.7, f"Unexpected aggregate {summary['psnr']}"
+        assert abs(summary["ssim"] - 0.85) < 1e-9
+        
+        # Segments are placed on the source timeline by their own timestamps
+        pts = {"seg0.ts": 1.4, "seg1.ts": 3.4, "seg2.ts": 5.45}
+        def probe(path):
+            if Path(path).name not in pts:
+                raise decoded_quality.PSNRError("Invalid data found when processing input")
+            return {"start_s": pts[Path(path).name]}
+        measured = []
+        def measure(path, source, start, duration, size):
+            measured.append((Path(path).name, round(start, 3)))
+            return {"psnr": 40.0, "ssim": 0.9}
+        decoded_quality.probe_video, decoded_quality.calculate_segment_quality = probe, measure
+        monitor = DecodedQualityMonitor(Path("."), "source.mp4", {"TreeA": "TreeA.m3u8"}, lambda summary: None, lambda: True)
+        for name in ["seg0.ts", "seg1.ts", "seg2.ts", "seg3.ts"]:
+            monitor._measure("TreeA", name, 2.0)
+        # seg3 can't be probed and follows seg2 by its playlist duration
+        assert measured == [("seg0.ts", 0.0), ("seg1.ts", 2.0), ("seg2.ts", 4.05), ("seg3.ts", 6.05)], measured
+        print("✅ Decoded quality aggregates segments by MSE")
+        
+    except Exception as e:
+        print(f"❌ Decoded quality test failed: {e}")
+    finally:
+        decoded_quality.probe_video, decoded_quality.calculate_segment_quality = originals
+
+
+def test_embedding_index_merge():
+    """Test that shard indexes merge into one ordered index and survive a save/load."""
+    print("\nTesting embedding index merge...")
+    
+    import tempfile
+    from embedding_index import EmbeddingIndex, merge_indexes
+    
+    try:
+        first = EmbeddingIndex(2)
+        for timestamp in [0.0, 5.0, 10.0]:
+            first.add(timestamp, [timestamp, 1.0])
+        second = EmbeddingIndex(2)
+        # The second shard also sampled the frame at its start boundary
+        for timestamp in [9.5, 10.0, 15.0]:
+            second.add(timestamp, [timestamp, 2.0])
+        
+        merged = merge_indexes([(second, 10.0, float("inf")), (first, 0.0, 10.0)], meta={"video_id": "lot"})
+        assert list(merged.timestamps) == [0.0, 5.0, 10.0, 15.0], f"Unexpected timestamps {list(merged.timestamps)}"
+        assert list(merged.vector(2)) == [10.0, 2.0], "Boundary frame should come from the shard that owns it"
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "index"
+            merged.save(path)
+            loaded = EmbeddingIndex.load(path)
+            assert len(loaded) == 4 and loaded.meta["video_id"] == "lot"
+            assert list(loaded.embeddings) == list(merged.embeddings)
+        print("✅ Embedding index shards merge in timestamp order")
+        
+    except Exception as e:
+        print(f"❌ Embedding index test failed: {e}")
+
+
+def test_segment_feed_follow():
+    """Test that decoded segments are fed to a following index flow as the decode writes them."""
+    print("\nTesting segment feed and index follow mode...")
+    
+    import json
+    import tempfile
+    from IndexFlow import IndexFlow
+    from segment_index import SegmentFeed
+    
+    class FakeDecode:
+        def __init__(self):
+            self.status = {"started": True, "finished": False, "error": None}
+            self.listeners = []
+        def add_status_listener(self, listener):
+            self.listeners.append(listener)
+        def remove_status_listener(self, listener):
+            self.listeners.remove(listener)
+        def get_status(self):
+            return dict(self.status)
+        def publish(self, **changes):
+            self.status.update(changes)
+            for listener in list(self.listeners):
+                listener(self, self.get_status())
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            playlist = Path(temp_dir) / "TreeA.m3u8"
+            def write_playlist(durations, ended=False):
+                lines = ["#EXTM3U"] + [f"#EXTINF:{d},\nTreeA_{i:03d}.ts" for i, d in enumerate(durations)]
+                playlist.write_text("\n".join(lines + (["#EXT-X-ENDLIST"] if ended else [])) + "\n")
+            def records(feed_path):
+                return [json.loads(line) for line in feed_path.read_text().splitlines()]
+            
+            decode = FakeDecode()
+            starts = []
+            feed = SegmentFeed(decode, "sample_1080p30", playlist, Path(temp_dir) / "feed.jsonl", lambda: starts.append(1))
+            feed.start()
+            assert records(feed.feed_path) == [] and not starts, "Nothing is fed before the first segment"
+            
+            write_playlist([2.0])
+            decode.publish()
+            write_playlist([2.0, 1.5])
+            decode.publish()
+            write_playlist([2.0, 1.5, 0.5], ended=True)
+            decode.publish(finished=True)
+            fed = records(feed.feed_path)
+            assert [(r["index"], r["start_s"], r["duration_s"]) for r in fed[:-1]] == [(0, 0.0, 2.0), (1, 2.0, 1.5), (2, 3.5, 0.5)], fed
+            assert fed[-1] == {"type": "end"} and starts == [1], "The indexer starts once and the feed ends with the decode"
+            assert feed.get_status() == {"published_segments": 3, "closed": True} and not decode.listeners
+            
+            # A decode that fails, or is cancelled, aborts the feed
+            for finish in ("error", "cancel"):
+                decode = FakeDecode()
+                write_playlist([2.0])
+                feed = SegmentFeed(decode, "sample_1080p30", playlist, Path(temp_dir) / f"{finish}.jsonl", lambda: None)
+                feed.start()
+                if finish == "error":
+                    decode.publish(finished=True, error="Decoder crashed")
+                else:
+                    feed.cancel()
+                    decode.publish()
+                fed = records(feed.feed_path)
+                assert [r["type"] for r in fed] == ["segment", "abort"], f"{finish}: {fed}"
+            
+            # The index flow follows the feed and counts the segments it embedded
+            flow = IndexFlow()
+            command = flow._build_command("sample_1080p30", follow=str(feed.feed_path))
+            assert command[-4:] == ["--index", str(IndexFlow.index_dir("sample_1080p30")), "--follow", str(feed.feed_path)], command
+            flow._dispatch_event({"type": "index_start", "start_time": 1.0})
+            for segment in fed[:-1]:
+                flow._dispatch_event({"type": "index_segment", "segment": segment["path"], "frames": 12})
+            flow._dispatch_event({"type": "index_end", "end_time": 2.0, "processed_frames": 12})
+            status = flow.get_status()
+            assert status["indexed_segments"] == 1 and status["processed_frames"] == 12, status
+            assert status["metadata"] == {"end_time": 2.0, "processed_frames": 12}, status
+        print("✅ Decoded segments are fed in order and the index flow follows them")
+        
+    except Exception as e:
+        print(f"❌ Segment feed test failed: {e}")
+
+def test_sharded_index_failure():
+    """Test that a failing shard stops the shards still running and queued."""
+    print("\nTesting sharded index failure...")
+    
+    import contextlib
+    import io
+    import subprocess
+    import tempfile
+    import time
+    import types
+    import sharded_index
+    
+    originals = (sharded_index.os, sharded_index.probe_video)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Two cores, so one shard runs beside the failing one and the third is queued
+            sharded_index.os = types.SimpleNamespace(**{**vars(os), "sched_getaffinity": lambda pid: {0, 1}})
+            sharded_index.probe_video = lambda video: {"duration_s": 90.0}
+            # Called with --index <dir> --range <start> <end>: the first shard fails, the others hang
+            command = ["sh", "-c", 'if [ "$4" = "0.000" ]; then sleep 0.5; exit 3; fi; exec sleep 31.5', "shard"]
+            started = time.time()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    sharded_index.build_sharded_index("video.mp4", Path(temp_dir) / "index", command, shards=3)
+                raise AssertionError("The failing shard should fail the build")
+            except RuntimeError as e:
+                assert "exited with code 3" in str(e), e
+            assert time.time() - started < 5, "The other shards should be killed, not waited for"
+            leftover = subprocess.run(["pgrep", "-f", "sleep 31.5"], capture_output=True, text=True).stdout.split()
+            assert not leftover, f"Shard processes left running: {leftover}"
+            assert not (Path(temp_dir) / "index").exists(), "A failed build must not leave an index"
+        print("✅ A failing shard stops the other shards")
+        
+    except Exception as e:
+        print(f"❌ Sharded index failure test failed: {e}")
+    finally:
+        sharded_index.os, sharded_index.probe_video = originals
+
+def test_adaptive_frame_sampling():
+    """Test that frame sampling follows content change."""
+    print("\nTesting adaptive frame sampling...")
+    
+    from frame_sampling import plan_samples
+    
+    try:
+        # A static second, a cut at 1.0s, then a busy stretch, at 10 fps
+        scores = [(i / 10, 0.0) for i in range(10)]
+        scores += [(1.0, 0.9)] + [(1.0 + i / 10, 0.12) for i in range(1, 10)]
+        samples = plan_samples(scores, min_interval_s=0.25, max_interval_s=4.0)
+        assert samples[:2] == [0.0, 1.0], f"Expected the first frame and the cut, got {samples}"
+        assert len(samples) >= 4, f"The busy stretch should be sampled densely, got {samples}"
+        assert all(b - a >= 0.25 for a, b in zip(samples, samples[1:])), "Samples closer than min_interval_s"
+        
+        static = plan_samples([(i / 10, 0.0) for i in range(100)], max_interval_s=4.0)
+        assert static == [0.0, 4.0, 8.0], f"Static video should be sampled every max_interval_s, got {static}"
+        print("✅ Frame sampling follows content change")
+        
+    except Exception as e:
+        print(f"❌ Adaptive frame sampling test failed: {e}")
+
+def test_temporal_refinement():
+    """Test that a search hit moves to the best matching frame of its window."""
+    print("\nTesting temporal refinement...")
+    
+    import temporal_refinement
+    
+    original = temporal_refinement.frame_similarity
+    try:
+        # The screenshot shows the frame at 10.4s; the index sampled 10.0s
+        def frame_similarity(video_path, image_path, start_s, duration_s):
+            frames = [round(start_s + n / 10, 3) for n in range(int(duration_s * 10))]
+            return [(t, 1.0 - abs(t - 10.4)) for t in frames]
+        temporal_refinement.frame_similarity = frame_similarity
+        
+        refined = temporal_refinement.refine_hit("lot.mkv", "shot.png", 10.0, window_s=1.0)
+        assert refined["timestamp"] == 10.4, f"Expected 10.4s, got {refined}"
+        assert refined["frames_compared"] == 20
+        # Windows near the start are clipped to the video
+        assert temporal_refinement.refine_hit("lot.mkv", "shot.png", 0.5, window_s=1.0)["frames_compared"] == 15
+        print("✅ Search hits refine to the matching frame")
+        
+    except Exception as e:
+        print(f"❌ Temporal refinement test failed: {e}")
+    finally:
+        temporal_refinement.frame_similarity = original
+
+def test_quantized_index_search():
+    """Test that quantized indexes find the same best frame as the float index."""
+    print("\nTesting quantized index search...")
+    
+    import random
+    import tempfile
+    import quantized_index
+    from embedding_index import EmbeddingIndex
+    
+    if quantized_index.np is None:
+        print("⚠️  numpy is not installed; quantized index search not tested")
+        return
+    
+    try:
+        rng = random.Random(0)
+        index = EmbeddingIndex(16)
+        for i in range(300):
+            index.add(float(i), [rng.gauss(0, 1) for _ in range(16)])
+        query = list(index.vector(123))
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "index"
+            index.save(path)
+            for method in quantized_index.QUANTIZATION_METHODS:
+                quantized = quantized_index.quantize_index(path, method, centroids=32)
+                assert quantized.nbytes < len(index.embeddings) * 4, f"{method} codes are not smaller than the floats"
+                best_timestamp, best_score = quantized.search(query, k=3)[0]
+                assert best_timestamp == 123.0, f"{method} found {best_timestamp} instead of 123.0"
+                exact = sum(value * value for value in query)
+                assert abs(best_score - exact) < 1e-3, "Re-ranked scores should be exact"
+        print("✅ Quantized indexes find the best frame with exact scores")
+        
+    except Exception as e:
+        print(f"❌ Quantized index test failed: {e}")
+
+def test_cross_video_merge():
+    """Test that per-video hits merge into a global top-k tagged with video IDs."""
+    print("\nTesting cross-video result merge...")
+    
+    from cross_video_search import merge_hits
+    
+    try:
+        per_video = {
+            "snow_road": [[(12.0, 0.91), (40.0, 0.55)], [(3.0, 0.20)]],
+            "lot": [[(7.5, 0.62)], [(88.0, 0.97), (90.0, 0.35)]],
+        }
+        merged = merge_hits(per_video, 2, k=2)
+        assert [(hit["video_id"], hit["timestamp"]) for hit in merged[0]] == [("snow_road", 12.0), ("lot", 7.5)]
+        assert [(hit["video_id"], hit["timestamp"]) for hit in merged[1]] == [("lot", 88.0), ("lot", 90.0)]
+        print("✅ Cross-video hits merge into a global top-k")
+        
+    except Exception as e:
+        print(f"❌ Cross-video merge test failed: {e}")
+
+def test_query_embedding_cache():
+    """Test that repeated and near-duplicate screenshots are not embedded again."""
+    print("\nTesting query embedding cache...")
+    
+    import tempfile
+    import query_cache
+    
+    original = query_cache.perceptual_hash
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = Path(temp_dir)
+            images = {}
+            for name, content in [("a.png", b"a"), ("b.png", b"b"), ("a_resaved.png", b"a2")]:
+                images[name] = str(temp_path / name)
+                Path(images[name]).write_bytes(content)
+            # The re-saved copy differs from the original in two hash bits
+            hashes = {images["a.png"]: 0b1010, images["b.png"]: 0xFFFF0000, images["a_resaved.png"]: 0b1001}
+            query_cache.perceptual_hash = lambda path: hashes[path]
+            
+            calls = []
+            def embed_missing(paths):
+                calls.append([Path(path).name for path in paths])
+                return [[float(len(calls)), float(i)] for i in range(len(paths))]
+            
+            cache = query_cache.QueryEmbeddingCache(temp_path / "cache", model="test")
+            first, stats = cache.embed([images["a.png"], images["b.png"], images["a.png"]], embed_missing)
+            assert calls == [["a.png", "b.png"]], f"Expected one batch of distinct images, got {calls}"
+            assert first[0] == first[2] and stats["embedded"] == 2
+            
+            again = query_cache.QueryEmbeddingCache(temp_path / "cache", model="test")
+            second, stats = again.embed([images["b.png"], images["a_resaved.png"]], embed_missing)
+            assert len(calls) == 1, f"Cached images were embedded again: {calls}"
+            assert second == [first[1], first[0]] and stats == {"hits": 1, "near_duplicates": 1, "embedded": 0}
+        print("✅ Query embeddings are reused across searches and near-duplicates")
+        
+    except Exception as e:
+        print(f"❌ Query embedding cache test failed: {e}")
+    finally:
+        query_cache.perceptual_hash = original
+
+def test_screenshot_ingestion():
+    """Test that screenshots uploaded together are normalized and embedded in one batch."""
+    print("\nTesting screenshot ingestion...")
+    
+    import shutil
+    import tempfile
+    import time
+    import query_cache
+    import screenshot_ingest
+    
+    originals = (screenshot_ingest.normalize_image, screenshot_ingest.embed_queries, query_cache.perceptual_hash)
+    ingestor = None
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = Path(temp_dir)
+            images = []
+            for name in ["a.png", "b.png", "c.png", "broken.png"]:
+                images.append(str(temp_path / name))
+                Path(images[-1]).write_bytes(name.encode())
+            
+            def normalize(image_path, output_path, short_side):
+                if "broken" in image_path:
+                    raise screenshot_ingest.PSNRError("Invalid data found when processing input")
+                shutil.copyfile(image_path, output_path)
+            batches = []
+            def embed(command, paths):
+                batches.append([Path(path).read_bytes() for path in paths])
+                return [[float(i), 1.0] for i in range(len(paths))]
+            screenshot_ingest.normalize_image = normalize
+            screenshot_ingest.embed_queries = embed
+            query_cache.perceptual_hash = lambda path: None
+            
+            ingestor = screenshot_ingest.ScreenshotIngestor(temp_path / "cache", ["embed"], batch_window_s=0.3)
+            ingestor.start()
+            for image in images:
+                ingestor.submit("key", image)
+            deadline = time.time() + 5
+            while ingestor.get_status("key")["pending"] and time.time() < deadline:
+                time.sleep(0.05)
+            
+            states = {Path(path).name: info["state"] for path, info in ingestor.get_status("key")["images"].items()}
+            assert states == {"a.png": "embedded", "b.png": "embedded", "c.png": "embedded", "broken.png": "failed"}, states
+            assert len(batches) == 1 and sorted(batches[0]) == [b"a.png", b"b.png", b"c.png"], f"Expected one batch, got {batches}"
+            assert ingestor.is_ingested("key", images[:3]) and not ingestor.is_ingested("key", images)
+            
+            # A search on the uploaded images finds them all cached
+            cache = query_cache.QueryEmbeddingCache(temp_path / "cache", model="embed")
+            _, stats = cache.embed(images[:3], lambda paths: [])
+            assert stats == {"hits": 3, "near_duplicates": 0, "embedded": 0}, stats
+        print("✅ Uploaded screenshots are embedded in one batch before the search")
+        
+    except Exception as e:
+        print(f"❌ Screenshot ingestion test failed: {e}")
+    finally:
+        if ingestor:
+            ingestor.stop()
+        screenshot_ingest.normalize_image, screenshot_ingest.embed_queries, query_cache.perceptual_hash = originals
+
+def test_keyframe_index_seek():
+    """Test that keyframes are read from a packet scan and seeks map to their GOP."""
+    print("\nTesting keyframe index...")
+    
+    try:
+        from PSNRCalc import _parse_keyframe_packets
+        from keyframe_index import keyframe_at, gop_byte_range
+        
+        # Decode order with B-frames: the second keyframe is shown after frames decoded later
+        output = "\n".join([
+            "pts_time=0.000000|dts_time=-0.080000|pos=48|flags=K__",
+            "pts_time=0.080000|dts_time=-0.040000|pos=900|flags=___",
+            "pts_time=0.040000|dts_time=0.000000|pos=1200|flags=___",
+            "pts_time=2.000000|dts_time=0.040000|pos=5000|flags=K__",
+            "pts_time=N/A|dts_time=0.080000|pos=N/A|flags=K__",
+            "pts_time=2.040000|dts_time=0.120000|pos=6100|flags=___",
+            "pts_time=4.000000|dts_time=0.160000|pos=N/A|flags=K__",
+        ])
+        keyframes = _parse_keyframe_packets(output)
+        assert keyframes == [
+            {"timestamp": 0.0, "pos": 48, "frame": 0},
+            {"timestamp": 2.0, "pos": 5000, "frame": 4},
+        ], f"Unexpected keyframes: {keyframes}"
+        
+        assert keyframe_at(keyframes, 1.99) == 0 and keyframe_at(keyframes, 2.0) == 1
+        assert gop_byte_range(keyframes, 1.0, 8000) == (48, 4999)
+        assert gop_byte_range(keyframes, 3.5, 8000) == (5000, 7999)
+        assert gop_byte_range([{"timestamp": 1.0, "pos": 0, "frame": 0}], 0.5, 8000) is None
+        print("✅ Seeks map to the byte range of their GOP")
+        
+    except Exception as e:
+        print(f"❌ Keyframe index test failed: {e}")
+
 def test_psnr_calc_validation():
     """Test PSNRCalc validation."""
     print("\nTesting PSNRCalc validation...")
@@ -156,6 +1217,34 @@ def main():
         test_flow_initialization()
         test_flow_error_handling()
         test_flow_state_management()
+        test_flow_status_delta()
+        test_async_status_wait()
+        test_status_publish_coalescing()
+        test_frozen_search_results()
+        test_partial_search_results()
+        test_event_channel_frames()
+        test_event_schema_validation()
+        test_janitor_eviction_order()
+        test_process_reaper()
+        test_proc_resource_accounting()
+        test_spawn_resource_profile()
+        test_process_identity()
+        test_journal_replay_reused_pid()
+        test_stopped_process_handling()
+        test_speculative_scheduler()
+        test_psnr_process_video_cancel()
+        test_single_flight_sharing()
+        test_decoded_quality_aggregate()
+        test_embedding_index_merge()
+        test_segment_feed_follow()
+        test_sharded_index_failure()
+        test_adaptive_frame_sampling()
+        test_temporal_refinement()
+        test_quantized_index_search()
+        test_cross_video_merge()
+        test_query_embedding_cache()
+        test_screenshot_ingestion()
+        test_keyframe_index_seek()
         test_psnr_calc_validation()
         
         print("\n✅ All tests completed successfully!")